@@ -0,0 +1,55 @@
+'''Time the validation of a dataset dict against default_package_schema.
+
+Usage:
+    python bin/benchmark_navl.py [CONFIG_FILE] [ITERATIONS]
+
+The config file defaults to development.ini. Run it before and after a
+change to ckan.lib.navl to compare the timings.
+'''
+import os
+import sys
+import time
+
+import loadconfig
+path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else 'development.ini')
+loadconfig.load_config(path)
+
+import ckan.model as model
+import ckan.logic.schema as schema
+import ckan.lib.navl.dictization_functions as df
+
+iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+package = {
+    'name': u'benchmark-dataset',
+    'title': u'Benchmark dataset',
+    'notes': u'A dataset used to time validation.',
+    'url': u'http://www.example.com/',
+    'resources': [{'url': u'http://www.example.com/data-%i.csv' % i,
+                   'format': u'CSV',
+                   'description': u'Resource %i' % i} for i in range(20)],
+    'tags': [{'name': u'tag-%i' % i} for i in range(10)],
+    'extras': [{'key': u'key-%i' % i, 'value': u'value %i' % i}
+               for i in range(10)],
+}
+
+def context():
+    return {'model': model, 'session': model.Session, 'user': u''}
+
+def run(make_schema):
+    start = time.time()
+    for i in range(iterations):
+        df.validate(package, make_schema(), context())
+    return (time.time() - start) / iterations * 1000
+
+data, errors = df.validate(package, schema.default_package_schema(), context())
+assert not errors, errors
+
+# A new schema for every call, as the logic actions do.
+print 'new schema per call:    %.2f ms per validation' % run(
+    schema.default_package_schema)
+
+# The same schema compiled once and reused for every call.
+package_schema = df.compile_schema(schema.default_package_schema())
+print 'schema reused:          %.2f ms per validation' % run(
+    lambda: package_schema)
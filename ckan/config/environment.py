@@ -132,9 +132,10 @@ def load_environment(global_conf, app_conf):
     # load all CKAN plugins
     p.load_all(config)
 
-    # Load the synchronous search plugin, unless already loaded or
-    # explicitly disabled
+    # Load the synchronous search plugin, unless already loaded, replaced
+    # by the asynchronous one or explicitly disabled
     if not 'synchronous_search' in config.get('ckan.plugins',[]) and \
+            not 'asynchronous_search' in config.get('ckan.plugins',[]) and \
             asbool(config.get('ckan.search.automatic_indexing', True)):
         log.debug('Loading the synchronous search plugin')
         p.load('synchronous_search')
@@ -295,9 +296,20 @@ def load_environment(global_conf, app_conf):
     #################################################################
 
 
+    # Share the compiled templates between processes if a cache directory
+    # is configured.
+    jinja2_cache_dir = config.get('ckan.jinja2_cache_dir')
+    if jinja2_cache_dir:
+        bytecode_cache = lib.jinja_extensions.CkanFileSystemBytecodeCache(
+            jinja2_cache_dir, template_paths)
+    else:
+        bytecode_cache = None
+
     # Create Jinja2 environment
     env = lib.jinja_extensions.Environment(
         loader=lib.jinja_extensions.CkanFileSystemLoader(template_paths),
+        bytecode_cache=bytecode_cache,
+        auto_reload=asbool(config.get('ckan.jinja2_auto_reload', True)),
         autoescape=True,
         extensions=['jinja2.ext.do', 'jinja2.ext.with_',
                     lib.jinja_extensions.SnippetExtension,
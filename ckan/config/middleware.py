@@ -25,6 +25,7 @@ from ckan.lib.i18n import get_locales_from_config
 
 from ckan.config.environment import load_environment
 import ckan.lib.app_globals as app_globals
+import ckan.lib.page_cache as page_cache
 
 
 def make_app(global_conf, full_stack=True, static_files=True, **app_conf):
@@ -219,7 +220,8 @@ class PageCacheMiddleware(object):
     200, use the GET method. Only non-logged in users receive cached
     pages.
     Cachable pages are indicated by a environ CKAN_PAGE_CACHABLE
-    variable.'''
+    variable. Pages are stored with the dependency tags in the
+    CKAN_PAGE_CACHE_TAGS environ variable, see ckan.lib.page_cache.'''
 
     def __init__(self, app, config):
         self.app = app
@@ -303,12 +305,15 @@ class PageCacheMiddleware(object):
         if cachable:
             # Make sure we consume any file handles etc.
             page_string = ''.join(list(page))
-            # Use a pipe to add page in a transaction.
-            pipe = self.redis_connection.pipeline()
-            pipe.rpush(key, environ['CKAN_PAGE_STATUS'])
-            pipe.rpush(key, json.dumps(environ['CKAN_PAGE_HEADERS']))
-            pipe.rpush(key, page_string)
-            pipe.execute()
+            try:
+                page_cache.store(self.redis_connection, key,
+                                 environ['CKAN_PAGE_STATUS'],
+                                 json.dumps(environ['CKAN_PAGE_HEADERS']),
+                                 page_string,
+                                 environ.get(page_cache.ENVIRON_KEY))
+            except self.redis_exception:
+                self.redis_connection = None
+            page = [page_string]
         return page
 
 
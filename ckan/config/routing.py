@@ -70,6 +70,7 @@ def make_map():
     with SubMapper(map, controller='api', path_prefix='/api{ver:/3|}', ver='/3') as m:
         m.connect('/action/{logic_function}', action='action',
                   conditions=GET_POST)
+        m.connect('/batch', action='batch', conditions=POST)
 
     # /api ver 1, 2, 3 or none
     with SubMapper(map, controller='api', path_prefix='/api{ver:/1|/2|/3|}', ver='/1') as m:
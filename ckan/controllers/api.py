@@ -3,10 +3,12 @@ import logging
 import cgi
 import datetime
 import glob
+import itertools
 
-from pylons import c, request, response
+from pylons import c, request, response, config
 from pylons.i18n import _, gettext
 from paste.util.multidict import MultiDict
+from paste.deploy.converters import asbool
 from webob.multidict import UnicodeMultiDict
 
 import ckan.rating
@@ -36,6 +38,8 @@ CONTENT_TYPES = {
     'html': 'text/html;charset=utf-8',
     'json': 'application/json;charset=utf-8',
 }
+# size of the pieces streamed JSON responses are written in
+JSON_CHUNK_SIZE = 64 * 1024
 
 
 class ApiController(base.BaseController):
@@ -70,9 +74,13 @@ class ApiController(base.BaseController):
         return base.BaseController.__call__(self, environ, start_response)
 
     def _finish(self, status_int, response_data=None,
-                content_type='text'):
+                content_type='text', stream=False):
         '''When a controller method has completed, call this method
         to prepare the response.
+        @param stream - if True and the result of the JSON response is a
+           list, its items are encoded one at a time and the response is
+           written out in pieces of about JSON_CHUNK_SIZE bytes instead of
+           as one big string.
         @return response message - return this value from the controller
                                    method
                  e.g. return self._finish(404, 'Package not found')
@@ -82,7 +90,9 @@ class ApiController(base.BaseController):
         response_msg = ''
         if response_data is not None:
             response.headers['Content-Type'] = CONTENT_TYPES[content_type]
-            if content_type == 'json':
+            if content_type == 'json' and stream:
+                response_msg = self._json_chunks(response_data)
+            elif content_type == 'json':
                 response_msg = h.json.dumps(response_data)
             else:
                 response_msg = response_data
@@ -97,11 +107,13 @@ class ApiController(base.BaseController):
 
     def _finish_ok(self, response_data=None,
                    content_type='json',
-                   resource_location=None):
+                   resource_location=None,
+                   stream=False):
         '''If a controller method has completed successfully then
         calling this method will prepare the response.
         @param resource_location - specify this if a new
            resource has just been created.
+        @param stream - see _finish
         @return response message - return this value from the controller
                                    method
                                    e.g. return self._finish_ok(pkg_dict)
@@ -112,7 +124,7 @@ class ApiController(base.BaseController):
         else:
             status_int = 200
 
-        return self._finish(status_int, response_data, content_type)
+        return self._finish(status_int, response_data, content_type, stream)
 
     def _finish_not_authz(self):
         response_data = _('Access denied')
@@ -131,7 +143,42 @@ class ApiController(base.BaseController):
         return self._finish(400, response_data, 'json')
 
     def _wrap_jsonp(self, callback, response_msg):
-        return '%s(%s);' % (callback, response_msg)
+        if isinstance(response_msg, basestring):
+            return '%s(%s);' % (callback, response_msg)
+        return itertools.chain(['%s(' % callback], response_msg, [');'])
+
+    def _json_chunks(self, response_data):
+        '''Yield the JSON encoding of response_data in pieces of about
+        JSON_CHUNK_SIZE bytes.
+
+        If the 'result' of the response is a list, each of its items is
+        encoded on its own, so the whole response is never built as one
+        string. Each part is encoded with dumps(), as that uses the C
+        speedups that JSONEncoder.iterencode() doesn't.
+        '''
+        result = response_data.get('result')
+        if not isinstance(result, list):
+            yield h.json.dumps(response_data)
+            return
+
+        envelope = dict((key, value) for key, value in
+                        response_data.iteritems() if key != 'result')
+        # everything but the closing brace of the envelope
+        parts = [h.json.dumps(envelope)[:-1],
+                 ', "result": [' if envelope else '"result": [']
+        size = 0
+        for num, item in enumerate(result):
+            if num:
+                parts.append(', ')
+            part = h.json.dumps(item)
+            parts.append(part)
+            size += len(part)
+            if size >= JSON_CHUNK_SIZE:
+                yield ''.join(parts)
+                parts = []
+                size = 0
+        parts.append(']}')
+        yield ''.join(parts)
 
     def _set_response_header(self, name, value):
         try:
@@ -161,10 +208,22 @@ class ApiController(base.BaseController):
             return self._finish_bad_request(
                 gettext('Action name not known: %s') % str(logic_function))
 
+        # The action's docstring is included in the response unless it is
+        # turned off with the help parameter or site-wide.
+        try:
+            include_help = asbool(request.GET.get(
+                'help', config.get('ckan.api.include_help', True)))
+        except ValueError:
+            return self._finish_bad_request(
+                gettext('Bad value for the help parameter: %s') %
+                request.GET.get('help'))
+
         context = {'model': model, 'session': model.Session, 'user': c.user,
                    'api_version': ver}
         model.Session()._context = context
-        return_dict = {'help': function.__doc__}
+        return_dict = {}
+        if include_help:
+            return_dict['help'] = function.__doc__
         try:
             side_effect_free = getattr(function, 'side_effect_free', False)
             request_data = self._get_request_data(try_url_params=
@@ -180,53 +239,154 @@ class ApiController(base.BaseController):
                 gettext('Bad request data: %s') %
                 'Request data JSON decoded to %r but '
                 'it needs to be a dictionary.' % request_data)
+        if side_effect_free and 'help' in request.GET and not request.POST:
+            # the data was read from the url parameters
+            request_data.pop('help', None)
         try:
-            result = function(context, request_data)
-            return_dict['success'] = True
-            return_dict['result'] = result
+            status_int = self._call_action(function, context, request_data,
+                                           return_dict)
         except DataError, e:
             log.error('Format incorrect: %s - %s' % (e.error, request_data))
             #TODO make better error message
             return self._finish(400, _(u'Integrity Error') +
                                 ': %s - %s' % (e.error, request_data))
+        if status_int != 200:
+            return self._finish(status_int, return_dict, content_type='json')
+        return self._finish_ok(return_dict, stream=True)
+
+    def _call_action(self, function, context, data_dict, return_dict):
+        '''Call an action function and fill in return_dict with its result,
+        or with the error if it failed.
+
+        Returns the HTTP status code of the outcome. DataErrors are left for
+        the caller to handle.
+        '''
+        try:
+            result = function(context, data_dict)
+            return_dict['success'] = True
+            return_dict['result'] = result
+            return 200
         except NotAuthorized:
             return_dict['error'] = {'__type': 'Authorization Error',
                                     'message': _('Access denied')}
             return_dict['success'] = False
-            return self._finish(403, return_dict, content_type='json')
+            return 403
         except NotFound, e:
             return_dict['error'] = {'__type': 'Not Found Error',
                                     'message': _('Not found')}
             if e.extra_msg:
                 return_dict['error']['message'] += ': %s' % e.extra_msg
             return_dict['success'] = False
-            return self._finish(404, return_dict, content_type='json')
+            return 404
         except ValidationError, e:
             error_dict = e.error_dict
             error_dict['__type'] = 'Validation Error'
             return_dict['error'] = error_dict
             return_dict['success'] = False
             log.error('Validation error: %r' % str(e.error_dict))
-            return self._finish(409, return_dict, content_type='json')
+            return 409
         except logic.ParameterError, e:
             return_dict['error'] = {'__type': 'Parameter Error',
                                     'message': '%s: %s' %
                                     (_('Parameter Error'), e.extra_msg)}
             return_dict['success'] = False
             log.error('Parameter error: %r' % e.extra_msg)
-            return self._finish(409, return_dict, content_type='json')
+            return 409
         except search.SearchQueryError, e:
             return_dict['error'] = {'__type': 'Search Query Error',
                                     'message': 'Search Query is invalid: %r' %
                                     e.args}
             return_dict['success'] = False
-            return self._finish(400, return_dict, content_type='json')
+            return 400
         except search.SearchError, e:
             return_dict['error'] = {'__type': 'Search Error',
                                     'message': 'Search error: %r' % e.args}
             return_dict['success'] = False
-            return self._finish(409, return_dict, content_type='json')
-        return self._finish_ok(return_dict)
+            return 409
+
+    def batch(self, ver=None):
+        '''Call several actions in one request.
+
+        The request data is a dictionary with the list of calls to make, e.g.
+
+            {"calls": [{"action": "package_show", "data_dict": {"id": "x"}},
+                       {"action": "group_show", "data_dict": {"id": "y"}}]}
+
+        The user is identified and the request authorized once for all the
+        calls, which are made one after the other in the same database
+        session. The result is the list of the responses of the calls, in
+        the same format as the responses of single action calls (without
+        help). A call that fails, even with an unexpected error, doesn't
+        affect the other calls.
+        '''
+        try:
+            request_data = self._get_request_data()
+        except ValueError, inst:
+            log.error('Bad request data: %s' % str(inst))
+            return self._finish_bad_request(
+                gettext('JSON Error: %s') % str(inst))
+        calls = None
+        if isinstance(request_data, dict):
+            calls = request_data.get('calls')
+        if not isinstance(calls, list) or \
+                not all(isinstance(call, dict) for call in calls):
+            return self._finish_bad_request(
+                gettext('Bad request data: %s') %
+                'calls needs to be a list of dictionaries.')
+        max_calls = int(config.get('ckan.api.batch_max_calls', 100))
+        if len(calls) > max_calls:
+            return self._finish_bad_request(
+                gettext('Too many calls in the batch, the maximum is %i') %
+                max_calls)
+
+        # Check all the calls before making any of them.
+        functions = []
+        for call in calls:
+            logic_function = call.get('action')
+            try:
+                functions.append(get_action(logic_function))
+            except KeyError:
+                log.error('Can\'t find logic function: %s' % logic_function)
+                return self._finish_bad_request(
+                    gettext('Action name not known: %s') %
+                    str(logic_function))
+            if not isinstance(call.get('data_dict', {}), dict):
+                return self._finish_bad_request(
+                    gettext('Bad request data: %s') %
+                    'data_dict of %s needs to be a dictionary.' %
+                    logic_function)
+
+        results = []
+        for function, call in zip(functions, calls):
+            data_dict = call.get('data_dict', {})
+            context = {'model': model, 'session': model.Session,
+                       'user': c.user, 'api_version': ver}
+            model.Session()._context = context
+            return_dict = {}
+            try:
+                status_int = self._call_action(function, context, data_dict,
+                                               return_dict)
+            except DataError, e:
+                log.error('Format incorrect: %s - %s' % (e.error, data_dict))
+                return_dict = {'success': False,
+                               'error': {'__type': 'Integrity Error',
+                                         'message': '%s: %s' % (
+                                             _(u'Integrity Error'), e.error)}}
+                status_int = 400
+            except Exception, e:
+                # report the error for this call only, rather than failing
+                # the whole batch
+                log.exception(e)
+                return_dict = {'success': False,
+                               'error': {'__type': 'Internal Server Error',
+                                         'message': _('Internal server error')}}
+                status_int = 500
+            if status_int != 200:
+                # don't let a failed call affect the following ones
+                model.Session.rollback()
+            results.append(return_dict)
+        return self._finish_ok({'success': True, 'result': results},
+                               stream=True)
 
     def _get_action_from_map(self, action_map, register, subregister):
         ''' Helper function to get the action function specified in
@@ -8,6 +8,7 @@ from ckan.lib.base import ValidationException, abort, gettext
 from pylons.i18n import get_lang, _
 from ckan.lib.helpers import Page
 import ckan.lib.maintain as maintain
+import ckan.lib.page_cache as page_cache
 from ckan.lib.navl.dictization_functions import DataError, unflatten, validate
 from ckan.logic import NotFound, NotAuthorized, ValidationError
 from ckan.logic import check_access, get_action
@@ -235,6 +236,8 @@ class GroupController(BaseController):
             c.facets = {}
             c.page = h.Page(collection=[])
 
+        page_cache.tag_page(request.environ, page_cache.SEARCH,
+                            *page_cache.group_tags(c.group_dict))
         return render(self._read_template(c.group_dict['type']))
 
     def new(self, data=None, errors=None, error_summary=None):
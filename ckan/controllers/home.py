@@ -5,6 +5,7 @@ import sqlalchemy.exc
 
 import ckan.logic
 import ckan.lib.maintain as maintain
+import ckan.lib.page_cache as page_cache
 from ckan.lib.search import SearchError
 from ckan.lib.base import *
 from ckan.lib.helpers import url_for
@@ -176,6 +177,8 @@ class HomeController(BaseController):
 
         # END OF DIRTYNESS
 
+        page_cache.tag_page(request.environ, page_cache.HOME,
+                            page_cache.SEARCH)
         return render('home/index.html', cache_force=True)
 
     def license(self):
@@ -30,6 +30,7 @@ import ckan.authz
 import ckan.rating
 import ckan.misc
 import ckan.lib.accept as accept
+import ckan.lib.page_cache as page_cache
 from home import CACHE_PARAMETERS
 
 from ckan.lib.plugins import lookup_package_plugin
@@ -249,6 +250,7 @@ class PackageController(BaseController):
         maintain.deprecate_context_item(
           'facets',
           'Use `c.search_facets` instead.')
+        page_cache.tag_page(request.environ, page_cache.SEARCH)
         return render(self._search_template(package_type))
 
     def _content_type_from_extension(self, ext):
@@ -320,6 +322,8 @@ class PackageController(BaseController):
         c.related_count = c.pkg.related_count
 
         PackageSaver().render_package(c.pkg_dict, context)
+        page_cache.tag_page(request.environ,
+                            *page_cache.package_tags(c.pkg_dict))
 
         template = self._read_template(package_type)
         template = template[:template.index('.') + 1] + format
@@ -1155,6 +1159,8 @@ class PackageController(BaseController):
         c.datastore_api = '%s/api/action' % config.get('ckan.site_url','').rstrip('/')
 
         c.related_count = c.pkg.related_count
+        page_cache.tag_page(request.environ,
+                            *page_cache.package_tags(c.package))
         return render('package/resource_read.html')
 
     def resource_download(self, id, resource_id):
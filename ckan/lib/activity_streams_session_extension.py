@@ -1,7 +1,26 @@
+import sqlalchemy
+from sqlalchemy.orm.attributes import get_history
 from sqlalchemy.orm.session import SessionExtension
 import logging
 logger = logging.getLogger(__name__)
 
+# The Member attributes that decide whether a dataset's activities appear in
+# the dashboards of the group's followers.
+_MEMBERSHIP_ATTRIBUTES = ('state', 'capacity', 'group_id', 'table_id')
+
+
+def _membership_changed(member):
+    '''Return True if the membership really changed in this flush.
+
+    package_update assigns the attributes of every membership of the
+    dataset, even when they keep their values.
+
+    '''
+    for attribute in _MEMBERSHIP_ATTRIBUTES:
+        if get_history(member, attribute).has_changes():
+            return True
+    return False
+
 def activity_stream_item(obj, activity_type, revision, user_id):
     method = getattr(obj, "activity_stream_item", None)
     if callable(method):
@@ -148,3 +167,59 @@ class DatasetActivitySessionExtension(SessionExtension):
                 session.add(activity_detail_obj)
 
         session.flush()
+
+
+class DashboardSessionExtension(SessionExtension):
+    """Session extension that keeps users' dashboards up to date.
+
+    Every Activity flushed to the database is counted as new in the
+    dashboards of the users that it will appear to, and if activity inboxes
+    are enabled it is added to their inboxes. When a user starts or stops
+    following something, or datasets are added to or removed from a group
+    that users follow, the activities in their dashboards change in other
+    ways so their counts are reset and recounted the next time they are
+    needed (see ckan.model.dashboard:Dashboard) and their inboxes are
+    queued to be rebuilt.
+
+    """
+    def after_flush(self, session, flush_context):
+        import ckan.model as model
+
+        following_classes = (model.UserFollowingUser,
+                model.UserFollowingDataset, model.UserFollowingGroup)
+        reset_user_ids = set()
+        changed_group_ids = set()
+
+        inbox_enabled = model.activity.activity_inbox_enabled()
+        for obj in session.new:
+            if isinstance(obj, model.Activity):
+                model.Dashboard.activity_created(session, obj)
+                if inbox_enabled:
+                    model.activity.add_to_activity_inboxes(session, obj)
+
+        for obj in list(session.new) + list(session.deleted):
+            if isinstance(obj, following_classes):
+                reset_user_ids.add(obj.follower_id)
+
+        for obj in list(session.new) + list(session.deleted):
+            if isinstance(obj, model.Member) and obj.table_name == 'package':
+                changed_group_ids.add(obj.group_id)
+        for obj in session.dirty:
+            if isinstance(obj, model.Member) and obj.table_name == 'package' \
+                    and _membership_changed(obj):
+                changed_group_ids.add(obj.group_id)
+                # A dataset moved to another group changes the old group too
+                changed_group_ids.update(group_id for group_id in
+                    get_history(obj, 'group_id').deleted if group_id)
+
+        if changed_group_ids:
+            table = model.follower.user_following_group_table
+            reset_user_ids.update(row[0] for row in session.execute(
+                sqlalchemy.select([table.c.follower_id],
+                    table.c.object_id.in_(list(changed_group_ids)))))
+
+        model.Dashboard.reset_new_activities_count(session,
+                list(reset_user_ids))
+        if inbox_enabled:
+            model.activity.queue_activity_inbox_rebuilds(session,
+                reset_user_ids)
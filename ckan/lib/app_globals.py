@@ -126,11 +126,20 @@ class _Globals(object):
         '''
         self._init()
         self._config_update = None
+        self._config_update_checked = None
         self._mutex = Lock()
 
     def _check_uptodate(self):
         ''' check the config is uptodate needed when several instances are
-        running '''
+        running. The database is checked at most once every
+        ckan.config_update_check_interval seconds '''
+        now = time.time()
+        interval = float(config.get('ckan.config_update_check_interval', 5))
+        last_checked = self._config_update_checked
+        # a clock that went backwards also triggers a check
+        if last_checked is not None and 0 <= now - last_checked < interval:
+            return
+        self._config_update_checked = now
         value = model.get_system_info('ckan.config_update')
         if self._config_update != value:
             if self._mutex.acquire(False):
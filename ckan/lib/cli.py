@@ -1,6 +1,7 @@
 import os
 import datetime
 import sys
+import time
 import logging
 from pprint import pprint
 import re
@@ -311,10 +312,15 @@ class SearchIndexCommand(CkanCommand):
     '''Creates a search index for all datasets
 
     Usage:
-      search-index [-i] [-o] [-r] [-e] rebuild [dataset-name]     - reindex dataset-name if given, if not then rebuild full search index (all datasets)
+      search-index [-i] [-o] [-r] [-e] [-w N] [-b N] rebuild [dataset-name]
+                                                             - reindex dataset-name if given, if not then rebuild full search index (all datasets)
       search-index check                                     - checks for datasets not indexed
       search-index show {dataset-name}                       - shows index of a dataset
       search-index clear [dataset-name]                      - clears the search index for the provided dataset or for the whole ckan instance
+      search-index [-b N] worker                             - indexes the datasets queued by the asynchronous_search plugin
+      search-index queue-failed [dataset-id]                 - lists the queued datasets the worker gave up on
+      search-index queue-retry [dataset-id]                  - makes the worker try the failed queued datasets again
+      search-index queue-purge [dataset-id]                  - deletes the failed queued datasets from the queue
     '''
 
     summary = __doc__.split('\n')[0]
@@ -342,6 +348,17 @@ immediately available on the search, but slows significantly the process.
 Default is false.'''
                     )
 
+        self.parser.add_option('-w', '--workers', dest='workers',
+            type='int', default=1, help=
+'''Number of processes used to dictize the datasets when rebuilding the
+whole index. Default is 1.''')
+
+        self.parser.add_option('-b', '--batch-size', dest='batch_size',
+            type='int', default=None, help=
+'''Number of datasets sent to Solr on each request when rebuilding the
+whole index (default is 1), or number of queued changes processed at a time
+by the worker (default is 100).''')
+
     def command(self):
         self._load_config()
 
@@ -359,6 +376,14 @@ Default is false.'''
             self.show()
         elif cmd == 'clear':
             self.clear()
+        elif cmd == 'worker':
+            self.worker()
+        elif cmd == 'queue-failed':
+            self.queue_failed()
+        elif cmd == 'queue-retry':
+            self.queue_retry()
+        elif cmd == 'queue-purge':
+            self.queue_purge()
         else:
             print 'Command %s not recognized' % cmd
 
@@ -368,16 +393,20 @@ Default is false.'''
         # BY default we don't commit after each request to Solr, as it is
         # a really heavy operation and slows things a lot
 
+        start = time.time()
         if len(self.args) > 1:
             rebuild(self.args[1])
         else:
             rebuild(only_missing=self.options.only_missing,
                     force=self.options.force,
                     refresh=self.options.refresh,
-                    defer_commit=(not self.options.commit_each))
+                    defer_commit=(not self.options.commit_each),
+                    workers=self.options.workers,
+                    batch_size=self.options.batch_size or 1)
 
         if not self.options.commit_each:
             commit()
+        print 'Search index rebuilt in %.1f seconds' % (time.time() - start)
 
     def check(self):
         from ckan.lib.search import check
@@ -399,6 +428,50 @@ Default is false.'''
         package_id =self.args[1] if len(self.args) > 1 else None
         clear(package_id)
 
+    def worker(self):
+        from ckan import model
+        from ckan.lib.search import process_queue
+
+        batch_size = self.options.batch_size or 100
+        while True:
+            try:
+                processed = process_queue(batch_size)
+            except Exception, e:
+                log = logging.getLogger(__name__)
+                log.exception(e)
+                model.Session.rollback()
+                processed = 0
+            model.Session.remove()
+            if processed < batch_size:
+                # Queue drained (or an error), wait for new changes
+                time.sleep(5)
+
+    def queue_failed(self):
+        from ckan.lib.search import failed_queue_entries
+
+        package_id = self.args[1] if len(self.args) > 1 else None
+        entries = failed_queue_entries(package_id)
+        for entry in entries:
+            print '%i %s %s %s (%i attempts)' % (entry.id, entry.package_id,
+                entry.operation, entry.timestamp, entry.attempts)
+            if entry.error:
+                print entry.error.encode('utf-8')
+        print '%i failed queue entries' % len(entries)
+
+    def queue_retry(self):
+        from ckan.lib.search import retry_failed_queue_entries
+
+        package_id = self.args[1] if len(self.args) > 1 else None
+        count = retry_failed_queue_entries(package_id)
+        print '%i failed queue entries will be retried' % count
+
+    def queue_purge(self):
+        from ckan.lib.search import purge_failed_queue_entries
+
+        package_id = self.args[1] if len(self.args) > 1 else None
+        count = purge_failed_queue_entries(package_id)
+        print '%i failed queue entries deleted' % count
+
 class Notification(CkanCommand):
     '''Send out modification notifications.
 
@@ -425,9 +498,14 @@ class Notification(CkanCommand):
             cmd = self.args[0]
 
         if cmd == 'replay':
+            from ckan.lib.search import commit_window
             dome = DomainObjectModificationExtension()
-            for package in Session.query(Package):
-                dome.notify(package, DomainObjectOperation.changed)
+            with commit_window() as window:
+                for package in Session.query(Package):
+                    dome.notify(package, DomainObjectOperation.changed)
+                    # Nothing is changed in the database, so there is no
+                    # commit to wait for before sending the update
+                    window.commit_pending()
         else:
             print 'Command %s not recognized' % cmd
 
@@ -1054,6 +1132,79 @@ class Tracking(CkanCommand):
                  AND t1.package_id != '~~not~found~~';'''
         engine.execute(sql)
 
+class ActivityInbox(CkanCommand):
+    '''Manage the dashboard activity inboxes
+
+    Usage:
+      activity-inbox rebuild [USERNAME]  - fill in the activity inboxes of all
+                                           users or of the given user
+      activity-inbox worker              - rebuild the activity inboxes of
+                                           users whose follows changed
+
+    The activity inboxes are only used when ckan.activity_inbox_enabled is
+    true. Run rebuild after enabling them, and keep the worker running:
+    until a queued inbox is rebuilt that user's dashboard is worked out
+    from what they follow.
+    '''
+
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+    max_args = 2
+    min_args = 1
+
+    def command(self):
+        self._load_config()
+        cmd = self.args[0]
+        if cmd == 'rebuild':
+            self.rebuild(self.args[1] if len(self.args) > 1 else None)
+        elif cmd == 'worker':
+            self.worker()
+        else:
+            print 'Command %s not recognized' % cmd
+
+    def rebuild(self, username=None):
+        import ckan.model as model
+
+        if username:
+            user = model.User.get(username)
+            if not user:
+                print 'User "%s" not found' % username
+                sys.exit(1)
+            user_ids = [user.id]
+        else:
+            user_ids = [row[0] for row in
+                        model.Session.query(model.User.id).all()]
+
+        # Commit every few users so that a rebuild of a large site doesn't
+        # run in one huge transaction.
+        batch_size = 100
+        for i in range(0, len(user_ids), batch_size):
+            model.activity.rebuild_activity_inboxes(model.Session,
+                user_ids[i:i + batch_size])
+            model.Session.commit()
+            print 'Rebuilt activity inboxes of %i/%i users' % (
+                min(i + batch_size, len(user_ids)), len(user_ids))
+
+    def worker(self):
+        import ckan.model as model
+
+        batch_size = 100
+        while True:
+            try:
+                processed = model.activity.process_activity_inbox_queue(
+                    model.Session, batch_size)
+                model.Session.commit()
+            except Exception, e:
+                log = logging.getLogger(__name__)
+                log.exception(e)
+                model.Session.rollback()
+                processed = 0
+            model.Session.remove()
+            if processed < batch_size:
+                # Queue drained (or an error), wait for new changes
+                time.sleep(5)
+
+
 class PluginInfo(CkanCommand):
     ''' Provide info on installed plugins.
     '''
@@ -1740,3 +1891,74 @@ class MinifyCommand(CkanCommand):
             f.write(rjsmin.jsmin(source))
         f.close()
         print "Minified file '{0}'".format(path)
+
+
+class TemplatesCommand(CkanCommand):
+    '''Precompile the Jinja2 templates
+
+    Usage:
+      templates compile  - compile all the templates in the template paths
+                           into the ckan.jinja2_cache_dir bytecode cache
+
+    Run this at deploy time so that the CKAN processes don't have to compile
+    the templates themselves on their first requests.
+    '''
+
+    summary = __doc__.split('\n')[0]
+    usage = __doc__
+    max_args = 1
+    min_args = 1
+
+    def command(self):
+        self._load_config()
+        cmd = self.args[0]
+        if cmd == 'compile':
+            self.compile()
+        else:
+            print 'Command %s not recognized' % cmd
+
+    def compile(self):
+        from jinja2 import TemplateSyntaxError
+        from pylons import config
+
+        env = config['pylons.app_globals'].jinja_env
+        if not env.bytecode_cache:
+            print 'ckan.jinja2_cache_dir is not set, nothing to do'
+            sys.exit(1)
+
+        compiled = failed = 0
+        for name in self._template_names(env.loader.searchpath):
+            try:
+                env.get_template(name)
+                compiled += 1
+            except (TemplateSyntaxError, UnicodeDecodeError), e:
+                # e.g. legacy Genshi templates
+                failed += 1
+                if self.verbose > 1:
+                    print 'Could not compile %s: %s' % (name, e)
+        print 'Compiled %i templates, %i could not be compiled' % (
+            compiled, failed)
+
+    def _template_names(self, searchpath):
+        '''Return the names of all the templates in the given search path.
+
+        As well as the plain names this includes the names used by the
+        ckan_extends tag (*<search path index>*<template name>) for every
+        template that is overridden by another one earlier in the search
+        path.
+        '''
+        found = {}
+        for index, path in enumerate(searchpath):
+            for root, dirs, files in os.walk(path):
+                for filename in files:
+                    name = os.path.relpath(os.path.join(root, filename), path)
+                    name = '/'.join(name.split(os.sep))
+                    found.setdefault(name, []).append(index)
+
+        names = []
+        for name in sorted(found):
+            names.append(name)
+            # a template at index i can ckan_extends the next one down
+            for index in found[name][:-1]:
+                names.append('*%i*%s' % (index, name))
+        return names
@@ -1,5 +1,6 @@
 import datetime
 from pylons import config
+import sqlalchemy
 from sqlalchemy.sql import select
 import datetime
 import ckan.authz
@@ -19,6 +20,12 @@ def group_list_dictize(obj_list, context,
     with_private = context.get('include_private_packages', False)
     result_list = []
 
+    # Count the packages of all the groups in one query.
+    group_ids = [obj[0].id if context.get('with_capacity') else obj.id
+                 for obj in obj_list]
+    package_counts = ckan.model.Group.package_counts(group_ids,
+                                                     with_private)
+
     for obj in obj_list:
         if context.get('with_capacity'):
             obj, capacity = obj
@@ -31,8 +38,7 @@ def group_list_dictize(obj_list, context,
 
         group_dict['display_name'] = obj.display_name
 
-        group_dict['packages'] = \
-                len(obj.packages(with_private=with_private))
+        group_dict['packages'] = package_counts.get(obj.id, 0)
 
         if context.get('for_view'):
             for item in plugins.PluginImplementations(
@@ -282,6 +288,167 @@ def package_dictize(pkg, context):
 
     return result_dict
 
+def _group_rows(rows, key):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row[key], []).append(row)
+    return grouped
+
+def package_dictize_many(pkg_ids, context):
+    '''
+    Given a list of package ids, returns a list of dictionaries equivalent
+    to calling package_dictize on each of the packages, in the same order.
+
+    Instead of running a set of queries for every package, each of the
+    related tables is queried once for the whole list, so the number of
+    queries does not depend on the number of packages. Ids that don't
+    match any package are skipped.
+    '''
+    model = context['model']
+    pkg_ids = list(pkg_ids)
+    if not pkg_ids:
+        return []
+
+    #package
+    package_rev = model.package_revision_table
+    q = select([package_rev]).where(package_rev.c.id.in_(pkg_ids))
+    package_rows = dict((row['id'], row) for row in
+                        _execute_with_revision(q, package_rev, context))
+
+    #resources
+    res_rev = model.resource_revision_table
+    resource_group = model.resource_group_table
+    q = select([resource_group.c.id, resource_group.c.package_id]).where(
+        resource_group.c.package_id.in_(pkg_ids))
+    resource_group_packages = dict(model.Session.execute(q).fetchall())
+    q = select([res_rev], from_obj = res_rev.join(resource_group,
+               resource_group.c.id == res_rev.c.resource_group_id))
+    q = q.where(resource_group.c.package_id.in_(pkg_ids))
+    resource_rows = {}
+    for row in _execute_with_revision(q, res_rev, context):
+        package_id = resource_group_packages[row['resource_group_id']]
+        resource_rows.setdefault(package_id, []).append(row)
+
+    #tags
+    tag_rev = model.package_tag_revision_table
+    tag = model.tag_table
+    q = select([tag, tag_rev.c.state, tag_rev.c.revision_timestamp,
+                tag_rev.c.package_id.label('_package_id')],
+        from_obj=tag_rev.join(tag, tag.c.id == tag_rev.c.tag_id)
+        ).where(tag_rev.c.package_id.in_(pkg_ids))
+    tag_rows = _group_rows(_execute_with_revision(q, tag_rev, context),
+                           '_package_id')
+
+    #extras
+    extra_rev = model.extra_revision_table
+    q = select([extra_rev]).where(extra_rev.c.package_id.in_(pkg_ids))
+    extra_rows = _group_rows(_execute_with_revision(q, extra_rev, context),
+                             'package_id')
+
+    #groups
+    member_rev = model.member_revision_table
+    group = model.group_table
+    q = select([group, member_rev.c.capacity,
+                member_rev.c.table_id.label('_package_id')],
+               from_obj=member_rev.join(group, group.c.id == member_rev.c.group_id)
+               ).where(member_rev.c.table_id.in_(pkg_ids))\
+                .where(member_rev.c.state == 'active')
+    group_rows = _group_rows(_execute_with_revision(q, member_rev, context),
+                             '_package_id')
+
+    #relations
+    rel_rev = model.package_relationship_revision_table
+    q = select([rel_rev]).where(rel_rev.c.subject_package_id.in_(pkg_ids))
+    subject_rows = _group_rows(_execute_with_revision(q, rel_rev, context),
+                               'subject_package_id')
+    q = select([rel_rev]).where(rel_rev.c.object_package_id.in_(pkg_ids))
+    object_rows = _group_rows(_execute_with_revision(q, rel_rev, context),
+                              'object_package_id')
+
+    #tracking
+    if not context.get('for_edit'):
+        resource_urls = [row['url'] for rows in resource_rows.values()
+                         for row in rows]
+        resource_tracking = model.TrackingSummary.get_for_resources(
+            resource_urls)
+    package_tracking = model.TrackingSummary.get_for_packages(pkg_ids)
+
+    # Extra properties from the domain objects
+    packages = dict((pkg.id, pkg) for pkg in model.Session.query(
+        model.Package).filter(model.Package.id.in_(pkg_ids)))
+    q = select([package_rev.c.id,
+                sqlalchemy.func.min(package_rev.c.revision_timestamp)]
+               ).where(package_rev.c.id.in_(pkg_ids)
+               ).group_by(package_rev.c.id)
+    metadata_created = dict(model.Session.execute(q).fetchall())
+
+    def strip_package_id(dicts):
+        for dict_ in dicts:
+            dict_.pop('_package_id', None)
+        return dicts
+
+    result_list = []
+    for pkg_id in pkg_ids:
+        if pkg_id not in package_rows or pkg_id not in packages:
+            continue
+        # table_dictize keeps track of the latest revision timestamp
+        # of the package in the context.
+        context.pop('metadata_modified', None)
+        result_dict = d.table_dictize(package_rows[pkg_id], context)
+
+        # Resource tracking summaries were already fetched in bulk
+        resource_context = dict(context, for_edit=True)
+        resources = resource_list_dictize(
+            resource_rows.get(pkg_id, []), resource_context)
+        context['metadata_modified'] = resource_context['metadata_modified']
+        if not context.get('for_edit'):
+            urls = dict((row['id'], row['url'])
+                        for row in resource_rows.get(pkg_id, []))
+            for resource in resources:
+                resource['tracking_summary'] = resource_tracking[
+                    urls[resource['id']]]
+        result_dict["resources"] = resources
+
+        result_dict["tags"] = strip_package_id(d.obj_list_dictize(
+            tag_rows.get(pkg_id, []), context, lambda x: x["name"]))
+        for tag in result_dict['tags']:
+            assert not tag.has_key('display_name')
+            tag['display_name'] = tag['name']
+
+        result_dict["extras"] = extras_list_dictize(
+            extra_rows.get(pkg_id, []), context)
+        result_dict['tracking_summary'] = package_tracking[pkg_id]
+        result_dict["groups"] = strip_package_id(d.obj_list_dictize(
+            group_rows.get(pkg_id, []), context))
+        result_dict["relationships_as_subject"] = d.obj_list_dictize(
+            subject_rows.get(pkg_id, []), context)
+        result_dict["relationships_as_object"] = d.obj_list_dictize(
+            object_rows.get(pkg_id, []), context)
+
+        pkg = packages[pkg_id]
+        result_dict['isopen'] = pkg.isopen if isinstance(pkg.isopen,bool) else pkg.isopen()
+        result_dict['type']= pkg.type
+        if pkg.license and pkg.license.url:
+            result_dict['license_url']= pkg.license.url
+            result_dict['license_title']= pkg.license.title.split('::')[-1]
+        elif pkg.license:
+            result_dict['license_title']= pkg.license.title
+        else:
+            result_dict['license_title']= pkg.license_id
+
+        result_dict['metadata_modified'] = context.pop('metadata_modified')
+        created = metadata_created.get(pkg_id)
+        result_dict['metadata_created'] = created.isoformat() \
+            if created else None
+
+        if context.get('for_view'):
+            for item in plugins.PluginImplementations( plugins.IPackageController):
+                result_dict = item.before_view(result_dict)
+
+        result_list.append(result_dict)
+
+    return result_list
+
 def _get_members(context, group, member_type):
 
     model = context['model']
@@ -384,6 +551,24 @@ def user_list_dictize(obj_list, context,
 def member_dictize(member, context):
     return d.table_dictize(member, context)
 
+def user_list_with_counts_dictize(obj_list, context):
+    '''Dictize a list of users.
+
+    Unlike calling user_dictize() for each user this takes each user's
+    number of edits and number of administered packages from obj_list and
+    checks whether the requester is a sysadmin only once.
+
+    :param obj_list: (user, number_of_edits, number_administered_packages)
+        tuples
+    '''
+    requester_is_sysadmin = ckan.authz.Authorizer().is_sysadmin(
+        unicode(context['user']))
+    result_list = []
+    for user, number_of_edits, number_administered_packages in obj_list:
+        result_list.append(_user_dictize(user, context, number_of_edits,
+            number_administered_packages, requester_is_sysadmin))
+    return result_list
+
 def user_dictize(user, context):
 
     if context.get('with_capacity'):
@@ -392,16 +577,28 @@ def user_dictize(user, context):
     else:
         result_dict = d.table_dictize(user, context)
 
+    return _user_dictize(user, context, user.number_of_edits(),
+        user.number_administered_packages(),
+        ckan.authz.Authorizer().is_sysadmin(unicode(context['user'])),
+        result_dict)
+
+def _user_dictize(user, context, number_of_edits,
+                  number_administered_packages, requester_is_sysadmin,
+                  result_dict=None):
+
+    if result_dict is None:
+        result_dict = d.table_dictize(user, context)
+
     del result_dict['password']
 
     result_dict['display_name'] = user.display_name
     result_dict['email_hash'] = user.email_hash
-    result_dict['number_of_edits'] = user.number_of_edits()
-    result_dict['number_administered_packages'] = user.number_administered_packages()
+    result_dict['number_of_edits'] = number_of_edits
+    result_dict['number_administered_packages'] = number_administered_packages
 
     requester = context['user']
 
-    if not (ckan.authz.Authorizer().is_sysadmin(unicode(requester)) or
+    if not (requester_is_sysadmin or
             requester == user.name or
             context.get('keep_sensitive_data', False)):
         # If not sysadmin or the same user, strip sensible info
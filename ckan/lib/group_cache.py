@@ -0,0 +1,91 @@
+'''
+Process-wide cache of group display names.
+
+Group facets are labelled with the display names of the groups, which would
+otherwise need a query per facet item on every search. The cache is cleared
+whenever a group is created, changed or deleted in this process, and entries
+expire after ``ckan.group_cache_timeout`` seconds (default 60) so changes made
+by other processes are picked up too.
+'''
+import time
+import threading
+
+from pylons import config
+from sqlalchemy import or_
+
+import ckan.model as model
+import ckan.plugins as plugins
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _timeout():
+    return float(config.get('ckan.group_cache_timeout', 60))
+
+
+def get_display_names(names):
+    '''Return a dict of display names for the given group names or ids.
+
+    Groups that don't exist are mapped to the name itself. All the groups
+    missing from the cache are loaded with a single query.
+    '''
+    now = time.time()
+    timeout = _timeout()
+    display_names = {}
+    missing = []
+    with _lock:
+        for name in names:
+            cached = _cache.get(name)
+            if cached and now - cached[1] < timeout:
+                display_names[name] = cached[0]
+            else:
+                missing.append(name)
+
+    if missing:
+        groups = model.Session.query(model.Group).filter(or_(
+            model.Group.name.in_(missing),
+            model.Group.id.in_(missing)))
+        found = {}
+        for group in groups:
+            found[group.name] = found[group.id] = group.display_name
+        with _lock:
+            for name in missing:
+                display_names[name] = found.get(name, name)
+                _cache[name] = (display_names[name], now)
+
+    return display_names
+
+
+def get_display_name(name):
+    '''Return the display name of the group with the given name or id.'''
+    return get_display_names([name])[name]
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+class GroupCachePlugin(plugins.SingletonPlugin):
+    '''Clears the group display name cache when a group changes.'''
+    plugins.implements(plugins.ISession, inherit=True)
+
+    def before_commit(self, session):
+        session.flush()
+        if not hasattr(session, '_object_cache'):
+            return
+        oc = session._object_cache
+        for obj in oc['new'] | oc['changed'] | oc['deleted']:
+            if isinstance(obj, model.Group):
+                session._group_cache_changed = True
+                return
+
+    def after_commit(self, session):
+        if getattr(session, '_group_cache_changed', False):
+            del session._group_cache_changed
+            clear()
+
+    def after_rollback(self, session):
+        if hasattr(session, '_group_cache_changed'):
+            del session._group_cache_changed
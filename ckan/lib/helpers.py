@@ -551,10 +551,8 @@ def linked_user(user, maxlength=0, avatar=20):
 
 
 def group_name_to_title(name):
-    group = model.Group.by_name(name)
-    if group is not None:
-        return group.display_name
-    return name
+    import ckan.lib.group_cache as group_cache
+    return group_cache.get_display_name(name)
 
 
 def markdown_extract(text, extract_length=190):
@@ -1,10 +1,14 @@
 import re
+import os
 from os import path
 import logging
+import tempfile
+from hashlib import sha1
 
 from jinja2 import nodes
 from jinja2 import loaders
 from jinja2 import ext
+from jinja2 import bccache
 from jinja2.exceptions import TemplateNotFound
 from jinja2.utils import open_if_exists, escape
 from jinja2.filters import do_truncate
@@ -197,6 +201,59 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
         raise TemplateNotFound(template)
 
 
+class CkanFileSystemBytecodeCache(bccache.FileSystemBytecodeCache):
+    ''' A jinja2 bytecode cache that stores the compiled templates in a
+    directory that can be shared by all the CKAN processes, so that each of
+    them doesn't have to parse and compile every template again.
+
+    The compiled code of templates using the ckan_extends tag depends on
+    the template search path, so the search path is part of the cache key.
+    Cache files are written to a temporary file first and then renamed so
+    that other processes never read a half written file. '''
+
+    def __init__(self, directory, searchpath):
+        if not path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # another process may have created it meanwhile
+                if not path.isdir(directory):
+                    raise
+        bccache.FileSystemBytecodeCache.__init__(self, directory)
+        self.searchpath_key = '|'.join(searchpath)
+        if isinstance(self.searchpath_key, unicode):
+            self.searchpath_key = self.searchpath_key.encode('utf-8')
+        # mkstemp creates files only readable by their owner, but the cache
+        # may be shared by processes running as other users. The umask can
+        # only be read by setting it, so do it once here.
+        umask = os.umask(0)
+        os.umask(umask)
+        self.file_mode = 0644 & ~umask
+
+    def get_cache_key(self, name, filename=None):
+        key = bccache.FileSystemBytecodeCache.get_cache_key(self, name,
+                                                             filename)
+        return sha1(key + '|' + self.searchpath_key).hexdigest()
+
+    def dump_bytecode(self, bucket):
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory)
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                bucket.write_bytecode(f)
+            finally:
+                f.close()
+            os.chmod(tmp_filename, self.file_mode)
+            os.rename(tmp_filename, self._get_cache_filename(bucket))
+        except:
+            # don't leave half written temporary files behind
+            try:
+                os.unlink(tmp_filename)
+            except OSError:
+                pass
+            raise
+
+
 class BaseExtension(ext.Extension):
     ''' Base class for creating custom jinja2 tags.
     parse expects a tag of the format
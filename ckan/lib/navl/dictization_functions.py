@@ -1,4 +1,5 @@
 import copy
+import weakref
 import formencode as fe
 import inspect
 from pylons.i18n import _
@@ -73,6 +74,9 @@ def get_all_key_combinations(data, flattented_schema):
 
     '''
     schema_prefixes = set([key[:-1] for key in flattented_schema])
+    return _key_combinations(data, schema_prefixes)
+
+def _key_combinations(data, schema_prefixes):
     combinations = set([()])
 
     for key in sorted(data.keys(), key=flattened_order_key):
@@ -88,35 +92,78 @@ def get_all_key_combinations(data, flattented_schema):
 
     return combinations
 
+class CompiledSchema(object):
+    '''The parts of a schema needed for validation that don't depend on the
+    data being validated, worked out once per schema.'''
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.flattened = flatten_schema(schema)
+        ## the keys that subschemas and their fields are found under
+        self.prefixes = set(key[:-1] for key in self.flattened)
+        ## all the beginnings of the keys of the flattened schema
+        self.key_prefixes = set(key[:length] for key in self.flattened
+                                for length in range(len(key) + 1))
+        ## the fields of each (sub)schema and their validators, by the path
+        ## of the subschema
+        self.fields = {}
+        self._add_fields(schema, ())
+
+    def _add_fields(self, schema, path):
+        fields = self.fields[path] = []
+        for key, value in schema.iteritems():
+            if isinstance(value, list):
+                fields.append((key, value))
+            elif isinstance(value, dict):
+                self._add_fields(value, path + (key,))
+
+def compile_schema(schema):
+    '''Return the CompiledSchema of the given schema.
+
+    A schema is compiled once per call to validate(). Compiled schemas are
+    not cached, as the schema functions build a new schema dict every time.
+    Callers that validate many dicts against the same schema can compile it
+    once and pass the CompiledSchema to validate() instead; the schema must
+    not be changed after that.
+    '''
+    if isinstance(schema, CompiledSchema):
+        return schema
+    return CompiledSchema(schema)
+
 def make_full_schema(data, schema):
     '''make schema by getting all valid combinations and making sure that all keys
     are available'''
 
-    flattented_schema = flatten_schema(schema)
-
-    key_combinations = get_all_key_combinations(data, flattented_schema)
+    compiled = compile_schema(schema)
+    key_combinations = _key_combinations(data, compiled.prefixes)
+    return _full_schema(compiled, key_combinations)
 
+def _full_schema(compiled, key_combinations):
     full_schema = {}
 
     for combination in key_combinations:
-        sub_schema = schema
-        for key in combination[::2]:
-            sub_schema = sub_schema[key]
-
-        for key, value in sub_schema.iteritems():
-            if isinstance(value, list):
-                full_schema[combination + (key,)] = value
+        for key, value in compiled.fields[combination[::2]]:
+            full_schema[combination + (key,)] = value
 
     return full_schema
 
+## values that don't need copying as they can't be changed
+_immutable_types = (basestring, int, long, float, bool, type(None), Missing)
+
 def augment_data(data, schema):
     '''add missing, extras and junk data'''
-    flattented_schema = flatten_schema(schema)
-    key_combinations = get_all_key_combinations(data, flattented_schema)
+    compiled = compile_schema(schema)
+    key_combinations = _key_combinations(data, compiled.prefixes)
+    full_schema = _full_schema(compiled, key_combinations)
+    return _augment_data(data, compiled, full_schema, key_combinations)
 
-    full_schema = make_full_schema(data, schema)
+def _augment_data(data, compiled, full_schema, key_combinations):
 
-    new_data = copy.deepcopy(data)
+    new_data = {}
+    for key, value in data.iteritems():
+        if not isinstance(value, _immutable_types):
+            value = copy.deepcopy(value)
+        new_data[key] = value
 
     ## fill junk and extras
 
@@ -126,8 +173,7 @@ def augment_data(data, schema):
 
         ## check if any thing naugthy is placed against subschemas
         initial_tuple = key[::2]
-        if initial_tuple in [initial_key[:len(initial_tuple)]
-                             for initial_key in flattented_schema]:
+        if initial_tuple in compiled.key_prefixes:
             if data[key] <> []:
                 raise DataError('Only lists of dicts can be placed against '
                                 'subschema %s, not %s' % (key,type(data[key])))
@@ -151,6 +197,46 @@ def augment_data(data, schema):
 
     return new_data
 
+## the number of arguments each converter function is called with
+_converter_arities = weakref.WeakKeyDictionary()
+
+def converter_arity(converter):
+    '''Return the number of arguments convert() calls the given converter
+    with: 1 (value), 4 (key, data, errors, context) or 2 (value, context).
+
+    Returns None if this can't be told from the converter's signature, in
+    which case convert() finds out by trying each of them in turn.
+    '''
+    try:
+        return _converter_arities[converter]
+    except (KeyError, TypeError):
+        pass
+
+    if inspect.isfunction(converter):
+        function, bound_args = converter, 0
+    elif inspect.ismethod(converter):
+        function = converter.im_func
+        bound_args = 0 if converter.im_self is None else 1
+    else:
+        return None
+    args, varargs, varkw, defaults = inspect.getargspec(function)
+    if varargs:
+        return None
+    max_args = len(args) - bound_args
+    min_args = max_args - len(defaults or ())
+
+    arity = None
+    for number_of_args in (1, 4, 2):
+        if min_args <= number_of_args <= max_args:
+            arity = number_of_args
+            break
+    try:
+        _converter_arities[converter] = arity
+    except TypeError:
+        ## not weakly referenceable
+        pass
+    return arity
+
 def convert(converter, key, converted_data, errors, context):
 
     if inspect.isclass(converter) and issubclass(converter, fe.Validator):
@@ -169,6 +255,20 @@ def convert(converter, key, converted_data, errors, context):
             errors[key].append(e.msg)
         return
 
+    arity = converter_arity(converter)
+    if arity is not None:
+        try:
+            if arity == 1:
+                converted_data[key] = converter(converted_data.get(key))
+            elif arity == 4:
+                converter(key, converted_data, errors, context)
+            else:
+                converted_data[key] = converter(converted_data.get(key),
+                                                context)
+        except Invalid, e:
+            errors[key].append(e.error)
+        return
+
     try:
         value = converter(converted_data.get(key))
         converted_data[key] = value
@@ -268,13 +368,17 @@ def validate_flattened(data, schema, context=None):
 
 def _validate(data, schema, context):
     '''validate a flattened dict against a schema'''
-    converted_data = augment_data(data, schema)
-    full_schema = make_full_schema(data, schema)
+    compiled = compile_schema(schema)
+    key_combinations = _key_combinations(data, compiled.prefixes)
+    full_schema = _full_schema(compiled, key_combinations)
+    converted_data = _augment_data(data, compiled, full_schema,
+                                   key_combinations)
 
     errors = dict((key, []) for key in full_schema)
+    sorted_keys = sorted(full_schema, key=flattened_order_key)
 
     ## before run
-    for key in sorted(full_schema, key=flattened_order_key):
+    for key in sorted_keys:
         if key[-1] == '__before':
             for converter in full_schema[key]:
                 try:
@@ -283,7 +387,7 @@ def _validate(data, schema, context):
                     break
 
     ## main run
-    for key in sorted(full_schema, key=flattened_order_key):
+    for key in sorted_keys:
         if not key[-1].startswith('__'):
             for converter in full_schema[key]:
                 try:
@@ -292,7 +396,7 @@ def _validate(data, schema, context):
                     break
 
     ## extras run
-    for key in sorted(full_schema, key=flattened_order_key):
+    for key in sorted_keys:
         if key[-1] == '__extras':
             for converter in full_schema[key]:
                 try:
@@ -301,7 +405,7 @@ def _validate(data, schema, context):
                     break
 
     ## after run
-    for key in reversed(sorted(full_schema, key=flattened_order_key)):
+    for key in reversed(sorted_keys):
         if key[-1] == '__after':
             for converter in full_schema[key]:
                 try:
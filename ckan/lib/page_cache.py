@@ -0,0 +1,148 @@
+'''Dependency tags for the page cache.
+
+Pages are stored in Redis by ``PageCacheMiddleware`` together with tags
+naming the things they show, e.g. ``package:<id>`` for a dataset page or
+``search`` for pages built from search results. Controllers add the tags
+with ``tag_page()``; pages without any tags get the ``other`` tag.
+
+When a session commits, ``CkanCacheExtension`` works out the tags touched
+by the committed objects (``tags_for_objects()``) and only the pages with
+those tags are removed from the cache. Every page also expires after
+``ckan.page_cache_ttl`` seconds, as a backstop for changes that can't be
+traced back to a tag.
+'''
+import logging
+
+from pylons import config
+
+log = logging.getLogger(__name__)
+
+ENVIRON_KEY = 'CKAN_PAGE_CACHE_TAGS'
+
+SEARCH = 'search'
+HOME = 'home'
+OTHER = 'other'
+# Invalidating this tag empties the whole cache
+ALL = 'all'
+
+# Objects with a reference to the dataset(s) they belong to, but without
+# a related_packages() method
+_PACKAGE_ATTRIBUTES = {
+    'ResourceGroup': ['package_id'],
+    'Rating': ['package_id'],
+    'PackageRelationship': ['subject_package_id', 'object_package_id'],
+    'RelatedDataset': ['dataset_id'],
+    'UserFollowingDataset': ['object_id'],
+}
+
+# Objects that are never shown on cachable pages
+_IGNORED_CLASSES = set(['Revision', 'Activity', 'ActivityDetail',
+                        'SearchIndexQueue', 'TaskStatus', 'TrackingSummary'])
+
+
+def ttl():
+    '''Returns the number of seconds cached pages are kept for (0 means
+    until they are invalidated).'''
+    return int(config.get('ckan.page_cache_ttl', 3600))
+
+
+def tag_page(environ, *tags):
+    '''Record that the page being rendered for this request depends on the
+    given tags.'''
+    environ.setdefault(ENVIRON_KEY, set()).update(tags)
+
+
+def package_tags(pkg_dict):
+    '''Returns the tags for a page showing the dataset pkg_dict.'''
+    tags = ['package:%s' % pkg_dict['id'], 'package:%s' % pkg_dict['name']]
+    for group in pkg_dict.get('groups', []):
+        tags.append('group:%s' % group['id'])
+    return tags
+
+
+def group_tags(group_dict):
+    '''Returns the tags for a page showing the group group_dict.'''
+    return ['group:%s' % group_dict['id'], 'group:%s' % group_dict['name']]
+
+
+def tags_for_objects(objs):
+    '''Returns the set of tags touched by changes to the given objects.
+
+    This may load related objects from the database, so it should be
+    called before the session is committed.
+    '''
+    tags = set()
+    for obj in objs:
+        class_name = obj.__class__.__name__
+        if class_name in _IGNORED_CLASSES or class_name.endswith('Revision'):
+            continue
+        # Pages without tags may show anything
+        tags.add(OTHER)
+        if class_name == 'SystemInfo':
+            # Site wide settings like the site title
+            tags.add(ALL)
+        elif class_name == 'Group':
+            tags.update([SEARCH, HOME, 'group:%s' % obj.id,
+                         'group:%s' % obj.name])
+        elif class_name == 'GroupExtra':
+            tags.add('group:%s' % obj.group_id)
+        elif class_name == 'Member':
+            tags.update([SEARCH, 'group:%s' % obj.group_id])
+            if obj.table_name == 'package':
+                tags.add('package:%s' % obj.table_id)
+        elif class_name in ('Tag', 'Vocabulary'):
+            tags.add(SEARCH)
+        elif hasattr(obj, 'related_packages'):
+            # Datasets, resources, dataset tags and extras
+            tags.add(SEARCH)
+            if class_name == 'Package':
+                tags.add(HOME)
+            for package in obj.related_packages():
+                if package:
+                    tags.update(['package:%s' % package.id,
+                                 'package:%s' % package.name])
+        elif class_name in _PACKAGE_ATTRIBUTES:
+            tags.add(SEARCH)
+            for attribute in _PACKAGE_ATTRIBUTES[class_name]:
+                tags.add('package:%s' % getattr(obj, attribute))
+    return tags
+
+
+def _tag_key(tag):
+    return 'tag:%s' % tag
+
+
+def store(connection, key, status, headers, page, tags):
+    '''Store a page in the cache under key, together with its tags.'''
+    expires = ttl()
+    pipe = connection.pipeline()
+    pipe.delete(key)
+    pipe.rpush(key, status)
+    pipe.rpush(key, headers)
+    pipe.rpush(key, page)
+    if expires:
+        pipe.expire(key, expires)
+    for tag in tags or [OTHER]:
+        pipe.sadd(_tag_key(tag), key)
+        if expires:
+            pipe.expire(_tag_key(tag), expires)
+    pipe.execute()
+
+
+def invalidate(connection, tags):
+    '''Remove the pages with any of the given tags from the cache.'''
+    if not tags:
+        return
+    if ALL in tags:
+        connection.flushdb()
+        return
+    tag_keys = [_tag_key(tag) for tag in tags]
+    pipe = connection.pipeline()
+    for tag_key in tag_keys:
+        pipe.smembers(tag_key)
+    keys = set(tag_keys)
+    for members in pipe.execute():
+        keys.update(members)
+    connection.delete(*keys)
+    log.debug('Page cache invalidated %i keys for tags %r' %
+              (len(keys), sorted(tags)))
@@ -3,13 +3,18 @@ from pylons import config, c
 from paste.deploy.converters import asbool
 
 from ckan import model
-from ckan.plugins import SingletonPlugin, implements, IDomainObjectModification
-from ckan.logic import get_action
+from ckan.plugins import (SingletonPlugin, implements,
+                          IDomainObjectModification, ISession)
+from ckan.logic import get_action, NotFound
 import ckan.model.domain_object as domain_object
 
 from common import (SearchIndexError, SearchError, SearchQueryError,
-                    make_connection, is_available, SolrSettings)
-from index import PackageSearchIndex, NoopSearchIndex
+                    make_connection, is_available, SolrSettings,
+                    SolrConnectionPool, solr_connection,
+                    connection_pool_stats)
+from index import (PackageSearchIndex, NoopSearchIndex, commit_window,
+                   current_commit_window,
+                   commit_policy)
 from query import (TagSearchQuery, ResourceSearchQuery, PackageSearchQuery,
                    QueryOptions, convert_legacy_parameters_to_solr)
 
@@ -17,6 +22,8 @@ log = logging.getLogger(__name__)
 
 import sys
 import cgitb
+import time
+import itertools
 import warnings
 
 
@@ -113,6 +120,20 @@ def dispatch_by_operation(entity_type, entity, operation):
 class SynchronousSearchPlugin(SingletonPlugin):
     """Update the search index automatically."""
     implements(IDomainObjectModification, inherit=True)
+    implements(ISession, inherit=True)
+
+    # Inside a commit window, the index updates collected while the
+    # database transaction is committed are only sent once it has been
+    # committed, or dropped if it is rolled back.
+    def after_commit(self, session):
+        window = current_commit_window()
+        if window is not None:
+            window.commit_pending()
+
+    def after_rollback(self, session):
+        window = current_commit_window()
+        if window is not None:
+            window.discard_pending()
 
     def notify(self, entity, operation):
         if not isinstance(entity, model.Package):
@@ -132,7 +153,122 @@ class SynchronousSearchPlugin(SingletonPlugin):
             log.warn("Discarded Sync. indexing for: %s" % entity)
 
 
-def rebuild(package_id=None, only_missing=False, force=False, refresh=False, defer_commit=False):
+class AsynchronousSearchPlugin(SingletonPlugin):
+    """Queue changed datasets to be indexed by the search index worker.
+
+    Instead of updating the search index during the request that changed
+    the dataset, the change is recorded in the search_index_queue table
+    and the index is updated in batches by `paster search-index worker`.
+    """
+    implements(IDomainObjectModification, inherit=True)
+
+    def notify(self, entity, operation):
+        if not isinstance(entity, model.Package):
+            return
+        model.SearchIndexQueue.enqueue(entity.id, operation)
+
+
+def process_queue(batch_size=100):
+    '''
+        Updates the search index with a batch of the datasets queued by
+        the asynchronous search plugin, committing once for the batch.
+
+        Repeated changes of the same dataset are only indexed once. The
+        entries of datasets that could not be indexed stay in the queue and
+        are retried, up to ``ckan.search.queue_max_attempts`` times. Returns
+        the number of queue entries indexed and removed from the queue.
+    '''
+    entries = model.SearchIndexQueue.pending(batch_size,
+                                             _queue_max_attempts())
+    if not entries:
+        return 0
+
+    # The latest operation on each dataset is the one that counts
+    operations = {}
+    package_entries = {}
+    for entry in entries:
+        operations[entry.package_id] = entry.operation
+        package_entries.setdefault(entry.package_id, []).append(entry)
+
+    package_index = index_for(model.Package)
+    pkg_dicts = []
+    failed = set()
+    for pkg_id, operation in operations.iteritems():
+        if operation == domain_object.DomainObjectOperation.deleted:
+            package_index.delete_package({'id': pkg_id}, defer_commit=True)
+            continue
+        try:
+            pkg_dicts.append(get_action('package_show')(
+                {'model': model, 'ignore_auth': True, 'validate': False},
+                {'id': pkg_id}))
+        except NotFound:
+            # The dataset has been purged since it was queued
+            package_index.delete_package({'id': pkg_id}, defer_commit=True)
+        except Exception, e:
+            error = text_traceback()
+            log.error('Error while indexing dataset %s: %s' %
+                      (pkg_id, str(e)))
+            log.error(error)
+            model.SearchIndexQueue.failed(package_entries[pkg_id],
+                                          error.decode('utf-8', 'replace'))
+            failed.add(pkg_id)
+
+    # If Solr fails, all of the entries stay in the queue to be retried
+    package_index.index_packages(pkg_dicts, defer_commit=True)
+    package_index.commit()
+
+    indexed = [entry for entry in entries if entry.package_id not in failed]
+    model.SearchIndexQueue.remove(indexed)
+    model.Session.commit()
+    log.info('Indexed %i queued datasets' % (len(operations) - len(failed)))
+    if failed:
+        log.warning('%i queued datasets could not be indexed' % len(failed))
+    return len(indexed)
+
+
+def _queue_max_attempts():
+    return int(config.get('ckan.search.queue_max_attempts', 5))
+
+
+def failed_queue_entries(package_id=None):
+    '''
+        Returns the queue entries of the datasets the search index worker
+        gave up on after ``ckan.search.queue_max_attempts`` attempts,
+        optionally only the ones of the given dataset id.
+    '''
+    return model.SearchIndexQueue.given_up(_queue_max_attempts(),
+                                           package_id)
+
+
+def retry_failed_queue_entries(package_id=None):
+    '''
+        Makes the search index worker try the failed queue entries (of the
+        given dataset id, or all of them) again. Returns the number of
+        entries.
+    '''
+    entries = failed_queue_entries(package_id)
+    model.SearchIndexQueue.retry(entries)
+    model.Session.commit()
+    log.info('Retrying %i failed queue entries' % len(entries))
+    return len(entries)
+
+
+def purge_failed_queue_entries(package_id=None):
+    '''
+        Deletes the failed queue entries (of the given dataset id, or all of
+        them) from the queue. Returns the number of entries deleted.
+    '''
+    entries = failed_queue_entries(package_id)
+    for entry in entries:
+        log.warning('Purging queue entry %i of dataset %s: %s' %
+                    (entry.id, entry.package_id, entry.error))
+    model.SearchIndexQueue.remove(entries)
+    model.Session.commit()
+    return len(entries)
+
+
+def rebuild(package_id=None, only_missing=False, force=False, refresh=False,
+            defer_commit=False, workers=1, batch_size=1):
     '''
         Rebuilds the search index.
 
@@ -141,6 +277,10 @@ def rebuild(package_id=None, only_missing=False, force=False, refresh=False, def
         datasets not already indexed will be processed. If force equals
         True, if an exception is found, the exception will be logged, but
         the process will carry on.
+
+        If workers is greater than 1, datasets are dictized in a pool of
+        that many processes. If batch_size is greater than 1, datasets are
+        sent to Solr in batches of that size, one request per batch.
     '''
     from ckan import model
     log.info("Rebuilding search index...")
@@ -174,6 +314,13 @@ def rebuild(package_id=None, only_missing=False, force=False, refresh=False, def
             if not refresh:
                 package_index.clear()
 
+        if workers > 1 or batch_size > 1:
+            _rebuild_batched(package_index, list(package_ids), force,
+                             defer_commit, workers, batch_size)
+            model.Session.commit()
+            log.info('Finished rebuilding search index.')
+            return
+
         for pkg_id in package_ids:
             try:
                 package_index.update_dict(
@@ -197,6 +344,79 @@ def rebuild(package_id=None, only_missing=False, force=False, refresh=False, def
     log.info('Finished rebuilding search index.')
 
 
+def _init_rebuild_worker():
+    # Connections inherited from the parent process can't be shared, so
+    # make sure each worker opens its own.
+    model.Session.remove()
+    model.meta.engine.dispose()
+
+
+def _dictize_packages(package_ids):
+    '''Return a (pkg_dicts, errors) tuple for the given dataset ids.
+
+    Runs in the rebuild worker processes, so errors are returned as
+    (package id, traceback) pairs rather than raised.
+    '''
+    context = {'model': model, 'ignore_auth': True, 'validate': False}
+    pkg_dicts = []
+    errors = []
+    for pkg_id in package_ids:
+        try:
+            pkg_dicts.append(get_action('package_show')(dict(context),
+                                                        {'id': pkg_id}))
+        except Exception, e:
+            errors.append((pkg_id, '%s\n%s' % (e, text_traceback())))
+    model.Session.remove()
+    return pkg_dicts, errors
+
+
+def _rebuild_batched(package_index, package_ids, force, defer_commit,
+                     workers, batch_size):
+    batches = [package_ids[i:i + batch_size]
+               for i in range(0, len(package_ids), batch_size)]
+    total = len(package_ids)
+
+    if workers > 1:
+        import multiprocessing
+        # Flush any pending work and release the connections before forking
+        model.Session.commit()
+        model.Session.remove()
+        model.meta.engine.dispose()
+        pool = multiprocessing.Pool(workers, _init_rebuild_worker)
+        results = pool.imap(_dictize_packages, batches)
+    else:
+        pool = None
+        results = itertools.imap(_dictize_packages, batches)
+
+    done = 0
+    start = time.time()
+    try:
+        for pkg_dicts, errors in results:
+            for pkg_id, error in errors:
+                log.error('Error while indexing dataset %s: %s' %
+                          (pkg_id, error))
+            if errors and not force:
+                raise SearchIndexError('Error while indexing dataset %s' %
+                                       errors[0][0])
+            try:
+                package_index.index_packages(pkg_dicts, defer_commit)
+            except Exception, e:
+                log.error('Error while indexing datasets %s: %s' %
+                          (', '.join(p['id'] for p in pkg_dicts), str(e)))
+                if not force:
+                    raise
+                log.error(text_traceback())
+
+            done += len(pkg_dicts) + len(errors)
+            elapsed = time.time() - start
+            log.info('Indexed %i/%i datasets (%.1f datasets/s)' %
+                     (done, total, done / elapsed if elapsed else 0))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
 def commit():
     package_index = index_for(model.Package)
     package_index.commit()
@@ -1,4 +1,10 @@
+import os
+import time
+import threading
+import contextlib
+
 from pylons import config
+from paste.deploy.converters import asbool
 import logging
 log = logging.getLogger(__name__)
 
@@ -32,6 +38,8 @@ class SolrSettings(object):
         else:
             cls._url = DEFAULT_SOLR_URL
         cls._is_initialised = True
+        # Pooled connections may point to the previous server
+        SolrConnectionPool.reset()
 
     @classmethod
     def get(cls):
@@ -47,14 +55,11 @@ def is_available():
     Return true if we can successfully connect to Solr.
     """
     try:
-        conn = make_connection()
-        conn.query("*:*", rows=1)
+        with solr_connection() as conn:
+            conn.query("*:*", rows=1)
     except Exception, e:
         log.exception(e)
         return False
-    finally:
-        if 'conn' in dir():
-            conn.close()
 
     return True
 
@@ -68,3 +73,137 @@ def make_connection():
                               http_pass=solr_password)
     else:
         return SolrConnection(solr_url)
+
+
+class SolrConnectionPool(object):
+    '''
+    A thread-safe pool of persistent connections to Solr, so requests
+    don't need to open a new HTTP connection each time.
+
+    There is one pool per process, configured with:
+
+    ckan.search.solr_pool_size - maximum number of idle connections kept
+        open (default 5, 0 disables pooling)
+    ckan.search.solr_pool_idle_timeout - seconds after which an idle
+        connection is closed instead of reused (default 60)
+    ckan.search.solr_pool_health_check - if true, check that pooled
+        connections still work before reusing them (default false)
+    '''
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, size=5, idle_timeout=60, health_check=False):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    @classmethod
+    def get(cls):
+        '''Return the pool for the current process.'''
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(
+                    size=int(config.get('ckan.search.solr_pool_size', 5)),
+                    idle_timeout=float(config.get(
+                        'ckan.search.solr_pool_idle_timeout', 60)),
+                    health_check=asbool(config.get(
+                        'ckan.search.solr_pool_health_check', False)))
+            return cls._instance
+
+    @classmethod
+    def reset(cls):
+        '''Close all pooled connections and discard the pool.'''
+        with cls._instance_lock:
+            if cls._instance is not None:
+                cls._instance.clear()
+            cls._instance = None
+
+    def acquire(self):
+        '''Return a pooled connection, or a new one if none is idle.'''
+        conn = None
+        with self._lock:
+            self._check_pid()
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if time.time() - last_used <= self.idle_timeout:
+                    self.hits += 1
+                    break
+                conn.close()
+                self.discarded += 1
+                conn = None
+            else:
+                self.misses += 1
+
+        if conn is not None and self.health_check:
+            try:
+                conn.query('*:*', rows=0)
+            except Exception, e:
+                log.debug('Discarding broken Solr connection: %r' % e)
+                conn.close()
+                conn = None
+                with self._lock:
+                    self.discarded += 1
+
+        if conn is None:
+            conn = make_connection()
+        return conn
+
+    def release(self, conn):
+        '''Return a connection to the pool, closing it if the pool is full.'''
+        with self._lock:
+            self._check_pid()
+            if len(self._idle) < self.size:
+                self._idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, last_used in idle:
+            conn.close()
+
+    def stats(self):
+        '''Return the pool counters as a dict.'''
+        with self._lock:
+            return {'size': self.size,
+                    'idle': len(self._idle),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'discarded': self.discarded}
+
+    def _check_pid(self):
+        # Connections opened by a parent process can't be shared with a
+        # forked child, so just forget about them.
+        if self._pid != os.getpid():
+            self._idle = []
+            self._pid = os.getpid()
+
+
+@contextlib.contextmanager
+def solr_connection():
+    '''
+    Context manager that provides a connection from the process-wide pool
+    and returns it to the pool afterwards. Connections on which an error
+    happened are closed rather than reused.
+    '''
+    pool = SolrConnectionPool.get()
+    conn = pool.acquire()
+    try:
+        yield conn
+    except:
+        conn.close()
+        raise
+    else:
+        pool.release(conn)
+
+
+def connection_pool_stats():
+    '''Return the hit/miss counters of the Solr connection pool.'''
+    return SolrConnectionPool.get().stats()
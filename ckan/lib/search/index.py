@@ -1,14 +1,17 @@
+import sys
 import socket
 import string
 import logging
 import collections
+import contextlib
+import threading
 import json
 
 import re
 
 from pylons import config
 
-from common import SearchIndexError, make_connection
+from common import SearchIndexError, solr_connection
 from ckan.model import PackageRelationship
 import ckan.model as model
 from ckan.plugins import (PluginImplementations,
@@ -37,23 +40,185 @@ def escape_xml_illegal_chars(val, replacement=''):
     return _illegal_xml_chars_re.sub(replacement, val)
 
 
+# Arguments of solrpy's commit() used for each of the
+# ckan.search.commit_policy options (None means no commit)
+COMMIT_POLICIES = {
+    'hard': {'wait_flush': True, 'wait_searcher': True},
+    'nowait': {'wait_flush': False, 'wait_searcher': False},
+    'none': None,
+}
+
+# Maximum number of datasets deleted with each delete query
+DELETE_BATCH_SIZE = 100
+
+_local = threading.local()
+
+
+def commit_policy():
+    '''
+        Returns the keyword arguments of solrpy's commit() used to commit
+        changes to the index, according to the ckan.search.commit_policy
+        option ('hard', 'nowait' or 'none', default is 'hard'), or None if
+        committing is left to Solr's autoCommit settings.
+    '''
+    policy = config.get('ckan.search.commit_policy', 'hard')
+    if policy not in COMMIT_POLICIES:
+        raise SearchIndexError('Unknown search commit policy: %s' % policy)
+    return COMMIT_POLICIES[policy]
+
+
+def _delete_query(pkg_ids):
+    ids = ' OR '.join('id:"%s" OR name:"%s"' % (pkg_id, pkg_id)
+                      for pkg_id in pkg_ids)
+    return "+%s:%s +(%s) +site_id:\"%s\"" % (TYPE_FIELD, PACKAGE_TYPE, ids,
+                                            config.get('ckan.site_id'))
+
+
+def send_updates(docs=(), delete_ids=(), commit=True):
+    '''
+        Sends documents to add and dataset ids to delete to Solr, committing
+        the changes according to the commit policy if commit is True.
+    '''
+    delete_ids = list(delete_ids)
+    commit_args = commit_policy() if commit else None
+
+    try:
+        with solr_connection() as conn:
+            for i in range(0, len(delete_ids), DELETE_BATCH_SIZE):
+                conn.delete_query(
+                    _delete_query(delete_ids[i:i + DELETE_BATCH_SIZE]))
+            if docs:
+                # A hard commit can be made in the same request
+                hard_commit = commit_args == COMMIT_POLICIES['hard']
+                conn.add_many(docs, _commit=hard_commit)
+                if hard_commit:
+                    commit_args = None
+            if commit_args is not None:
+                conn.commit(**commit_args)
+    except Exception, e:
+        log.exception(e)
+        raise SearchIndexError(e)
+
+
+class CommitWindow(object):
+    '''
+        Collects the changes made to the search index while it is open, so
+        they can be sent to Solr together with a single commit.
+
+        Changes are only sent once the database transaction that made them
+        has been committed, and are dropped if it is rolled back (see
+        SynchronousSearchPlugin). Committed changes are sent (without
+        committing them in Solr) whenever there are more than `size` of
+        them, to keep memory use bounded.
+    '''
+    def __init__(self, size=100):
+        self.size = size
+        # changes made by the current database transaction
+        self._pending = {}
+        # changes made by committed transactions, waiting to be sent
+        self._committed = {}
+        # whether changes were sent to Solr without committing them
+        self._uncommitted = False
+
+    def add(self, docs=(), delete_ids=()):
+        for doc in docs:
+            self._pending[doc['id']] = doc
+        for pkg_id in delete_ids:
+            self._pending[pkg_id] = None
+
+    def commit_pending(self):
+        '''Called when the database transaction has been committed, so its
+        changes can be sent.'''
+        self._committed.update(self._pending)
+        self._pending = {}
+        if len(self._committed) >= self.size:
+            try:
+                self._send(commit=False)
+            except SearchIndexError, e:
+                # The changes are kept and sent again by flush(), which
+                # raises the error if it happens again
+                log.error('Could not update the search index: %s' % e)
+
+    def discard_pending(self):
+        '''Called when the database transaction has been rolled back.'''
+        self._pending = {}
+
+    def flush(self, commit=True):
+        '''Send the changes made by committed transactions.'''
+        if self._committed or (commit and self._uncommitted):
+            self._send(commit)
+
+    def _send(self, commit):
+        docs = [doc for doc in self._committed.values() if doc is not None]
+        delete_ids = [pkg_id for pkg_id, doc in self._committed.items()
+                      if doc is None]
+        send_updates(docs, delete_ids, commit)
+        self._committed = {}
+        self._uncommitted = not commit
+
+
+def current_commit_window():
+    '''Returns the commit window open in this thread, if any.'''
+    return getattr(_local, 'window', None)
+
+
+@contextlib.contextmanager
+def commit_window(size=None):
+    '''
+        Context manager for code that changes many datasets, like bulk
+        actions and CLI commands. The changes to the search index made
+        inside it are sent to Solr with a single commit by the window's
+        flush() method, or when the window is closed. Nested windows are
+        merged into the outermost one.
+
+        Only the changes of committed database transactions are sent, so
+        errors sending them are raised after the database commit. If an
+        exception is raised inside the window the committed changes are
+        still sent, and the changes of the transaction in progress are
+        dropped.
+    '''
+    window = current_commit_window()
+    if window is not None:
+        yield window
+        return
+
+    if size is None:
+        size = int(config.get('ckan.search.commit_window_size', 100))
+    window = CommitWindow(size)
+    _local.window = window
+    try:
+        yield window
+    except:
+        _local.window = None
+        if window._pending:
+            log.warning('Discarded %i search index updates of an '
+                        'uncommitted transaction' % len(window._pending))
+        exc_info = sys.exc_info()
+        try:
+            window.flush()
+        except SearchIndexError, e:
+            # Don't hide the original exception
+            log.error('Could not update the search index: %s' % e)
+        raise exc_info[0], exc_info[1], exc_info[2]
+    _local.window = None
+    window.flush()
+
+
 def clear_index():
     import solr.core
-    conn = make_connection()
     query = "+site_id:\"%s\"" % (config.get('ckan.site_id'))
-    try:
-        conn.delete_query(query)
-        conn.commit()
-    except socket.error, e:
-        err = 'Could not connect to SOLR %r: %r' % (conn.url, e)
-        log.error(err)
-        raise SearchIndexError(err)
-    except solr.core.SolrException, e:
-        err = 'SOLR %r exception: %r' % (conn.url, e)
-        log.error(err)
-        raise SearchIndexError(err)
-    finally:
-        conn.close()
+    with solr_connection() as conn:
+        try:
+            conn.delete_query(query)
+            conn.commit()
+        except socket.error, e:
+            err = 'Could not connect to SOLR %r: %r' % (conn.url, e)
+            log.error(err)
+            raise SearchIndexError(err)
+        except solr.core.SolrException, e:
+            err = 'SOLR %r exception: %r' % (conn.url, e)
+            log.error(err)
+            raise SearchIndexError(err)
 
 class SearchIndex(object):
     """
@@ -89,6 +254,13 @@ class SearchIndex(object):
 class NoopSearchIndex(SearchIndex): pass
 
 class PackageSearchIndex(SearchIndex):
+    def __init__(self):
+        super(PackageSearchIndex, self).__init__()
+        # Names of vocabularies and related datasets, looked up at most once
+        # for as long as this index is used (e.g. a whole rebuild)
+        self._vocabulary_names = {}
+        self._package_names = {}
+
     def remove_dict(self, pkg_dict):
         self.delete_package(pkg_dict)
 
@@ -98,6 +270,46 @@ class PackageSearchIndex(SearchIndex):
     def index_package(self, pkg_dict, defer_commit=False):
         if pkg_dict is None:
             return
+
+        if (not pkg_dict.get('state')) or ('active' not in pkg_dict.get('state')):
+            return self.delete_package(pkg_dict, defer_commit)
+
+        self._load_names([pkg_dict])
+        pkg_dict = self.build_document(pkg_dict)
+
+        # send to solr:
+        self._send(docs=[pkg_dict], defer_commit=defer_commit)
+
+        commit_debug_msg = 'Not commited yet' if defer_commit else 'Commited'
+        log.debug('Updated index for %s [%s]' % (pkg_dict.get('name'), commit_debug_msg))
+
+    def index_packages(self, pkg_dicts, defer_commit=False):
+        '''Index a batch of datasets with a single request to Solr.
+
+        Datasets that are not active are removed from the index instead.
+        '''
+        docs = []
+        delete_ids = []
+        pkg_dicts = [pkg_dict for pkg_dict in pkg_dicts if pkg_dict is not None]
+        self._load_names(pkg_dicts)
+        for pkg_dict in pkg_dicts:
+            if pkg_dict is None:
+                continue
+            if (not pkg_dict.get('state')) or ('active' not in pkg_dict.get('state')):
+                delete_ids.append(pkg_dict.get('id'))
+                continue
+            docs.append(self.build_document(pkg_dict))
+
+        if not docs and not delete_ids:
+            return
+
+        self._send(docs, delete_ids, defer_commit)
+
+        commit_debug_msg = 'Not commited yet' if defer_commit else 'Commited'
+        log.debug('Updated index for %i datasets [%s]' % (len(docs), commit_debug_msg))
+
+    def build_document(self, pkg_dict):
+        '''Return the Solr document for the (active) dataset pkg_dict.'''
         pkg_dict['data_dict'] = json.dumps(pkg_dict)
 
         # add to string field for sorting
@@ -105,9 +317,6 @@ class PackageSearchIndex(SearchIndex):
         if title:
             pkg_dict['title_string'] = title
 
-        if (not pkg_dict.get('state')) or ('active' not in pkg_dict.get('state')):
-            return self.delete_package(pkg_dict)
-
         index_fields = RESERVED_FIELDS + pkg_dict.keys()
 
         # include the extras in the main namespace
@@ -126,13 +335,10 @@ class PackageSearchIndex(SearchIndex):
         # vocab_<tag name> so that they can be used in facets
         non_vocab_tag_names = []
         tags = pkg_dict.pop('tags', [])
-        context = {'model': model}
 
         for tag in tags:
             if tag.get('vocabulary_id'):
-                data = {'id': tag['vocabulary_id']}
-                vocab = logic.get_action('vocabulary_show')(context, data)
-                key = u'vocab_%s' % vocab['name']
+                key = u'vocab_%s' % self._vocabulary_name(tag['vocabulary_id'])
                 if key in pkg_dict:
                     pkg_dict[key].append(tag['name'])
                 else:
@@ -174,10 +380,10 @@ class PackageSearchIndex(SearchIndex):
         objects = pkg_dict.pop("relationships_as_object", [])
         for rel in objects:
             type = model.PackageRelationship.forward_to_reverse_type(rel['type'])
-            rel_dict[type].append(model.Package.get(rel['subject_package_id']).name)
+            rel_dict[type].append(self._package_name(rel['subject_package_id']))
         for rel in subjects:
             type = rel['type']
-            rel_dict[type].append(model.Package.get(rel['object_package_id']).name)
+            rel_dict[type].append(self._package_name(rel['object_package_id']))
         for key, value in rel_dict.iteritems():
             if key not in pkg_dict:
                 pkg_dict[key] = value
@@ -219,41 +425,61 @@ class PackageSearchIndex(SearchIndex):
 
         assert pkg_dict, 'Plugin must return non empty package dict on index'
 
-        # send to solr:
-        try:
-            conn = make_connection()
-            commit = not defer_commit
-            conn.add_many([pkg_dict], _commit=commit)
-        except Exception, e:
-            log.exception(e)
-            raise SearchIndexError(e)
-        finally:
-            conn.close()
-
-        commit_debug_msg = 'Not commited yet' if defer_commit else 'Commited'
-        log.debug('Updated index for %s [%s]' % (pkg_dict.get('name'), commit_debug_msg))
+        return pkg_dict
+
+    def _load_names(self, pkg_dicts):
+        '''Looks up the names of the vocabularies and related datasets
+        referenced by pkg_dicts that are not known yet, with a query for
+        each.'''
+        vocab_ids = set()
+        package_ids = set()
+        for pkg_dict in pkg_dicts:
+            for tag in pkg_dict.get('tags', []):
+                if tag.get('vocabulary_id'):
+                    vocab_ids.add(tag['vocabulary_id'])
+            for rel in pkg_dict.get('relationships_as_subject', []):
+                package_ids.add(rel['object_package_id'])
+            for rel in pkg_dict.get('relationships_as_object', []):
+                package_ids.add(rel['subject_package_id'])
+
+        vocab_ids -= set(self._vocabulary_names)
+        if vocab_ids:
+            query = model.Session.query(model.Vocabulary.id,
+                                        model.Vocabulary.name)
+            query = query.filter(model.Vocabulary.id.in_(vocab_ids))
+            self._vocabulary_names.update(query.all())
+
+        package_ids -= set(self._package_names)
+        if package_ids:
+            query = model.Session.query(model.Package.id, model.Package.name)
+            query = query.filter(model.Package.id.in_(package_ids))
+            self._package_names.update(query.all())
+
+    def _vocabulary_name(self, vocabulary_id):
+        if vocabulary_id not in self._vocabulary_names:
+            vocab = logic.get_action('vocabulary_show')(
+                {'model': model}, {'id': vocabulary_id})
+            self._vocabulary_names[vocabulary_id] = vocab['name']
+        return self._vocabulary_names[vocabulary_id]
+
+    def _package_name(self, package_id):
+        if package_id not in self._package_names:
+            self._package_names[package_id] = \
+                model.Package.get(package_id).name
+        return self._package_names[package_id]
 
     def commit(self):
-        try:
-            conn = make_connection()
-            conn.commit(wait_flush=False, wait_searcher=False)
-        except Exception, e:
-            log.exception(e)
-            raise SearchIndexError(e)
-        finally:
-            conn.close()
-
-
-    def delete_package(self, pkg_dict):
-        conn = make_connection()
-        query = "+%s:%s (+id:\"%s\" OR +name:\"%s\") +site_id:\"%s\"" % (TYPE_FIELD, PACKAGE_TYPE,
-                                                       pkg_dict.get('id'), pkg_dict.get('id'),
-                                                       config.get('ckan.site_id'))
-        try:
-            conn.delete_query(query)
-            conn.commit()
-        except Exception, e:
-            log.exception(e)
-            raise SearchIndexError(e)
-        finally:
-            conn.close()
+        '''Commit the changes sent so far, according to the commit
+        policy.'''
+        send_updates(commit=True)
+
+
+    def delete_package(self, pkg_dict, defer_commit=False):
+        self._send(delete_ids=[pkg_dict.get('id')], defer_commit=defer_commit)
+
+    def _send(self, docs=(), delete_ids=(), defer_commit=False):
+        window = current_commit_window()
+        if window is not None:
+            window.add(docs, delete_ids)
+        else:
+            send_updates(docs, delete_ids, commit=not defer_commit)
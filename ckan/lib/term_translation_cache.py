@@ -0,0 +1,87 @@
+'''
+Process-wide cache of term translations.
+
+The multilingual extension translates every string of every dataset, group
+and tag it shows, which would otherwise need a large ``term_translation``
+query per dataset. The cache maps each term to all of its translations
+(``{lang_code: translation}``) and keeps at most
+``ckan.term_translation_cache_size`` terms (default 10000), dropping the
+least recently used ones first. Terms are removed from the cache when their
+translations are updated in this process, and entries expire after
+``ckan.term_translation_cache_timeout`` seconds (default 60) so changes made
+by other processes are picked up too.
+'''
+import time
+import threading
+
+from pylons import config
+
+import ckan.model as model
+
+try:
+    from collections import OrderedDict  # from python 2.7
+except ImportError:
+    from sqlalchemy.util import OrderedDict
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _size():
+    return int(config.get('ckan.term_translation_cache_size', 10000))
+
+
+def _timeout():
+    return float(config.get('ckan.term_translation_cache_timeout', 60))
+
+
+def get_translations(terms):
+    '''Return the translations of the given terms into all languages.
+
+    Returns a dict mapping each term to a dict of its translations keyed by
+    language code. Terms without translations are mapped to an empty dict.
+    All the terms missing from the cache are loaded with a single query.
+    '''
+    now = time.time()
+    timeout = _timeout()
+    translations = {}
+    missing = set()
+    with _lock:
+        for term in terms:
+            if not isinstance(term, basestring) or term in translations:
+                continue
+            cached = _cache.pop(term, None)
+            if cached and now - cached[1] < timeout:
+                # re-insert to mark it as the most recently used
+                _cache[term] = cached
+                translations[term] = cached[0]
+            else:
+                missing.add(term)
+
+    if missing:
+        trans_table = model.term_translation_table
+        query = trans_table.select().where(
+            trans_table.c.term.in_(list(missing)))
+        found = dict((term, {}) for term in missing)
+        for row in model.Session.execute(query):
+            found[row['term']][row['lang_code']] = row['term_translation']
+        size = _size()
+        with _lock:
+            for term, term_translations in found.iteritems():
+                translations[term] = term_translations
+                _cache[term] = (term_translations, now)
+            while len(_cache) > size:
+                # sqlalchemy's OrderedDict has no popitem(last=False)
+                del _cache[next(iter(_cache))]
+
+    return translations
+
+
+def clear(terms=None):
+    '''Remove the given terms, or all terms, from the cache.'''
+    with _lock:
+        if terms is None:
+            _cache.clear()
+        else:
+            for term in terms:
+                _cache.pop(term, None)
@@ -12,10 +12,13 @@ import ckan.logic.schema
 import ckan.lib.dictization.model_dictize as model_dictize
 import ckan.lib.dictization.model_save as model_save
 import ckan.lib.navl.dictization_functions
+import ckan.lib.search as search
 import ckan.logic.auth as auth
 
 # FIXME this looks nasty and should be shared better
-from ckan.logic.action.update import _update_package_relationship
+from ckan.logic.action.update import (_update_package_relationship,
+                                      _commit_many, _get_many_data,
+                                      _authorization_error)
 
 log = logging.getLogger(__name__)
 
@@ -27,6 +30,7 @@ _check_access = logic.check_access
 _get_action = logic.get_action
 ValidationError = logic.ValidationError
 NotFound = logic.NotFound
+NotAuthorized = logic.NotAuthorized
 _get_or_bust = logic.get_or_bust
 
 def package_create(context, data_dict):
@@ -186,9 +190,113 @@ def package_create_validate(context, data_dict):
     else:
         return data
 
+def package_create_many(context, data_dict):
+    '''Create many datasets (packages) at once.
+
+    All of the valid datasets are saved in a single revision and committed
+    together, and the search index is updated for all of them in one batch
+    at the end. Invalid datasets and datasets that you are not authorized
+    to create are skipped, their errors are returned instead of being
+    raised.
+
+    :param data: the datasets to create, for the format of dataset
+        dictionaries see ``package_create()``; at most
+        ``ckan.api.bulk_max_datasets`` (default 100)
+    :type data: list of dictionaries
+
+    :returns: one dictionary for each of the given datasets, in the same
+        order, with key ``'success'`` and either the ``'id'`` of the new
+        dataset or the ``'error'`` dictionary. If the datasets were saved
+        but couldn't be indexed, the new datasets also have
+        ``'index_error'`` set to ``True``
+    :rtype: list of dictionaries
+
+    '''
+    model = context['model']
+    user = context['user']
+
+    datasets = _get_many_data(data_dict, 'package_create_many')
+
+    model.Session.remove()
+    model.Session()._context = context
+
+    admins = []
+    if user:
+        admins = [model.User.by_name(user.decode('utf8'))]
+
+    rev = None
+    results = []
+    for pkg_dict in datasets:
+        # The validators and package_dict_save look at context['package'],
+        # so every dataset gets a context of its own
+        item_context = dict(context)
+        item_context.pop('package', None)
+
+        package_plugin = lib_plugins.lookup_package_plugin(pkg_dict.get('type'))
+        try:
+            schema = package_plugin.form_to_db_schema_options({'type':'create',
+                                               'api':'api_version' in context,
+                                               'context': item_context})
+        except AttributeError:
+            schema = package_plugin.form_to_db_schema()
+
+        try:
+            _check_access('package_create', item_context, pkg_dict)
+        except NotAuthorized, e:
+            results.append({'success': False,
+                            'error': _authorization_error(e)})
+            continue
+
+        if 'api_version' not in context:
+            try:
+                package_plugin.check_data_dict(pkg_dict, schema)
+            except TypeError:
+                package_plugin.check_data_dict(pkg_dict)
+
+        data, errors = _validate(pkg_dict, schema, item_context)
+        if errors:
+            log.debug('package_create_many validate_errs=%r package=%s',
+                      errors, data.get('name'))
+            results.append({'success': False, 'error': errors})
+            continue
+
+        if rev is None:
+            rev = model.repo.new_revision()
+            rev.author = user
+            if 'message' in context:
+                rev.message = context['message']
+            else:
+                rev.message = _(u'REST API: Create many objects')
+
+        pkg = model_save.package_dict_save(data, item_context)
+        model.setup_default_user_roles(pkg, admins)
+        # Later datasets in the list are validated against this one (e.g.
+        # for unique names), and extensions need to know the package id
+        model.Session.flush()
+
+        for item in plugins.PluginImplementations(plugins.IPackageController):
+            item.create(pkg)
+
+        results.append({'success': True, 'id': pkg.id})
+
+    if rev is None:
+        model.Session.rollback()
+    elif not context.get('defer_commit'):
+        _commit_many(model, results)
+
+    log.debug('Created %i objects' %
+              len([r for r in results if r['success']]))
+
+    return results
+
 def resource_create(context, data_dict):
     '''Appends a new resource to a datasets list of resources.
 
+    The resource is validated against the resources part of the dataset's
+    schema, which plugins may change depending on the dataset's type (see
+    the ``IDatasetForm`` plugin interface), and ``IPackageController``
+    plugins are notified that the dataset has been edited.
+
     :param package_id: id of package that the resource needs should be added to.
     :type package_id: string
     :param url: url of resource
@@ -234,21 +342,53 @@ def resource_create(context, data_dict):
     package_id = _get_or_bust(data_dict, 'package_id')
     data_dict.pop('package_id')
 
-    pkg_dict = _get_action('package_show')(context, {'id': package_id})
+    pkg = model.Package.get(package_id)
+    if not pkg:
+        raise NotFound(_('Dataset was not found.'))
 
+    _check_access('package_show', context, {'id': pkg.id})
     _check_access('resource_create', context, data_dict)
+    _check_access('package_update', context, {'id': pkg.id})
+
+    # Only the new resource is validated and saved, rather than updating the
+    # whole dataset. The dataset is still reindexed and gets a "changed
+    # package" activity as the resource is one of its related objects.
+    schema = context.get('schema')
+    if not schema:
+        package_plugin = lib_plugins.lookup_package_plugin(pkg.type)
+        try:
+            package_schema = package_plugin.form_to_db_schema_options({
+                'type': 'update',
+                'api': 'api_version' in context,
+                'context': context})
+        except AttributeError:
+            package_schema = package_plugin.form_to_db_schema()
+        schema = dict(package_schema['resources'])
+        # The position is given by appending the resource
+        schema.pop('position', None)
+    data, errors = _validate(data_dict, schema, context)
+    if errors:
+        model.Session.rollback()
+        raise ValidationError(errors)
 
-    if not 'resources' in pkg_dict:
-        pkg_dict['resources'] = []
-    pkg_dict['resources'].append(data_dict)
+    rev = model.repo.new_revision()
+    rev.author = user
+    if 'message' in context:
+        rev.message = context['message']
+    else:
+        rev.message = _(u'REST API: Create object %s') % data.get("name", "")
 
-    try:
-        pkg_dict = _get_action('package_update')(context, pkg_dict)
-    except ValidationError, e:
-        errors = e.error_dict['resources'][-1]
-        raise ValidationError(errors)
+    resource = model_save.resource_dict_save(data, context)
+    pkg.resource_groups_all[0].resources_all.append(resource)
+    # Needed for the resource to get its id
+    model.Session.flush()
+
+    for item in plugins.PluginImplementations(plugins.IPackageController):
+        item.edit(pkg)
 
-    return pkg_dict['resources'][-1]
+    if not context.get('defer_commit'):
+        model.repo.commit()
+    return model_dictize.resource_dictize(resource, context)
 
 
 def related_create(context, data_dict):
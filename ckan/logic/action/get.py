@@ -16,8 +16,10 @@ import ckan.lib.navl.dictization_functions
 import ckan.model.misc as misc
 import ckan.plugins as plugins
 import ckan.lib.search as search
+import ckan.lib.group_cache as group_cache
 import ckan.lib.plugins as lib_plugins
 import ckan.lib.activity_streams as activity_streams
+import ckan.lib.helpers
 
 log = logging.getLogger('ckan.logic')
 
@@ -40,14 +42,7 @@ _func = sqlalchemy.func
 _desc = sqlalchemy.desc
 _case = sqlalchemy.case
 _text = sqlalchemy.text
-
-def _package_list_with_resources(context, package_revision_list):
-    package_list = []
-    model = context["model"]
-    for package in package_revision_list:
-        result_dict = model_dictize.package_dictize(package,context)
-        package_list.append(result_dict)
-    return package_list
+_date_str_to_datetime = ckan.lib.helpers.date_str_to_datetime
 
 def site_read(context,data_dict=None):
     '''Return ``True``.
@@ -58,24 +53,66 @@ def site_read(context,data_dict=None):
     _check_access('site_read',context,data_dict)
     return True
 
+def _get_limit(data_dict):
+    '''Return the ``limit`` param of a list action as an int, or None.'''
+    if not data_dict.has_key('limit'):
+        return None
+    try:
+        limit = int(data_dict['limit'])
+    except ValueError, e:
+        raise logic.ParameterError("'limit' should be an int")
+    return max(limit, 0)
+
+def _get_non_negative_int(data_dict, key):
+    '''Return the ``key`` param of an action as an int, or None if it isn't
+    given.
+
+    Raise ParameterError if it isn't an int, or if it is negative.
+
+    '''
+    if data_dict.get(key) in (None, ''):
+        return None
+    try:
+        value = int(data_dict[key])
+    except (ValueError, TypeError), e:
+        raise logic.ParameterError("'%s' should be an int" % key)
+    if value < 0:
+        raise logic.ParameterError("'%s' should not be negative" % key)
+    return value
+
 def package_list(context, data_dict):
     '''Return a list of the names of the site's datasets (packages).
 
+    The list is sorted by name (by id with API version 2).
+
+    :param limit: if given, the list of datasets will be broken into pages of
+        at most ``limit`` datasets per page and only one page will be returned
+        at a time (optional)
+    :type limit: int
+    :param since: only return the datasets that come after this one in the
+        list, e.g. the last one of the previous page (optional)
+    :type since: string
+
     :rtype: list of strings
 
     '''
     model = context["model"]
     api = context.get("api_version", 1)
-    ref_package_by = 'id' if api == 2 else 'name'
+    limit = _get_limit(data_dict)
+    since = data_dict.get('since')
 
     _check_access('package_list', context, data_dict)
 
-    query = model.Session.query(model.PackageRevision)
-    query = query.filter(model.PackageRevision.state=='active')
-    query = query.filter(model.PackageRevision.current==True)
-
-    packages = query.all()
-    return [getattr(p, ref_package_by) for p in packages]
+    # Only the names (or ids) are needed, so don't load the packages.
+    package_table = model.package_table
+    column = package_table.c.id if api == 2 else package_table.c.name
+    query = _select([column]).where(package_table.c.state == 'active')
+    if since:
+        query = query.where(column > since)
+    query = query.order_by(column)
+    if limit is not None:
+        query = query.limit(limit)
+    return [row[0] for row in model.Session.execute(query)]
 
 def current_package_list_with_resources(context, data_dict):
     '''Return a list of the site's datasets (packages) and their resources.
@@ -88,34 +125,47 @@ def current_package_list_with_resources(context, data_dict):
     :type limit: int
     :param page: when ``limit`` is given, which page to return
     :type page: int
+    :param since_timestamp: instead of ``page``, only return the datasets
+        that come after the one with this ``revision_timestamp`` and
+        ``since_id`` in the list, e.g. the last one of the previous page.
+        Unlike ``page`` this is as fast for the last page as for the first
+        one (optional)
+    :type since_timestamp: string
+    :param since_id: the id of the dataset given by ``since_timestamp``
+    :type since_id: string
 
     :rtype: list of dictionaries
 
     '''
     model = context["model"]
-    if data_dict.has_key('limit'):
-        try:
-            limit = int(data_dict['limit'])
-            if limit < 0:
-                limit = 0
-        except ValueError, e:
-            raise logic.ParameterError("'limit' should be an int")
-    else:
-        limit = None
+    limit = _get_limit(data_dict)
     page = int(data_dict.get('page', 1))
+    since_timestamp = data_dict.get('since_timestamp')
+    if since_timestamp:
+        since_id = _get_or_bust(data_dict, 'since_id')
+        try:
+            since_timestamp = _date_str_to_datetime(since_timestamp)
+        except (ValueError, TypeError):
+            raise logic.ParameterError("'since_timestamp' should be a date")
 
     _check_access('current_package_list_with_resources', context, data_dict)
 
-    query = model.Session.query(model.PackageRevision)
-    query = query.filter(model.PackageRevision.state=='active')
-    query = query.filter(model.PackageRevision.current==True)
-
-    query = query.order_by(model.package_revision_table.c.revision_timestamp.desc())
+    package_rev = model.package_revision_table
+    query = _select([package_rev.c.id]).where(_and_(
+        package_rev.c.state == 'active', package_rev.c.current == True))
+    if since_timestamp:
+        query = query.where(_or_(
+            package_rev.c.revision_timestamp < since_timestamp,
+            _and_(package_rev.c.revision_timestamp == since_timestamp,
+                  package_rev.c.id < since_id)))
+    query = query.order_by(package_rev.c.revision_timestamp.desc(),
+                           package_rev.c.id.desc())
     if limit is not None:
         query = query.limit(limit)
-        query = query.offset((page-1)*limit)
-    pack_rev = query.all()
-    return _package_list_with_resources(context, pack_rev)
+        if not since_timestamp:
+            query = query.offset((page-1)*limit)
+    package_ids = [row[0] for row in model.Session.execute(query)]
+    return model_dictize.package_dictize_many(package_ids, context)
 
 def revision_list(context, data_dict):
     '''Return a list of the IDs of the site's revisions.
@@ -473,6 +523,11 @@ def user_list(context, data_dict):
     :param order_by: which field to sort the list by (optional, default:
       ``'name'``)
     :type order_by: string
+    :param limit: the maximum number of users to return (optional)
+    :type limit: int
+    :param offset: the number of users to skip, for paging through the list
+      (optional)
+    :type offset: int
 
     :rtype: list of dictionaries
 
@@ -484,6 +539,8 @@ def user_list(context, data_dict):
 
     q = data_dict.get('q','')
     order_by = data_dict.get('order_by','name')
+    limit = _get_non_negative_int(data_dict, 'limit')
+    offset = _get_non_negative_int(data_dict, 'offset')
 
     query = model.Session.query(
         model.User,
@@ -526,13 +583,14 @@ def user_list(context, data_dict):
     if context.get('return_query'):
         return query
 
-    users_list = []
-
-    for user in query.all():
-        result_dict = model_dictize.user_dictize(user[0], context)
-        users_list.append(result_dict)
+    if offset:
+        query = query.offset(offset)
+    if limit:
+        query = query.limit(limit)
 
-    return users_list
+    return model_dictize.user_list_with_counts_dictize(
+        [(row[0], row.number_of_edits, row.number_administered_packages)
+         for row in query.all()], context)
 
 def package_relationships_list(context, data_dict):
     '''Return a dataset (package)'s relationships.
@@ -1133,16 +1191,23 @@ def package_search(context, data_dict):
         query = search.query_for(model.Package)
         query.run(data_dict)
 
-        for package in query.results:
-            # get the package object
-            package, package_dict = package['id'], package.get('data_dict')
+        # get the package objects of all the results at once
+        package_ids = [package['id'] for package in query.results]
+        pkgs = {}
+        if package_ids:
             pkg_query = session.query(model.PackageRevision)\
-                .filter(model.PackageRevision.id == package)\
+                .filter(model.PackageRevision.id.in_(package_ids))\
                 .filter(_and_(
                     model.PackageRevision.state == u'active',
                     model.PackageRevision.current == True
                 ))
-            pkg = pkg_query.first()
+            pkgs = dict((pkg.id, pkg) for pkg in pkg_query)
+
+        # positions in results of the dicts that still need before_view
+        view_positions = []
+        for package in query.results:
+            package, package_dict = package['id'], package.get('data_dict')
+            pkg = pkgs.get(package)
 
             ## if the index has got a package that is not in ckan then
             ## ignore it.
@@ -1154,12 +1219,26 @@ def package_search(context, data_dict):
                 ## the package_dict still needs translating when being viewed
                 package_dict = json.loads(package_dict)
                 if context.get('for_view'):
-                    for item in plugins.PluginImplementations( plugins.IPackageController):
-                        package_dict = item.before_view(package_dict)
+                    view_positions.append(len(results))
                 results.append(package_dict)
             else:
                 results.append(model_dictize.package_dictize(pkg,context))
 
+        # let extensions see the whole page of results at once
+        if view_positions:
+            package_dicts = [results[i] for i in view_positions]
+            for item in plugins.PluginImplementations(plugins.IPackageController):
+                # plugins that don't inherit from the interface may not
+                # have before_view_many
+                before_view_many = getattr(item, 'before_view_many', None)
+                if before_view_many is not None:
+                    package_dicts = before_view_many(package_dicts)
+                else:
+                    package_dicts = [item.before_view(package_dict)
+                                     for package_dict in package_dicts]
+            for i, package_dict in zip(view_positions, package_dicts):
+                results[i] = package_dict
+
         count = query.count
         facets = query.facets
     else:
@@ -1174,6 +1253,9 @@ def package_search(context, data_dict):
     }
 
     # Transform facets into a more useful data structure.
+    group_names = {}
+    if 'groups' in facets:
+        group_names = group_cache.get_display_names(facets['groups'].keys())
     restructured_facets = {}
     for key, value in facets.items():
         restructured_facets[key] = {
@@ -1184,11 +1266,7 @@ def package_search(context, data_dict):
             new_facet_dict = {}
             new_facet_dict['name'] = key_
             if key == 'groups':
-                group = model.Group.get(key_)
-                if group:
-                    new_facet_dict['display_name'] = group.display_name
-                else:
-                    new_facet_dict['display_name'] = key_
+                new_facet_dict['display_name'] = group_names[key_]
             else:
                 new_facet_dict['display_name'] = key_
             new_facet_dict['count'] = value_
@@ -2226,13 +2304,27 @@ def dashboard_new_activities_count(context, data_dict):
     though they appear in the dashboard (users don't want to be notified about
     things they did themselves).
 
+    At most 15 new activities are counted, the number of activities shown in
+    the dashboard.
+
     :rtype: int
 
     '''
     _check_access('dashboard_new_activities_count', context, data_dict)
-    activities = logic.get_action('dashboard_activity_list')(
-            context, data_dict)
-    return len([activity for activity in activities if activity['is_new']])
+    model = context['model']
+    user_id = model.User.get(context['user']).id
+
+    # The count is kept up to date as activities are created, but it has to
+    # be counted from the activity stream the first time and after the user
+    # starts following something new.
+    count = model.Dashboard.get_new_activities_count(user_id)
+    if count is None:
+        activities = logic.get_action('dashboard_activity_list')(
+                context, data_dict)
+        count = len([activity for activity in activities
+            if activity['is_new']])
+        model.Dashboard.set_new_activities_count(user_id, count)
+    return min(count, 15)
 
 
 def dashboard_mark_all_new_activities_as_old(context, data_dict):
@@ -1,6 +1,7 @@
 import logging
 import datetime
 
+from pylons import config
 from pylons.i18n import _
 from vdm.sqlalchemy.base import SQLAlchemySession
 
@@ -14,6 +15,8 @@ import ckan.lib.dictization.model_save as model_save
 import ckan.lib.navl.dictization_functions
 import ckan.lib.navl.validators as validators
 import ckan.lib.plugins as lib_plugins
+import ckan.lib.search as search
+import ckan.lib.term_translation_cache as term_translation_cache
 
 log = logging.getLogger(__name__)
 
@@ -24,9 +27,49 @@ _validate = ckan.lib.navl.dictization_functions.validate
 _get_action = logic.get_action
 _check_access = logic.check_access
 NotFound = logic.NotFound
+NotAuthorized = logic.NotAuthorized
 ValidationError = logic.ValidationError
 _get_or_bust = logic.get_or_bust
 
+def _commit_many(model, results):
+    '''Commit the datasets saved by package_create_many or
+    package_update_many and index them with a single Solr commit.
+
+    The search index is only updated once the database commit succeeded,
+    so search index errors are logged and flagged with ``'index_error'``
+    in the results instead of being raised.
+    '''
+    try:
+        with search.commit_window() as window:
+            model.repo.commit()
+            # Send the changes now, even if this runs inside an outer window
+            window.flush()
+    except search.SearchIndexError, e:
+        log.error('Could not index the saved datasets: %s' % e)
+        for result in results:
+            if result['success']:
+                result['index_error'] = True
+
+def _get_many_data(data_dict, action):
+    '''Return the list of dataset dictionaries given to package_create_many
+    or package_update_many, checking its type and size.'''
+    data = data_dict.get('data')
+    if not isinstance(data, list) or \
+            not all(isinstance(item, dict) for item in data):
+        raise ValidationError(
+            {'data': _('%s needs a list of dicts in field data') % action}
+        )
+    max_datasets = int(config.get('ckan.api.bulk_max_datasets', 100))
+    if len(data) > max_datasets:
+        raise ValidationError(
+            {'data': _('Too many datasets, the maximum is %i') % max_datasets}
+        )
+    return data
+
+def _authorization_error(e):
+    return {'__type': 'Authorization Error',
+            'message': unicode(e) or _('Access denied')}
+
 def _make_latest_rev_active(context, q):
 
     session = context['model'].Session
@@ -283,6 +326,110 @@ def package_update(context, data_dict):
 
     return output
 
+def package_update_many(context, data_dict):
+    '''Update many datasets (packages) at once.
+
+    All of the valid datasets are saved in a single revision and committed
+    together, and the search index is updated for all of them in one batch
+    at the end. Datasets that are invalid, can't be found or that you are
+    not authorized to edit are skipped, their errors are returned instead
+    of being raised.
+
+    :param data: the datasets to update, each one must have an ``'id'`` or
+        ``'name'`` key, for the format of dataset dictionaries see
+        ``package_update()``; at most ``ckan.api.bulk_max_datasets``
+        (default 100)
+    :type data: list of dictionaries
+
+    :returns: one dictionary for each of the given datasets, in the same
+        order, with key ``'success'`` and either the ``'id'`` of the
+        dataset or the ``'error'`` dictionary. If the datasets were saved
+        but couldn't be indexed, the updated datasets also have
+        ``'index_error'`` set to ``True``
+    :rtype: list of dictionaries
+
+    '''
+    model = context['model']
+    user = context['user']
+
+    datasets = _get_many_data(data_dict, 'package_update_many')
+
+    model.Session.remove()
+    model.Session()._context = context
+
+    rev = None
+    results = []
+    for pkg_dict in datasets:
+        name_or_id = pkg_dict.get('id') or pkg_dict.get('name')
+        pkg = model.Package.get(name_or_id) if name_or_id else None
+        if pkg is None:
+            results.append({'success': False,
+                            'error': {'id': [_('Package was not found.')]}})
+            continue
+
+        # The validators and package_dict_save look at context['package'],
+        # so every dataset gets a context of its own
+        item_context = dict(context)
+        item_context['package'] = pkg
+        # Don't change the caller's dictionary
+        pkg_dict = dict(pkg_dict, id=pkg.id)
+
+        try:
+            _check_access('package_update', item_context, pkg_dict)
+        except NotAuthorized, e:
+            results.append({'success': False,
+                            'error': _authorization_error(e)})
+            continue
+
+        package_plugin = lib_plugins.lookup_package_plugin(pkg.type)
+        try:
+            schema = package_plugin.form_to_db_schema_options({'type':'update',
+                                               'api':'api_version' in context,
+                                               'context': item_context})
+        except AttributeError:
+            schema = package_plugin.form_to_db_schema()
+
+        if 'api_version' not in context:
+            try:
+                package_plugin.check_data_dict(pkg_dict, schema)
+            except TypeError:
+                package_plugin.check_data_dict(pkg_dict)
+
+        data, errors = _validate(pkg_dict, schema, item_context)
+        if errors:
+            log.debug('package_update_many validate_errs=%r package=%s',
+                      errors, pkg.name)
+            results.append({'success': False, 'error': errors})
+            continue
+
+        if rev is None:
+            rev = model.repo.new_revision()
+            rev.author = user
+            if 'message' in context:
+                rev.message = context['message']
+            else:
+                rev.message = _(u'REST API: Update many objects')
+
+        pkg = model_save.package_dict_save(data, item_context)
+        # Later datasets in the list are validated against this one (e.g.
+        # for unique names)
+        model.Session.flush()
+
+        for item in plugins.PluginImplementations(plugins.IPackageController):
+            item.edit(pkg)
+
+        results.append({'success': True, 'id': pkg.id})
+
+    if rev is None:
+        model.Session.rollback()
+    elif not context.get('defer_commit'):
+        _commit_many(model, results)
+
+    log.debug('Updated %i objects' %
+              len([r for r in results if r['success']]))
+
+    return results
+
 def package_update_validate(context, data_dict):
     model = context['model']
     user = context['user']
@@ -687,6 +834,8 @@ def term_translation_update(context, data_dict):
     if not result.rowcount:
         conn.execute(trans_table.insert().values(**data))
 
+    term_translation_cache.clear([data['term']])
+
     if not context.get('defer_commit'):
         model.Session.commit()
 
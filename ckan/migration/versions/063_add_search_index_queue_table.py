@@ -0,0 +1,16 @@
+from sqlalchemy import *
+from migrate import *
+
+def upgrade(migrate_engine):
+    metadata = MetaData()
+    metadata.bind = migrate_engine
+    migrate_engine.execute('''
+CREATE TABLE search_index_queue (
+    id serial NOT NULL,
+    package_id text NOT NULL,
+    operation text NOT NULL,
+    "timestamp" timestamp without time zone NOT NULL
+);
+ALTER TABLE search_index_queue
+    ADD CONSTRAINT search_index_queue_pkey PRIMARY KEY (id);
+    ''')
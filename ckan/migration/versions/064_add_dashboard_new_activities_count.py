@@ -0,0 +1,10 @@
+from sqlalchemy import *
+from migrate import *
+
+def upgrade(migrate_engine):
+    metadata = MetaData()
+    metadata.bind = migrate_engine
+    migrate_engine.execute('''
+ALTER TABLE dashboard
+    ADD COLUMN new_activities_count integer;
+    ''')
@@ -0,0 +1,20 @@
+from sqlalchemy import *
+from migrate import *
+
+def upgrade(migrate_engine):
+    metadata = MetaData()
+    metadata.bind = migrate_engine
+    migrate_engine.execute('''
+CREATE TABLE activity_inbox (
+    user_id text NOT NULL,
+    activity_id text NOT NULL,
+    "timestamp" timestamp without time zone
+);
+ALTER TABLE activity_inbox
+    ADD CONSTRAINT activity_inbox_pkey PRIMARY KEY (user_id, activity_id);
+ALTER TABLE activity_inbox
+    ADD CONSTRAINT activity_inbox_user_id_fkey FOREIGN KEY (user_id) REFERENCES "user"(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE activity_inbox
+    ADD CONSTRAINT activity_inbox_activity_id_fkey FOREIGN KEY (activity_id) REFERENCES activity(id) ON UPDATE CASCADE ON DELETE CASCADE;
+CREATE INDEX idx_activity_inbox_user_id_timestamp ON activity_inbox (user_id, "timestamp");
+    ''')
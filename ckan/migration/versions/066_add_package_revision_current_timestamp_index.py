@@ -0,0 +1,9 @@
+from migrate import *
+
+def upgrade(migrate_engine):
+    migrate_engine.execute('''
+    BEGIN;
+    CREATE INDEX idx_package_revision_current_timestamp ON package_revision (revision_timestamp, id) WHERE current = true;
+    COMMIT;
+    '''
+    )
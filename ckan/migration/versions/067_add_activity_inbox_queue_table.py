@@ -0,0 +1,16 @@
+from sqlalchemy import *
+from migrate import *
+
+def upgrade(migrate_engine):
+    metadata = MetaData()
+    metadata.bind = migrate_engine
+    migrate_engine.execute('''
+CREATE TABLE activity_inbox_queue (
+    id serial NOT NULL,
+    user_id text NOT NULL,
+    "timestamp" timestamp without time zone NOT NULL
+);
+ALTER TABLE activity_inbox_queue
+    ADD CONSTRAINT activity_inbox_queue_pkey PRIMARY KEY (id);
+CREATE INDEX idx_activity_inbox_queue_user_id ON activity_inbox_queue (user_id);
+    ''')
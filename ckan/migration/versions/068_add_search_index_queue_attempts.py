@@ -0,0 +1,11 @@
+from sqlalchemy import *
+from migrate import *
+
+def upgrade(migrate_engine):
+    metadata = MetaData()
+    metadata.bind = migrate_engine
+    migrate_engine.execute('''
+ALTER TABLE search_index_queue
+    ADD COLUMN attempts integer NOT NULL DEFAULT 0,
+    ADD COLUMN error text;
+    ''')
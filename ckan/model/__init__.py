@@ -128,6 +128,8 @@ from activity import (
     ActivityDetail,
     activity_table,
     activity_detail_table,
+    activity_inbox_table,
+    activity_inbox_queue_table,
 )
 from term_translation import (
     term_translation_table,
@@ -151,6 +153,10 @@ from domain_object import (
 from dashboard import (
     Dashboard,
 )
+from search_queue import (
+    SearchIndexQueue,
+    search_index_queue_table,
+)
 
 import ckan.migration
 
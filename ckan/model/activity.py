@@ -1,6 +1,9 @@
 import datetime
 
-from sqlalchemy import orm, types, Column, Table, ForeignKey, desc, or_
+from paste.deploy.converters import asbool
+from pylons import config
+from sqlalchemy import orm, types, Column, Table, ForeignKey, Index, desc, or_
+from sqlalchemy import text, select, and_
 
 import meta
 import types as _types
@@ -8,6 +11,7 @@ import domain_object
 
 __all__ = ['Activity', 'activity_table',
            'ActivityDetail', 'activity_detail_table',
+           'activity_inbox_table', 'activity_inbox_queue_table',
            ]
 
 activity_table = Table(
@@ -31,6 +35,82 @@ activity_detail_table = Table(
     Column('data', _types.JsonDictType),
     )
 
+# The dashboard activity stream of each user, written as activities are
+# created so that reading a dashboard doesn't have to work out what the user
+# follows. Only used when ckan.activity_inbox_enabled is true.
+activity_inbox_table = Table(
+    'activity_inbox', meta.metadata,
+    Column('user_id', types.UnicodeText,
+        ForeignKey('user.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True),
+    Column('activity_id', types.UnicodeText,
+        ForeignKey('activity.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True),
+    Column('timestamp', types.DateTime),
+    )
+
+Index('idx_activity_inbox_user_id_timestamp',
+      activity_inbox_table.c.user_id, activity_inbox_table.c.timestamp)
+
+# Users whose activity inboxes have to be rebuilt because what they follow
+# changed. Entries are added while the change is flushed and removed by
+# `paster activity-inbox worker` once the inbox has been rebuilt; until then
+# the user's dashboard is worked out from what they follow.
+activity_inbox_queue_table = Table(
+    'activity_inbox_queue', meta.metadata,
+    Column('id', types.Integer(), primary_key=True, nullable=False),
+    Column('user_id', types.UnicodeText, nullable=False),
+    Column('timestamp', types.DateTime, default=datetime.datetime.now,
+           nullable=False),
+    )
+
+Index('idx_activity_inbox_queue_user_id',
+      activity_inbox_queue_table.c.user_id)
+
+# The ids of the users whose dashboards show an activity by :user_id about
+# :object_id (other than :user_id themselves). This has to match
+# _dashboard_activity_query() below. Some of the ids, e.g. :object_id, may
+# not be user ids.
+_dashboard_recipients_sql = '''
+    SELECT follower_id FROM user_following_user
+        WHERE object_id = :user_id
+    UNION
+    SELECT follower_id FROM user_following_dataset
+        WHERE object_id = :object_id
+    UNION
+    SELECT follower_id FROM user_following_group
+        WHERE object_id = :object_id
+    UNION
+    SELECT f.follower_id FROM user_following_group f
+        JOIN member m ON m.group_id = f.object_id
+        JOIN package p ON p.id = m.table_id
+        WHERE m.table_id = :object_id AND m.capacity = 'public'
+            AND p.state IN ('active', 'pending')
+    UNION
+    SELECT :object_id
+'''
+
+# Fill in the activity inbox of :user_id, the equivalent of
+# _dashboard_activity_query() in a single statement.
+_rebuild_activity_inbox_sql = '''
+    INSERT INTO activity_inbox (user_id, activity_id, timestamp)
+    SELECT :user_id, a.id, a.timestamp FROM activity a
+    WHERE a.user_id = :user_id OR a.object_id = :user_id
+        OR a.user_id IN (SELECT object_id FROM user_following_user
+                         WHERE follower_id = :user_id)
+        OR a.object_id IN (SELECT object_id FROM user_following_dataset
+                           WHERE follower_id = :user_id)
+        OR a.object_id IN (SELECT object_id FROM user_following_group
+                           WHERE follower_id = :user_id)
+        OR a.object_id IN (
+            SELECT m.table_id FROM member m
+                JOIN package p ON p.id = m.table_id
+                JOIN user_following_group f ON f.object_id = m.group_id
+                WHERE f.follower_id = :user_id AND m.capacity = 'public'
+                    AND p.state IN ('active', 'pending'))
+'''
+
+
 class Activity(domain_object.DomainObject):
 
     def __init__(self, user_id, object_id, revision_id, activity_type,
@@ -257,11 +337,98 @@ def dashboard_activity_list(user_id, limit=15):
     This is the union of user_activity_list(user_id) and
     activities_from_everything_followed_by_user(user_id).
 
+    If ckan.activity_inbox_enabled is true the activities are read from the
+    user's activity inbox instead of being worked out from what they follow.
+
     '''
+    if activity_inbox_enabled() and not activity_inbox_queued(user_id):
+        q = _activity_inbox_query(user_id)
+        q = q.order_by(desc(activity_inbox_table.c.timestamp))
+        if limit:
+            q = q.limit(limit)
+        return q.all()
     q = _dashboard_activity_query(user_id)
     return _most_recent_activities(q, limit)
 
 
+def activity_inbox_enabled():
+    return asbool(config.get('ckan.activity_inbox_enabled', False))
+
+
+def add_to_activity_inboxes(session, activity):
+    '''Add a new activity to the inboxes of the users who will see it.'''
+    session.execute(text('''
+        INSERT INTO activity_inbox (user_id, activity_id, timestamp)
+        SELECT u.id, :activity_id, :timestamp FROM "user" u
+        WHERE u.id = :user_id OR u.id IN ({recipients})
+    '''.format(recipients=_dashboard_recipients_sql)),
+        {'activity_id': activity.id, 'timestamp': activity.timestamp,
+         'user_id': activity.user_id, 'object_id': activity.object_id})
+
+
+def rebuild_activity_inboxes(session, user_ids):
+    '''Rebuild the activity inboxes of the given users from scratch.
+
+    Used to fill in the inboxes when they are first enabled, and when what a
+    user follows changes.
+
+    '''
+    for user_id in user_ids:
+        session.execute(activity_inbox_table.delete().where(
+            activity_inbox_table.c.user_id == user_id))
+        session.execute(text(_rebuild_activity_inbox_sql),
+            {'user_id': user_id})
+
+
+def queue_activity_inbox_rebuilds(session, user_ids):
+    '''Queue the activity inboxes of the given users to be rebuilt.'''
+    # Use plain inserts, as this is called while the session is being
+    # flushed.
+    now = datetime.datetime.now()
+    for user_id in user_ids:
+        session.execute(activity_inbox_queue_table.insert().values(
+            user_id=user_id, timestamp=now))
+
+
+def activity_inbox_queued(user_id):
+    '''Return True if user_id's activity inbox is waiting to be rebuilt.'''
+    table = activity_inbox_queue_table
+    return meta.Session.execute(
+        select([table.c.id], table.c.user_id == user_id).limit(1)
+    ).first() is not None
+
+
+def process_activity_inbox_queue(session, batch_size=100):
+    '''Rebuild the activity inboxes of a batch of queued users.
+
+    Returns the number of queue entries processed. The caller commits.
+
+    '''
+    table = activity_inbox_queue_table
+    rows = session.execute(select([table.c.id, table.c.user_id]).order_by(
+        table.c.id).limit(batch_size)).fetchall()
+    if not rows:
+        return 0
+    user_ids = set(row[1] for row in rows)
+    rebuild_activity_inboxes(session, user_ids)
+    # Entries queued after these were read may be for later changes, so
+    # they are left for the next batch.
+    session.execute(table.delete().where(and_(
+        table.c.user_id.in_(list(user_ids)),
+        table.c.id <= max(row[0] for row in rows))))
+    return len(rows)
+
+
+def _activity_inbox_query(user_id):
+    '''Return an SQLAlchemy query for user_id's activity inbox.'''
+    import ckan.model as model
+    q = model.Session.query(model.Activity)
+    q = q.join(activity_inbox_table,
+            activity_inbox_table.c.activity_id == model.Activity.id)
+    q = q.filter(activity_inbox_table.c.user_id == user_id)
+    return q
+
+
 def _changed_packages_activity_query():
     '''Return an SQLAlchemyu query for all changed package activities.
 
@@ -1,6 +1,7 @@
 import datetime
 import sqlalchemy
 import meta
+import activity
 
 dashboard_table = sqlalchemy.Table('dashboard', meta.metadata,
     sqlalchemy.Column('user_id', sqlalchemy.types.UnicodeText,
@@ -8,9 +9,22 @@ dashboard_table = sqlalchemy.Table('dashboard', meta.metadata,
                 ondelete='CASCADE'),
             primary_key=True, nullable=False),
     sqlalchemy.Column('activity_stream_last_viewed', sqlalchemy.types.DateTime,
-        nullable=False)
+        nullable=False),
+    # The number of new activities in the user's dashboard, kept up to date
+    # as activities are created. NULL means it is not known and has to be
+    # counted from the activity stream.
+    sqlalchemy.Column('new_activities_count', sqlalchemy.types.Integer,
+        nullable=True),
 )
 
+# Count an activity by :user_id about :object_id as new in the dashboards
+# that show it, except in the dashboard of the user who did it.
+_count_new_activity_sql = '''
+    UPDATE dashboard
+    SET new_activities_count = new_activities_count + 1
+    WHERE user_id != :user_id AND user_id IN ({recipients})
+'''.format(recipients=activity._dashboard_recipients_sql)
+
 
 class Dashboard(object):
     '''Saved data used for the user's dashboard.'''
@@ -18,6 +32,7 @@ class Dashboard(object):
     def __init__(self, user_id):
         self.user_id = user_id
         self.activity_stream_last_viewed = datetime.datetime.now()
+        self.new_activities_count = 0
 
     @classmethod
     def get_activity_stream_last_viewed(cls, user_id):
@@ -39,9 +54,90 @@ class Dashboard(object):
         try:
             row = query.one()
             row.activity_stream_last_viewed = datetime.datetime.now()
+            row.new_activities_count = 0
         except sqlalchemy.orm.exc.NoResultFound:
             row = Dashboard(user_id)
             meta.Session.add(row)
         meta.Session.commit()
 
+    @classmethod
+    def get_new_activities_count(cls, user_id):
+        '''Return the user's new activities count, or None if not known.'''
+        return meta.Session.execute(
+            sqlalchemy.select([dashboard_table.c.new_activities_count],
+                dashboard_table.c.user_id == user_id)).scalar()
+
+    @classmethod
+    def set_new_activities_count(cls, user_id, count):
+        '''Save the user's new activities count, if it is not known yet.
+
+        This is called from the dashboard_new_activities_count action, which
+        only reads, so the count is saved in a transaction of its own on a
+        separate connection rather than by committing the caller's session.
+
+        The count is only filled in where it is NULL: if it was set in the
+        meantime (e.g. reset to 0 when the user viewed their dashboard, or
+        counted by another request) that value is kept.
+
+        On SQLite the count is never saved, as writing on another connection
+        would lock against the session's own transaction. It is counted from
+        the activity stream every time instead.
+
+        '''
+        if meta.engine_is_sqlite():
+            return
+        connection = meta.engine.connect()
+        try:
+            trans = connection.begin()
+            try:
+                updated = connection.execute(dashboard_table.update().where(
+                    sqlalchemy.and_(dashboard_table.c.user_id == user_id,
+                        dashboard_table.c.new_activities_count == None)
+                    ).values(new_activities_count=count)).rowcount
+                exists = updated or connection.execute(
+                    sqlalchemy.select([dashboard_table.c.user_id],
+                        dashboard_table.c.user_id == user_id)).first()
+                if not exists:
+                    # Keep all the activities new to this user, as they were
+                    # before the row existed.
+                    connection.execute(dashboard_table.insert().values(
+                        user_id=user_id,
+                        activity_stream_last_viewed=datetime.datetime.min,
+                        new_activities_count=count))
+                trans.commit()
+            except sqlalchemy.exc.IntegrityError:
+                # Another request created the row first
+                trans.rollback()
+            except:
+                trans.rollback()
+                raise
+        finally:
+            connection.close()
+
+    @classmethod
+    def activity_created(cls, session, activity):
+        '''Count a new activity in the dashboards that it will appear in.
+
+        The user's own activities never count as new.
+
+        '''
+        session.execute(sqlalchemy.text(_count_new_activity_sql),
+            {'user_id': activity.user_id, 'object_id': activity.object_id})
+
+    @classmethod
+    def reset_new_activities_count(cls, session, user_ids):
+        '''Forget the new activities counts of the given users.
+
+        Used when the set of activities in a user's dashboard changes other
+        than by new activities being created, e.g. when they follow something
+        its past activities appear too.
+
+        '''
+        if not user_ids:
+            return
+        session.execute(
+            dashboard_table.update().where(
+                dashboard_table.c.user_id.in_(user_ids)
+            ).values(new_activities_count=None))
+
 meta.mapper(Dashboard, dashboard_table)
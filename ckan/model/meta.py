@@ -9,15 +9,16 @@ from sqlalchemy.orm.session import SessionExtension
 
 import extension
 import ckan.lib.activity_streams_session_extension as activity
+import ckan.lib.page_cache as page_cache
 
 __all__ = ['Session', 'engine_is_sqlite']
 
 
 class CkanCacheExtension(SessionExtension):
-    ''' This extension checks what tables have been affected by
+    ''' This extension checks what objects have been affected by
     database access and allows us to act on them. Currently this is
-    used by the page cache to flush the cache when data in the database
-    is altered. '''
+    used by the page cache to invalidate the cached pages that depend
+    on data altered in the database. '''
 
     def __init__(self, *args, **kw):
         super(CkanCacheExtension, self).__init__(*args, **kw)
@@ -26,30 +27,40 @@ class CkanCacheExtension(SessionExtension):
         if self.use_redis:
             import redis
             self.redis = redis
-            self.redis_connection is None
+            self.redis_connection = None
             self.redis_exception = redis.exceptions.ConnectionError
 
+    def before_commit(self, session):
+        if not self.use_redis:
+            return
+        # Work out the tags while related objects can still be loaded
+        session.flush()
+        if not hasattr(session, '_object_cache'):
+            return
+        oc = session._object_cache
+        session._page_cache_tags = page_cache.tags_for_objects(
+            oc['new'] | oc['changed'] | oc['deleted'])
+
     def after_commit(self, session):
-        if hasattr(session, '_object_cache'):
-            oc = session._object_cache
-            oc_list = oc['new']
-            oc_list.update(oc['changed'])
-            oc_list.update(oc['deleted'])
-            objs = set()
-            for item in oc_list:
-                objs.add(item.__class__.__name__)
-
-        # Flush Redis
-        if self.use_redis:
-            if self.redis_connection is None:
-                try:
-                    self.redis_connection = self.redis.StrictRedis()
-                except self.redis_exception:
-                    pass
+        tags = getattr(session, '_page_cache_tags', None)
+        if not tags:
+            return
+        del session._page_cache_tags
+
+        # Invalidate the cached pages
+        if self.redis_connection is None:
             try:
-                self.redis_connection.flushdb()
+                self.redis_connection = self.redis.StrictRedis()
             except self.redis_exception:
-                pass
+                return
+        try:
+            page_cache.invalidate(self.redis_connection, tags)
+        except self.redis_exception:
+            pass
+
+    def after_rollback(self, session):
+        if hasattr(session, '_page_cache_tags'):
+            del session._page_cache_tags
 
 class CkanSessionExtension(SessionExtension):
 
@@ -133,7 +144,8 @@ Session = orm.scoped_session(orm.sessionmaker(
     extension=[CkanCacheExtension(),
                CkanSessionExtension(),
                extension.PluginSessionExtension(),
-               activity.DatasetActivitySessionExtension()],
+               activity.DatasetActivitySessionExtension(),
+               activity.DashboardSessionExtension()],
 ))
 
 create_local_session = orm.sessionmaker(
@@ -143,7 +155,8 @@ create_local_session = orm.sessionmaker(
     extension=[CkanCacheExtension(),
                CkanSessionExtension(),
                extension.PluginSessionExtension(),
-               activity.DatasetActivitySessionExtension()],
+               activity.DatasetActivitySessionExtension(),
+               activity.DashboardSessionExtension()],
 )
 
 #mapper = Session.mapper
@@ -0,0 +1,85 @@
+import datetime
+
+from sqlalchemy import types, Column, Table
+
+import meta
+import domain_object
+
+__all__ = ['SearchIndexQueue', 'search_index_queue_table']
+
+search_index_queue_table = Table('search_index_queue', meta.metadata,
+    Column('id', types.Integer(), primary_key=True, nullable=False),
+    Column('package_id', types.UnicodeText, nullable=False),
+    Column('operation', types.UnicodeText, nullable=False),
+    Column('timestamp', types.DateTime, default=datetime.datetime.now,
+           nullable=False),
+    Column('attempts', types.Integer, default=0, nullable=False),
+    Column('error', types.UnicodeText),
+)
+
+
+class SearchIndexQueue(domain_object.DomainObject):
+    '''Datasets waiting to be updated in the search index.
+
+    Entries are added by the asynchronous search plugin in the same
+    transaction that changes the dataset, and removed by the search index
+    worker once the search index has been updated. Entries for datasets
+    that could not be indexed stay in the queue, with the number of failed
+    attempts and the last error.
+    '''
+
+    @classmethod
+    def enqueue(cls, package_id, operation):
+        # Use a plain insert, as this is called while the session is
+        # being committed.
+        meta.Session.execute(search_index_queue_table.insert().values(
+            package_id=package_id, operation=operation,
+            timestamp=datetime.datetime.now()))
+
+    @classmethod
+    def pending(cls, limit, max_attempts=None):
+        '''Return the oldest `limit` entries of the queue, skipping the ones
+        that already failed `max_attempts` times.'''
+        query = meta.Session.query(cls).order_by(cls.id)
+        if max_attempts is not None:
+            query = query.filter(cls.attempts < max_attempts)
+        return query.limit(limit).all()
+
+    @classmethod
+    def failed(cls, entries, error):
+        '''Record a failed attempt to index the datasets of the entries.'''
+        ids = [entry.id for entry in entries]
+        if ids:
+            meta.Session.execute(search_index_queue_table.update().where(
+                search_index_queue_table.c.id.in_(ids)).values(
+                    attempts=search_index_queue_table.c.attempts + 1,
+                    error=error))
+
+    @classmethod
+    def given_up(cls, max_attempts, package_id=None):
+        '''Return the entries that already failed `max_attempts` times,
+        optionally only the ones of the given dataset.'''
+        query = meta.Session.query(cls).order_by(cls.id).filter(
+            cls.attempts >= max_attempts)
+        if package_id is not None:
+            query = query.filter(cls.package_id == package_id)
+        return query.all()
+
+    @classmethod
+    def retry(cls, entries):
+        '''Forget the failed attempts of the entries, so they are tried
+        again.'''
+        ids = [entry.id for entry in entries]
+        if ids:
+            meta.Session.execute(search_index_queue_table.update().where(
+                search_index_queue_table.c.id.in_(ids)).values(
+                    attempts=0, error=None))
+
+    @classmethod
+    def remove(cls, entries):
+        ids = [entry.id for entry in entries]
+        if ids:
+            meta.Session.execute(search_index_queue_table.delete().where(
+                search_index_queue_table.c.id.in_(ids)))
+
+meta.mapper(SearchIndexQueue, search_index_queue_table)
@@ -39,4 +39,30 @@ class TrackingSummary(domain_object.DomainObject):
 
         return {'total' : 0, 'recent' : 0}
 
+    @classmethod
+    def get_for_packages(cls, package_ids):
+        '''Return a dict of tracking summaries keyed by package id.'''
+        return cls._get_many(cls.package_id, package_ids)
+
+    @classmethod
+    def get_for_resources(cls, urls):
+        '''Return a dict of tracking summaries keyed by resource url.'''
+        return cls._get_many(cls.url, urls)
+
+    @classmethod
+    def _get_many(cls, column, keys):
+        summaries = dict((key, {'total' : 0, 'recent' : 0}) for key in keys)
+        if not summaries:
+            return summaries
+        obj = meta.Session.query(column, cls.running_total,
+                                 cls.recent_views).autoflush(False)
+        obj = obj.filter(column.in_(summaries.keys()))
+        seen = set()
+        for key, total, recent in obj.order_by('tracking_date desc'):
+            if key in seen:
+                continue
+            seen.add(key)
+            summaries[key] = {'total' : total, 'recent': recent}
+        return summaries
+
 meta.mapper(TrackingSummary, tracking_summary_table)
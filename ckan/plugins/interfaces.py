@@ -315,6 +315,19 @@ class IPackageController(Interface):
         '''
         return pkg_dict
 
+    def before_view_many(self, pkg_dicts):
+        '''
+             Extensions will recieve the list of dataset dicts of a page
+             of search results before they get displayed, and should
+             return a list of the (modified or not) dicts in the same
+             order. By default before_view is called on each of them, but
+             extensions can override this to process a whole page at once
+             (e.g. to look up data for all the datasets in one query).
+             Plugins that don't define it have before_view called on each
+             dict instead.
+        '''
+        return [self.before_view(pkg_dict) for pkg_dict in pkg_dicts]
+
 
 class IPluginObserver(Interface):
     """
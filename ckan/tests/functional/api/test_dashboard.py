@@ -331,3 +331,110 @@ class TestDashboard(object):
         after = self.dashboard_activity_list(self.new_user)
 
         assert before == after
+
+    def test_10_new_activities_count_is_maintained(self):
+        '''Test that the new activities count is kept up to date as
+        activities are created, instead of being counted again.'''
+        self.dashboard_mark_all_new_activities_as_old(self.new_user)
+        assert ckan.model.Dashboard.get_new_activities_count(
+                self.new_user['id']) == 0
+
+        params = json.dumps({'name': 'warandpeace', 'notes': 'maintained'})
+        response = self.app.post('/api/action/package_update', params=params,
+                extra_environ={'Authorization': str(self.joeadmin['apikey'])})
+        assert response.json['success'] is True
+
+        assert ckan.model.Dashboard.get_new_activities_count(
+                self.new_user['id']) == 1
+        assert self.dashboard_new_activities_count(self.new_user) == 1
+        assert len(self.dashboard_new_activities(self.new_user)) == 1
+
+    def test_11_following_resets_new_activities_count(self):
+        '''Test that following something makes the new activities count be
+        counted again, as its past activities appear in the dashboard.'''
+        params = json.dumps({'id': 'david'})
+        response = self.app.post('/api/action/follow_group', params=params,
+                extra_environ={'Authorization': str(self.new_user['apikey'])})
+        assert response.json['success'] is True
+
+        assert ckan.model.Dashboard.get_new_activities_count(
+                self.new_user['id']) is None
+        assert self.dashboard_new_activities_count(self.new_user) == len(
+                self.dashboard_new_activities(self.new_user))
+        if ckan.model.meta.engine_is_sqlite():
+            # the count isn't saved on SQLite, it's counted every time
+            assert ckan.model.Dashboard.get_new_activities_count(
+                    self.new_user['id']) is None
+        else:
+            assert ckan.model.Dashboard.get_new_activities_count(
+                    self.new_user['id']) is not None
+
+    def test_12_editing_dataset_in_followed_group_keeps_count(self):
+        '''Test that editing a dataset in a group the user follows counts
+        the new activity, instead of resetting the count because the
+        dataset's group memberships were saved again.'''
+        self.dashboard_mark_all_new_activities_as_old(self.new_user)
+
+        params = json.dumps({'id': 'annakarenina'})
+        response = self.app.post('/api/action/package_show', params=params)
+        package = response.json['result']
+        assert 'david' in [group['name'] for group in package['groups']]
+        package['notes'] = 'in david'
+        params = json.dumps(package)
+        response = self.app.post('/api/action/package_update', params=params,
+                extra_environ={'Authorization': str(self.joeadmin['apikey'])})
+        assert response.json['success'] is True
+
+        assert ckan.model.Dashboard.get_new_activities_count(
+                self.new_user['id']) == 1
+
+    def test_13_saving_count_keeps_known_count(self):
+        '''Test that saving a counted new activities count doesn't
+        overwrite a count that was set in the meantime.'''
+        self.dashboard_mark_all_new_activities_as_old(self.new_user)
+
+        ckan.model.Dashboard.set_new_activities_count(self.new_user['id'], 7)
+
+        assert ckan.model.Dashboard.get_new_activities_count(
+                self.new_user['id']) == 0
+        assert self.dashboard_new_activities_count(self.new_user) == 0
+
+
+class TestDashboardActivityInbox(TestDashboard):
+    '''Run the dashboard tests again with activity inboxes enabled.'''
+
+    @classmethod
+    def setup_class(cls):
+        pylons.config['ckan.activity_inbox_enabled'] = True
+        super(TestDashboardActivityInbox, cls).setup_class()
+        user_ids = [user.id for user in ckan.model.Session.query(
+            ckan.model.User)]
+        ckan.model.activity.rebuild_activity_inboxes(ckan.model.Session,
+                user_ids)
+        ckan.model.Session.commit()
+
+    @classmethod
+    def teardown_class(cls):
+        del pylons.config['ckan.activity_inbox_enabled']
+        super(TestDashboardActivityInbox, cls).teardown_class()
+
+    def test_12_dashboard_is_read_from_inbox(self):
+        # test_11 followed a group, so the user's inbox is waiting to be
+        # rebuilt and the dashboard is worked out from what they follow
+        user_id = self.new_user['id']
+        assert ckan.model.activity.activity_inbox_queued(user_id)
+        before = self.dashboard_activity_list(self.new_user)
+
+        while ckan.model.activity.process_activity_inbox_queue(
+                ckan.model.Session):
+            pass
+        ckan.model.Session.commit()
+        assert not ckan.model.activity.activity_inbox_queued(user_id)
+
+        table = ckan.model.activity_inbox_table
+        inbox = ckan.model.Session.query(table.c.activity_id).filter(
+            table.c.user_id == user_id).count()
+        assert inbox > 0
+        activities = self.dashboard_activity_list(self.new_user)
+        assert len(activities) == min(inbox, 15)
+        assert activities == before
@@ -0,0 +1,42 @@
+import time
+
+from pylons import config
+
+import ckan.model as model
+import ckan.lib.app_globals as app_globals
+from ckan.tests import CreateTestData
+
+
+class TestCheckUptodate(object):
+
+    @classmethod
+    def setup_class(cls):
+        CreateTestData.create()
+
+    @classmethod
+    def teardown_class(cls):
+        config.pop('ckan.config_update_check_interval', None)
+        model.repo.rebuild_db()
+
+    def setup(self):
+        self.globals = app_globals.app_globals
+        self.globals._check_uptodate()
+
+    def test_change_is_picked_up_after_interval(self):
+        config['ckan.config_update_check_interval'] = '0'
+        model.set_system_info('ckan.config_update', str(time.time()))
+        self.globals._check_uptodate()
+        assert self.globals._config_update == \
+            model.get_system_info('ckan.config_update')
+
+    def test_change_is_not_checked_within_interval(self):
+        config['ckan.config_update_check_interval'] = '3600'
+        before = self.globals._config_update
+        model.set_system_info('ckan.config_update', 'changed elsewhere')
+        self.globals._check_uptodate()
+        assert self.globals._config_update == before
+
+        # once the interval has passed the change is picked up
+        self.globals._config_update_checked -= 3600
+        self.globals._check_uptodate()
+        assert self.globals._config_update == 'changed elsewhere'
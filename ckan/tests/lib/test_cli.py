@@ -80,7 +80,7 @@ class TestSearch:
 
         # Rebuild index
         self.search.args = ()
-        self.search.options = FakeOptions(only_missing=False,force=False,refresh=False,commit_each=False)
+        self.search.options = FakeOptions(only_missing=False,force=False,refresh=False,commit_each=False,workers=1,batch_size=1)
         self.search.rebuild()
         pkg_count = model.Session.query(model.Package).filter(model.Package.state==u'active').count()
 
@@ -103,9 +103,30 @@ class TestSearch:
 
         # Rebuild index for annakarenina
         self.search.args = ('rebuild annakarenina').split()
-        self.search.options = FakeOptions(only_missing=False,force=False,refresh=False,commit_each=False)
+        self.search.options = FakeOptions(only_missing=False,force=False,refresh=False,commit_each=False,workers=1,batch_size=1)
         self.search.rebuild()
 
         self.query.run({'q':'*:*'})
 
         assert self.query.count == pkg_count
+
+    def test_clear_and_rebuild_batched(self):
+
+        # Clear index
+        self.search.args = ()
+        self.search.options = FakeOptions()
+        self.search.clear()
+
+        self.query.run({'q':'*:*'})
+
+        assert self.query.count == 0
+
+        # Rebuild index sending several datasets per request
+        self.search.args = ()
+        self.search.options = FakeOptions(only_missing=False,force=False,refresh=False,commit_each=False,workers=1,batch_size=2)
+        self.search.rebuild()
+        pkg_count = model.Session.query(model.Package).filter(model.Package.state==u'active').count()
+
+        self.query.run({'q':'*:*'})
+
+        assert self.query.count == pkg_count
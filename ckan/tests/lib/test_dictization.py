@@ -8,6 +8,7 @@ from ckan.lib.dictization import (table_dictize,
                               table_dict_save)
 
 from ckan.lib.dictization.model_dictize import (package_dictize,
+                                                package_dictize_many,
                                                 resource_dictize,
                                                 group_dictize,
                                                 activity_dictize,
@@ -1165,3 +1166,18 @@ class TestBasicDictize:
 
         # Passwords should never be available
         assert 'password' not in user_dict
+
+    def test_26_package_dictize_many(self):
+        context = {'model': model,
+                   'session': model.Session}
+
+        pkgs = model.Session.query(model.Package).all()
+        assert len(pkgs) > 1, pkgs
+        expected = [package_dictize(pkg, context) for pkg in pkgs]
+
+        pkg_ids = [pkg.id for pkg in pkgs]
+        result = package_dictize_many(pkg_ids + ['not-a-package-id'],
+                                      context)
+
+        print "\n".join(unified_diff(pformat(result).split("\n"), pformat(expected).split("\n")))
+        assert result == expected
@@ -0,0 +1,43 @@
+from nose.tools import assert_equal
+
+import ckan.model as model
+import ckan.plugins as plugins
+import ckan.lib.group_cache as group_cache
+from ckan.lib.create_test_data import CreateTestData
+
+
+class TestGroupCache(object):
+    @classmethod
+    def setup_class(cls):
+        CreateTestData.create()
+        # It's a system plugin, but may not be registered in a development
+        # install yet
+        cls.loaded_plugin = group_cache.GroupCachePlugin() not in \
+            plugins.PluginImplementations(plugins.ISession)
+        if cls.loaded_plugin:
+            plugins.load(group_cache.GroupCachePlugin)
+
+    @classmethod
+    def teardown_class(cls):
+        if cls.loaded_plugin:
+            plugins.unload(group_cache.GroupCachePlugin)
+        model.repo.rebuild_db()
+        group_cache.clear()
+
+    def test_display_names(self):
+        group = model.Group.by_name(u'david')
+        names = group_cache.get_display_names([u'david', group.id,
+                                               u'not-a-group'])
+        assert_equal(names, {u'david': u"Dave's books",
+                             group.id: u"Dave's books",
+                             u'not-a-group': u'not-a-group'})
+
+    def test_cache_cleared_on_group_change(self):
+        assert_equal(group_cache.get_display_name(u'roger'), u"Roger's books")
+
+        rev = model.repo.new_revision()
+        model.Group.by_name(u'roger').title = u'Books liked by Roger'
+        model.repo.commit_and_remove()
+
+        assert_equal(group_cache.get_display_name(u'roger'),
+                     u'Books liked by Roger')
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_equal
+
+import ckan.lib.jinja_extensions as jinja_extensions
+from ckan.lib.cli import TemplatesCommand
+
+
+class TestCkanFileSystemBytecodeCache(object):
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'cache')
+        self.searchpath = []
+        for name, source in (
+                ('custom', '{% ckan_extends %}{% block b %}custom '
+                           '{{ super() }}{% endblock %}'),
+                ('base', '{% block b %}base{% endblock %}')):
+            template_dir = os.path.join(self.tmp_dir, name)
+            os.mkdir(template_dir)
+            f = open(os.path.join(template_dir, 'page.html'), 'w')
+            f.write(source)
+            f.close()
+            self.searchpath.append(template_dir)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _environment(self, searchpath):
+        return jinja_extensions.Environment(
+            loader=jinja_extensions.CkanFileSystemLoader(searchpath),
+            bytecode_cache=jinja_extensions.CkanFileSystemBytecodeCache(
+                self.cache_dir, searchpath),
+            extensions=[jinja_extensions.CkanExtend])
+
+    def test_templates_are_cached(self):
+        env = self._environment(self.searchpath)
+        assert_equal(env.get_template('page.html').render(), 'custom base')
+        # the template and the one it extends
+        assert_equal(len(os.listdir(self.cache_dir)), 2)
+
+        # a new environment renders the same from the cache
+        env = self._environment(self.searchpath)
+        assert_equal(env.get_template('page.html').render(), 'custom base')
+        assert_equal(len(os.listdir(self.cache_dir)), 2)
+
+    def test_cache_files_are_readable_by_others(self):
+        umask = os.umask(022)
+        try:
+            env = self._environment(self.searchpath)
+        finally:
+            os.umask(umask)
+        env.get_template('page.html')
+        for filename in os.listdir(self.cache_dir):
+            mode = os.stat(os.path.join(self.cache_dir, filename)).st_mode
+            assert_equal(mode & 0777, 0644)
+
+    def test_failed_dump_leaves_no_files(self):
+        class FailingBucket(object):
+            key = 'failing'
+
+            def write_bytecode(self, f):
+                raise IOError('disk full')
+        cache = jinja_extensions.CkanFileSystemBytecodeCache(
+            self.cache_dir, self.searchpath)
+        try:
+            cache.dump_bytecode(FailingBucket())
+        except IOError:
+            pass
+        else:
+            assert False, 'the error should be raised'
+        assert_equal(os.listdir(self.cache_dir), [])
+
+    def test_cache_key_depends_on_searchpath(self):
+        cache = jinja_extensions.CkanFileSystemBytecodeCache(
+            self.cache_dir, self.searchpath)
+        other_cache = jinja_extensions.CkanFileSystemBytecodeCache(
+            self.cache_dir, self.searchpath[1:])
+        assert cache.get_cache_key('page.html') != \
+            other_cache.get_cache_key('page.html')
+
+    def test_template_names(self):
+        names = TemplatesCommand('templates')._template_names(self.searchpath)
+        assert_equal(names, ['page.html', '*0*page.html'])
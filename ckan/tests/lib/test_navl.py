@@ -6,7 +6,9 @@ from ckan.lib.navl.dictization_functions import (flatten_schema,
                                    missing,
                                    augment_data,
                                    validate,
-                                   validate_flattened)
+                                   validate_flattened,
+                                   compile_schema,
+                                   converter_arity)
 from pprint import pprint, pformat
 from ckan.lib.navl.validators import (identity_converter,
                         empty,
@@ -331,6 +333,50 @@ def test_simple_converter_types():
     assert not isinstance(converted_data["gender"], unicode)
 
 
+def test_compile_schema():
+    compiled = compile_schema(schema)
+    assert compiled.flattened == flatten_schema(schema)
+    assert compile_schema(compiled) is compiled
+
+
+def test_validate_compiled_schema():
+    compiled = compile_schema(schema)
+    for data in ({"0": "0 value", "2": [{"20": "20 value",
+                                          "21": [{"210": "210 value"}]}]},
+                 {"1": "1 value", "3": [{"30": "30 value"}], "4": "junk"}):
+        assert validate(data, compiled) == validate(data, schema)
+
+
+def test_converter_arity():
+    def value_only(value):
+        return value
+
+    def value_and_optional_context(value, context=None):
+        return value
+
+    def key_data_errors_context(key, data, errors, context):
+        pass
+
+    def value_and_context(value, context):
+        return value
+
+    def any_args(*args):
+        pass
+
+    class Converters(object):
+        def value_only(self, value):
+            return value
+
+    assert converter_arity(value_only) == 1
+    assert converter_arity(value_and_optional_context) == 1
+    assert converter_arity(key_data_errors_context) == 4
+    assert converter_arity(value_and_context) == 2
+    assert converter_arity(Converters().value_only) == 1
+    # these are found out by trying them
+    assert converter_arity(any_args) is None
+    assert converter_arity(unicode) is None
+
+
 def test_formencode_compat():
     schema = {
         "name": [not_empty, unicode],
@@ -0,0 +1,57 @@
+from nose.tools import assert_equal
+
+import ckan.model as model
+import ckan.logic as logic
+import ckan.lib.page_cache as page_cache
+from ckan.lib.create_test_data import CreateTestData
+
+
+class TestPageCacheTags(object):
+    @classmethod
+    def setup_class(cls):
+        CreateTestData.create()
+
+    @classmethod
+    def teardown_class(cls):
+        model.repo.rebuild_db()
+
+    def _package_dict(self, name):
+        context = {'model': model, 'session': model.Session,
+                   'ignore_auth': True}
+        return logic.get_action('package_show')(context, {'id': name})
+
+    def test_package(self):
+        pkg = model.Package.by_name(u'annakarenina')
+        tags = page_cache.tags_for_objects([pkg])
+        for tag in ('package:%s' % pkg.id, 'package:annakarenina',
+                    page_cache.SEARCH, page_cache.HOME, page_cache.OTHER):
+            assert tag in tags, tags
+        # The dataset's page is invalidated
+        page_tags = page_cache.package_tags(self._package_dict(pkg.name))
+        assert tags & set(page_tags), page_tags
+
+    def test_resource(self):
+        pkg = model.Package.by_name(u'annakarenina')
+        tags = page_cache.tags_for_objects([pkg.resources[0]])
+        assert page_cache.HOME not in tags, tags
+        # The page of the dataset the resource belongs to is invalidated,
+        # the pages of other datasets aren't
+        page_tags = page_cache.package_tags(self._package_dict(pkg.name))
+        assert tags & set(page_tags), page_tags
+        page_tags = page_cache.package_tags(self._package_dict(u'warandpeace'))
+        assert not tags & set(page_tags), page_tags
+
+    def test_group(self):
+        group = model.Group.by_name(u'david')
+        tags = page_cache.tags_for_objects([group])
+        assert 'group:%s' % group.id in tags, tags
+        assert 'group:david' in tags, tags
+        assert not [tag for tag in tags if tag.startswith('package:')], tags
+
+    def test_system_info(self):
+        tags = page_cache.tags_for_objects(
+            [model.SystemInfo(u'ckan.site_title', u'Test')])
+        assert page_cache.ALL in tags, tags
+
+    def test_no_objects(self):
+        assert_equal(page_cache.tags_for_objects([]), set())
@@ -0,0 +1,157 @@
+from pylons import config
+
+from ckan import model
+from ckan import plugins
+import ckan.lib.search as search
+
+from ckan.tests import CreateTestData, setup_test_search_index
+from ckan.tests.lib import check_search_results
+
+class TestSearchWithAsynchronousIndexing:
+    '''Check that datasets are indexed by the search index worker when
+    using the asynchronous search plugin.
+    '''
+
+    @classmethod
+    def setup_class(cls):
+        setup_test_search_index()
+        plugins.unload('synchronous_search')
+        plugins.load('asynchronous_search')
+
+    @classmethod
+    def teardown_class(cls):
+        plugins.unload('asynchronous_search')
+        plugins.load('synchronous_search')
+        model.repo.rebuild_db()
+        search.clear()
+
+    def teardown(self):
+        package = model.Package.by_name(u'async-bins')
+        if package:
+            package.purge()
+            model.repo.commit_and_remove()
+        while search.process_queue():
+            pass
+
+    def test_01_new_package_is_queued(self):
+        CreateTestData.create_arbitrary({'name': u'async-bins',
+                                         'title': u'Litter bins'})
+        check_search_results('bins', 0)
+        assert model.Session.query(model.SearchIndexQueue).count() > 0
+
+        search.process_queue()
+
+        check_search_results('bins', 1, ['async-bins'])
+        assert model.Session.query(model.SearchIndexQueue).count() == 0
+
+    def test_02_repeated_changes_are_coalesced(self):
+        CreateTestData.create_arbitrary({'name': u'async-bins',
+                                         'title': u'Litter bins'})
+        package = model.Package.by_name(u'async-bins')
+        rev = model.repo.new_revision()
+        package.title = u'Recycling bins'
+        model.repo.commit_and_remove()
+
+        entries = model.Session.query(model.SearchIndexQueue).count()
+        assert entries > 1, entries
+        assert search.process_queue() == entries
+
+        check_search_results('recycling', 1, ['async-bins'])
+
+    def test_03_deleted_package_is_removed(self):
+        CreateTestData.create_arbitrary({'name': u'async-bins',
+                                         'title': u'Litter bins'})
+        search.process_queue()
+        check_search_results('bins', 1, ['async-bins'])
+
+        rev = model.repo.new_revision()
+        model.Package.by_name(u'async-bins').delete()
+        model.repo.commit_and_remove()
+        search.process_queue()
+
+        check_search_results('bins', 0)
+
+    def test_04_failed_datasets_stay_queued(self):
+        CreateTestData.create_arbitrary({'name': u'async-bins',
+                                         'title': u'Litter bins'})
+
+        def failing_get_action(action):
+            def package_show(context, data_dict):
+                raise Exception('package_show failed')
+            return package_show
+        get_action = search.get_action
+        search.get_action = failing_get_action
+        try:
+            assert search.process_queue() == 0
+        finally:
+            search.get_action = get_action
+
+        entries = model.Session.query(model.SearchIndexQueue).all()
+        assert entries
+        for entry in entries:
+            assert entry.attempts == 1, entry.attempts
+            assert entry.error
+        check_search_results('bins', 0)
+
+        search.process_queue()
+        check_search_results('bins', 1, ['async-bins'])
+        assert model.Session.query(model.SearchIndexQueue).count() == 0
+
+    def test_05_purged_package_is_removed_from_queue(self):
+        CreateTestData.create_arbitrary({'name': u'async-bins',
+                                         'title': u'Litter bins'})
+        model.Package.by_name(u'async-bins').purge()
+        model.repo.commit_and_remove()
+        entries = model.Session.query(model.SearchIndexQueue).count()
+        assert entries > 0, entries
+
+        assert search.process_queue() == entries
+        check_search_results('bins', 0)
+
+    def _fail_queue(self):
+        def failing_get_action(action):
+            def package_show(context, data_dict):
+                raise Exception('package_show failed')
+            return package_show
+        get_action = search.get_action
+        search.get_action = failing_get_action
+        try:
+            assert search.process_queue() == 0
+        finally:
+            search.get_action = get_action
+
+    def test_06_failed_entries_can_be_retried_or_purged(self):
+        CreateTestData.create_arbitrary({'name': u'async-bins',
+                                         'title': u'Litter bins'})
+        package_id = model.Package.by_name(u'async-bins').id
+        max_attempts = config.get('ckan.search.queue_max_attempts')
+        config['ckan.search.queue_max_attempts'] = 1
+        try:
+            self._fail_queue()
+            entries = search.failed_queue_entries()
+            assert entries
+            assert search.failed_queue_entries(package_id) == entries
+            assert search.failed_queue_entries(u'another-id') == []
+            # the worker has given up on them
+            assert search.process_queue() == 0
+            check_search_results('bins', 0)
+
+            assert search.retry_failed_queue_entries(package_id) == \
+                len(entries)
+            assert search.failed_queue_entries() == []
+            assert search.process_queue() == len(entries)
+            check_search_results('bins', 1, ['async-bins'])
+
+            rev = model.repo.new_revision()
+            model.Package.by_name(u'async-bins').title = u'Recycling bins'
+            model.repo.commit_and_remove()
+            self._fail_queue()
+            entries = search.failed_queue_entries()
+            assert entries
+            assert search.purge_failed_queue_entries() == len(entries)
+            assert model.Session.query(model.SearchIndexQueue).count() == 0
+        finally:
+            if max_attempts is None:
+                del config['ckan.search.queue_max_attempts']
+            else:
+                config['ckan.search.queue_max_attempts'] = max_attempts
@@ -29,6 +29,46 @@ class TestSolrConfig(TestController):
                 raise AssertionError('SOLR connection problem. Connection defined in development.ini as: solr_url=%s Error: %s' % (config['solr_url'], e))
 
 
+class TestSolrConnectionPool(object):
+    def setup(self):
+        self.pool = search.SolrConnectionPool(size=2, idle_timeout=60)
+
+    def teardown(self):
+        self.pool.clear()
+
+    def test_reuses_released_connections(self):
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        assert self.pool.acquire() is conn
+        stats = self.pool.stats()
+        assert stats['hits'] == 1, stats
+        assert stats['misses'] == 1, stats
+
+    def test_pool_size_is_bounded(self):
+        conns = [self.pool.acquire() for i in range(3)]
+        for conn in conns:
+            self.pool.release(conn)
+        assert self.pool.stats()['idle'] == 2, self.pool.stats()
+
+    def test_idle_connections_expire(self):
+        self.pool.idle_timeout = -1
+        conn = self.pool.acquire()
+        self.pool.release(conn)
+        assert self.pool.acquire() is not conn
+        stats = self.pool.stats()
+        assert stats['discarded'] == 1, stats
+        assert stats['misses'] == 2, stats
+
+    def test_context_manager_discards_broken_connections(self):
+        search.SolrConnectionPool.reset()
+        try:
+            with search.solr_connection() as conn:
+                raise socket.error
+        except socket.error:
+            pass
+        assert search.connection_pool_stats()['idle'] == 0
+
+
 class TestSolrSearchIndex(TestController):
     """
     Tests that a package is indexed when the packagenotification is
@@ -117,6 +157,88 @@ class TestSolrSearchIndex(TestController):
         assert response.results[0]['index_id'] == self._get_index_id (pkg_dict['id'])
         assert response.results[0]['title'] == u'\u00c3altimo n\u00famero penguin'
 
+    def test_commit_window(self):
+        pkg_dicts = [{
+            'id': u'penguin-%i' % i,
+            'name': u'penguin-%i' % i,
+            'title': u'penguin',
+            'state': u'active',
+            'metadata_created': datetime.now().isoformat(),
+            'metadata_modified': datetime.now().isoformat(),
+        } for i in range(3)]
+        with search.commit_window() as window:
+            for pkg_dict in pkg_dicts:
+                search.dispatch_by_operation('Package', pkg_dict, 'new')
+            search.dispatch_by_operation('Package', {'id': u'penguin-0'},
+                                         'deleted')
+            # what the search plugin does when the transaction commits
+            window.commit_pending()
+            response = self.solr.query('title:penguin', fq=self.fq)
+            assert len(response) == 0, len(response)
+
+        response = self.solr.query('title:penguin', fq=self.fq)
+        assert len(response) == 2, len(response)
+        assert set(r['name'] for r in response.results) == \
+            set([u'penguin-1', u'penguin-2'])
+
+    def test_commit_window_on_error(self):
+        pkg_dicts = [{
+            'id': u'penguin-%i' % i,
+            'name': u'penguin-%i' % i,
+            'title': u'penguin',
+            'state': u'active',
+            'metadata_created': datetime.now().isoformat(),
+            'metadata_modified': datetime.now().isoformat(),
+        } for i in range(2)]
+        try:
+            with search.commit_window() as window:
+                search.dispatch_by_operation('Package', pkg_dicts[0], 'new')
+                window.commit_pending()
+                # the transaction of this one is never committed
+                search.dispatch_by_operation('Package', pkg_dicts[1], 'new')
+                raise ValueError('request failed')
+        except ValueError:
+            pass
+        assert search.index.current_commit_window() is None
+        # only the committed change was sent
+        response = self.solr.query('title:penguin', fq=self.fq)
+        assert len(response) == 1, len(response)
+        assert response.results[0]['name'] == u'penguin-0'
+
+    def test_commit_window_rollback(self):
+        pkg_dict = {
+            'id': u'penguin-id',
+            'title': u'penguin',
+            'state': u'active',
+            'metadata_created': datetime.now().isoformat(),
+            'metadata_modified': datetime.now().isoformat(),
+        }
+        with search.commit_window() as window:
+            search.dispatch_by_operation('Package', pkg_dict, 'new')
+            window.discard_pending()
+        response = self.solr.query('title:penguin', fq=self.fq)
+        assert len(response) == 0, len(response)
+
+    def test_commit_policy(self):
+        original = config.get('ckan.search.commit_policy')
+        try:
+            config['ckan.search.commit_policy'] = 'nowait'
+            assert search.commit_policy() == {'wait_flush': False,
+                                              'wait_searcher': False}
+            config['ckan.search.commit_policy'] = 'none'
+            assert search.commit_policy() is None
+            config['ckan.search.commit_policy'] = 'bad-policy'
+            try:
+                search.commit_policy()
+                assert False, 'SearchIndexError not raised'
+            except search.SearchIndexError:
+                pass
+        finally:
+            if original is None:
+                config.pop('ckan.search.commit_policy', None)
+            else:
+                config['ckan.search.commit_policy'] = original
+
 
 class TestSolrSearch:
     @classmethod
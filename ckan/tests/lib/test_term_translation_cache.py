@@ -0,0 +1,58 @@
+from nose.tools import assert_equal
+from pylons import config
+
+import ckan.model as model
+import ckan.logic.action.update
+import ckan.lib.term_translation_cache as term_translation_cache
+from ckan.lib.create_test_data import CreateTestData
+
+
+class TestTermTranslationCache(object):
+    @classmethod
+    def setup_class(cls):
+        CreateTestData.create()
+        context = {'model': model, 'session': model.Session,
+                   'user': 'testsysadmin', 'ignore_auth': True}
+        for data_dict in ({'term': u'moon', 'term_translation': u'lune',
+                           'lang_code': u'fr'},
+                          {'term': u'moon', 'term_translation': u'Mond',
+                           'lang_code': u'de'},
+                          {'term': u'sun', 'term_translation': u'soleil',
+                           'lang_code': u'fr'}):
+            ckan.logic.action.update.term_translation_update(context,
+                                                             data_dict)
+
+    @classmethod
+    def teardown_class(cls):
+        config.pop('ckan.term_translation_cache_size', None)
+        model.repo.rebuild_db()
+        term_translation_cache.clear()
+
+    def setup(self):
+        term_translation_cache.clear()
+
+    def test_get_translations(self):
+        translations = term_translation_cache.get_translations(
+            [u'moon', u'sun', u'star', 3])
+        assert_equal(translations, {u'moon': {u'fr': u'lune', u'de': u'Mond'},
+                                    u'sun': {u'fr': u'soleil'},
+                                    u'star': {}})
+
+    def test_cache_cleared_on_update(self):
+        assert_equal(term_translation_cache.get_translations([u'sun']),
+                     {u'sun': {u'fr': u'soleil'}})
+
+        context = {'model': model, 'session': model.Session,
+                   'user': 'testsysadmin', 'ignore_auth': True}
+        ckan.logic.action.update.term_translation_update(context,
+            {'term': u'sun', 'term_translation': u'Sonne',
+             'lang_code': u'de'})
+
+        assert_equal(term_translation_cache.get_translations([u'sun']),
+                     {u'sun': {u'fr': u'soleil', u'de': u'Sonne'}})
+
+    def test_size_is_bounded(self):
+        config['ckan.term_translation_cache_size'] = '2'
+        term_translation_cache.get_translations([u'moon', u'sun', u'star'])
+        assert_equal(len(term_translation_cache._cache), 2)
+        del config['ckan.term_translation_cache_size']
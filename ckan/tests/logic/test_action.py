@@ -64,6 +64,50 @@ class TestAction(WsgiAppCase):
         assert res['help'].startswith(
             "Return a list of the names of the site's datasets (packages).")
 
+    def test_01_package_list_paged(self):
+        postparams = '%s=1' % json.dumps({'limit': 1})
+        res = json.loads(self.app.post('/api/action/package_list',
+                                       params=postparams).body)
+        assert_equal(res['result'], ['annakarenina'])
+
+        postparams = '%s=1' % json.dumps({'limit': 1,
+                                          'since': 'annakarenina'})
+        res = json.loads(self.app.post('/api/action/package_list',
+                                       params=postparams).body)
+        assert_equal(res['result'], ['warandpeace'])
+
+        postparams = '%s=1' % json.dumps({'since': 'warandpeace'})
+        res = json.loads(self.app.post('/api/action/package_list',
+                                       params=postparams).body)
+        assert_equal(res['result'], [])
+
+    def test_01_current_package_list_with_resources_since(self):
+        postparams = '%s=1' % json.dumps({})
+        res = json.loads(self.app.post(
+            '/api/action/current_package_list_with_resources',
+            params=postparams).body)
+        all_packages = res['result']
+        assert len(all_packages) >= 2
+
+        packages = []
+        since = {}
+        while True:
+            data_dict = dict(since, limit=1)
+            postparams = '%s=1' % json.dumps(data_dict)
+            res = json.loads(self.app.post(
+                '/api/action/current_package_list_with_resources',
+                params=postparams).body)
+            if not res['result']:
+                break
+            assert_equal(len(res['result']), 1)
+            package = res['result'][0]
+            packages.append(package)
+            since = {'since_timestamp': package['revision_timestamp'],
+                     'since_id': package['id']}
+        assert_equal([p['name'] for p in packages],
+                     [p['name'] for p in all_packages])
+        assert 'resources' in packages[0]
+
     def test_01_package_show(self):
         anna_id = model.Package.by_name(u'annakarenina').id
         postparams = '%s=1' % json.dumps({'id': anna_id})
@@ -94,6 +138,99 @@ class TestAction(WsgiAppCase):
         missing_keys = set(('title', 'groups')) - set(pkg.keys())
         assert not missing_keys, missing_keys
 
+    def test_01_package_show_without_help(self):
+        anna_id = model.Package.by_name(u'annakarenina').id
+        postparams = '%s=1' % json.dumps({'id': anna_id})
+        res = self.app.post('/api/action/package_show?help=false',
+                            params=postparams)
+        res_dict = json.loads(res.body)
+        assert_equal(res_dict['success'], True)
+        assert 'help' not in res_dict
+        assert_equal(res_dict['result']['name'], 'annakarenina')
+
+        res = self.app.get('/api/action/package_show',
+                           params={'id': anna_id, 'help': 'false'})
+        res_dict = json.loads(res.body)
+        assert 'help' not in res_dict
+        assert_equal(res_dict['result']['name'], 'annakarenina')
+
+    def test_01_package_list_streamed(self):
+        import ckan.controllers.api as api
+        chunk_size = api.JSON_CHUNK_SIZE
+        # write each dataset name in a piece of its own
+        api.JSON_CHUNK_SIZE = 1
+        try:
+            res = self.app.post('/api/action/package_list?help=false',
+                                params='%s=1' % json.dumps({}))
+        finally:
+            api.JSON_CHUNK_SIZE = chunk_size
+        res_dict = json.loads(res.body)
+        assert_equal(res_dict, {'success': True,
+                                'result': ['annakarenina', 'warandpeace']})
+
+        res = self.app.post('/api/action/package_list?callback=jsoncallback',
+                            params='%s=1' % json.dumps({}))
+        assert re.match('jsoncallback\(.*\);', res.body), res
+        res_dict = json.loads(res.body[len('jsoncallback')+1:-2])
+        assert_equal(res_dict['result'], ['annakarenina', 'warandpeace'])
+        assert 'help' in res_dict
+
+    def test_01_package_show_help_site_default(self):
+        anna_id = model.Package.by_name(u'annakarenina').id
+        postparams = '%s=1' % json.dumps({'id': anna_id})
+        config['ckan.api.include_help'] = 'false'
+        try:
+            res = self.app.post('/api/action/package_show',
+                                params=postparams)
+            assert 'help' not in json.loads(res.body)
+
+            res = self.app.post('/api/action/package_show?help=true',
+                                params=postparams)
+            assert json.loads(res.body)['help'].startswith(
+                "Return the metadata of a dataset (package) and its "
+                "resources.")
+        finally:
+            del config['ckan.api.include_help']
+
+    def test_01_batch(self):
+        anna_id = model.Package.by_name(u'annakarenina').id
+        calls = [{'action': 'package_show', 'data_dict': {'id': anna_id}},
+                 {'action': 'package_show',
+                  'data_dict': {'id': 'does-not-exist'}},
+                 {'action': 'package_list'}]
+        postparams = '%s=1' % json.dumps({'calls': calls})
+        res = self.app.post('/api/3/batch', params=postparams)
+        res_dict = json.loads(res.body)
+        assert_equal(res_dict['success'], True)
+        results = res_dict['result']
+        assert_equal(len(results), 3)
+        assert_equal(results[0]['success'], True)
+        assert_equal(results[0]['result']['name'], 'annakarenina')
+        assert 'help' not in results[0]
+        assert_equal(results[1]['success'], False)
+        assert_equal(results[1]['error']['__type'], 'Not Found Error')
+        assert_equal(results[2]['success'], True)
+        assert 'warandpeace' in results[2]['result']
+
+    def test_01_batch_unexpected_error(self):
+        # a limit that isn't a number or a string raises a TypeError
+        calls = [{'action': 'package_list', 'data_dict': {'limit': []}},
+                 {'action': 'package_list'}]
+        postparams = '%s=1' % json.dumps({'calls': calls})
+        res = self.app.post('/api/3/batch', params=postparams)
+        results = json.loads(res.body)['result']
+        assert_equal(results[0]['success'], False)
+        assert_equal(results[0]['error']['__type'], 'Internal Server Error')
+        assert_equal(results[1]['success'], True)
+        assert 'warandpeace' in results[1]['result']
+
+    def test_01_batch_bad_request(self):
+        for calls in ([{'action': 'not_an_action'}],
+                      [{'action': 'package_list', 'data_dict': []}],
+                      'package_list'):
+            postparams = '%s=1' % json.dumps({'calls': calls})
+            self.app.post('/api/3/batch', params=postparams, status=400)
+
     def test_02_package_autocomplete_match_name(self):
         postparams = '%s=1' % json.dumps({'q':'war'})
         res = self.app.post('/api/action/package_autocomplete', params=postparams)
@@ -170,6 +307,61 @@ class TestAction(WsgiAppCase):
         package_created.pop('metadata_modified')
         assert package_updated == package_created#, (pformat(json.loads(res.body)), pformat(package_created['result']))
 
+    def test_03_create_update_package_many(self):
+        packages = [{'name': u'warandpeace_many', 'title': u'War and Peace'},
+                    {'name': u'warandpeace_many'},
+                    {'name': u'annakarenina_many',
+                     'tags': [{'name': u'russian'}]}]
+        postparams = '%s=1' % json.dumps({'data': packages})
+        res = self.app.post('/api/action/package_create_many', params=postparams,
+                            extra_environ={'Authorization': 'tester'})
+        results = json.loads(res.body)['result']
+        assert_equal([r['success'] for r in results], [True, False, True])
+        assert 'name' in results[1]['error'], results[1]
+
+        shown = []
+        for result in (results[0], results[2]):
+            postparams = '%s=1' % json.dumps({'id': result['id']})
+            res = self.app.post('/api/action/package_show', params=postparams)
+            shown.append(json.loads(res.body)['result'])
+        assert_equal(shown[0]['name'], u'warandpeace_many')
+        assert_equal(shown[1]['tags'][0]['name'], u'russian')
+        # Both datasets were created in the same revision
+        assert_equal(shown[0]['revision_id'], shown[1]['revision_id'])
+
+        packages = [{'id': results[0]['id'], 'title': u'War & Peace'},
+                    {'id': u'not_a_dataset'},
+                    {'name': u'annakarenina_many', 'title': u'Anna Karenina'}]
+        postparams = '%s=1' % json.dumps({'data': packages})
+        res = self.app.post('/api/action/package_update_many', params=postparams,
+                            extra_environ={'Authorization': 'tester'})
+        results = json.loads(res.body)['result']
+        assert_equal([r['success'] for r in results], [True, False, True])
+        assert_equal(results[0]['id'], shown[0]['id'])
+
+        postparams = '%s=1' % json.dumps({'id': u'annakarenina_many'})
+        res = self.app.post('/api/action/package_show', params=postparams)
+        assert_equal(json.loads(res.body)['result']['title'], u'Anna Karenina')
+
+    def test_03_create_package_many_bad_request(self):
+        for data in ({'name': u'not_a_list'}, [u'not_a_dict'],
+                     [{'name': u'too_many_%i' % i} for i in range(101)]):
+            postparams = '%s=1' % json.dumps({'data': data})
+            res = self.app.post('/api/action/package_create_many',
+                                params=postparams,
+                                extra_environ={'Authorization': 'tester'},
+                                status=StatusCodes.STATUS_409_CONFLICT)
+
+    def test_03_create_package_many_not_authorized(self):
+        packages = [{'name': u'warandpeace_not_authorized'},
+                    {'name': u'annakarenina_not_authorized'}]
+        postparams = '%s=1' % json.dumps({'data': packages})
+        res = self.app.post('/api/action/package_create_many', params=postparams)
+        results = json.loads(res.body)['result']
+        assert_equal([r['success'] for r in results], [False, False])
+        assert_equal(results[0]['error']['__type'], 'Authorization Error')
+        assert not model.Package.by_name(u'warandpeace_not_authorized')
+
     def test_18_create_package_not_authorized(self):
 
         package = {
@@ -202,6 +394,29 @@ class TestAction(WsgiAppCase):
 
         assert resource['url'] == 'http://new_url'
 
+        # the resource is added to the end of the dataset's resources
+        postparams = '%s=1' % json.dumps({'id': anna_id})
+        res = self.app.post('/api/action/package_show', params=postparams)
+        resources = json.loads(res.body)['result']['resources']
+        assert_equal(resources[-1]['id'], resource['id'])
+        assert_equal(resources[-1]['url'], 'http://new_url')
+
+    def test_41_create_resource_plugin_hook(self):
+        from ckan.tests.functional.test_package import MockPackageControllerPlugin
+        plugin = MockPackageControllerPlugin()
+        plugins.load(plugin)
+        edits = plugin.calls['edit']
+
+        anna_id = model.Package.by_name(u'annakarenina').id
+        resource = {'package_id': anna_id, 'url': 'http://hook_url'}
+        api_key = model.User.get('annafan').apikey.encode('utf8')
+        postparams = '%s=1' % json.dumps(resource)
+        res = self.app.post('/api/action/resource_create', params=postparams,
+                            extra_environ={'Authorization': api_key })
+
+        assert_equal(plugin.calls['edit'], edits + 1)
+        plugins.unload(plugin)
+
     def test_42_create_resource_with_error(self):
 
         anna_id = model.Package.by_name(u'annakarenina').id
@@ -229,6 +444,33 @@ class TestAction(WsgiAppCase):
         assert res_obj['result'][0]['about'] == 'I love reading Annakarenina. My site: <a href="http://anna.com">anna.com</a>'
         assert not 'apikey' in res_obj['result'][0]
 
+    def test_04_user_list_paged(self):
+        postparams = '%s=1' % json.dumps({})
+        res = self.app.post('/api/action/user_list', params=postparams)
+        all_users = json.loads(res.body)['result']
+
+        postparams = '%s=1' % json.dumps({'limit': 2, 'offset': 1})
+        res = self.app.post('/api/action/user_list', params=postparams)
+        res_obj = json.loads(res.body)
+        assert res_obj['success'] == True
+        assert res_obj['result'] == all_users[1:3]
+
+        for user in all_users:
+            user_obj = model.User.get(user['name'])
+            assert user['number_of_edits'] == user_obj.number_of_edits()
+            assert user['number_administered_packages'] == \
+                user_obj.number_administered_packages()
+
+    def test_04_user_list_paged_bad_params(self):
+        for params in ({'limit': 'abc'}, {'offset': 'abc'}, {'limit': []},
+                       {'limit': -1}, {'offset': -1}):
+            postparams = '%s=1' % json.dumps(params)
+            res = self.app.post('/api/action/user_list', params=postparams,
+                                status=StatusCodes.STATUS_409_CONFLICT)
+            res_obj = json.loads(res.body)
+            assert res_obj['success'] is False
+            assert_equal(res_obj['error']['__type'], 'Parameter Error')
+
     def test_05_user_show(self):
         # Anonymous request
         postparams = '%s=1' % json.dumps({'id':'annafan'})
@@ -1059,6 +1301,37 @@ class TestAction(WsgiAppCase):
             assert "index" in resource['description'].lower()
             assert "json" in resource['format'].lower()
 
+class TestActionUserListDictize(WsgiAppCase):
+
+    @classmethod
+    def setup_class(self):
+        CreateTestData.create()
+
+    @classmethod
+    def teardown_class(self):
+        model.repo.rebuild_db()
+
+    def test_1_group_show_and_follower_list(self):
+        # group_show and the follower lists dictize lists of users too
+        postparams = '%s=1' % json.dumps(
+            {'name': 'user_list_group',
+             'users': [{'name': 'annafan', 'capacity': 'editor'}]})
+        self.app.post('/api/action/group_create', params=postparams,
+                      extra_environ={'Authorization': 'tester'})
+        postparams = '%s=1' % json.dumps({'id': 'user_list_group'})
+        res = self.app.post('/api/action/group_show', params=postparams)
+        users = json.loads(res.body)['result']['users']
+        assert 'annafan' in [user['name'] for user in users], users
+
+        postparams = '%s=1' % json.dumps({'id': 'annafan'})
+        self.app.post('/api/action/follow_user', params=postparams,
+                      extra_environ={'Authorization': 'tester'})
+        res = self.app.post('/api/action/user_follower_list',
+                            params=postparams)
+        followers = json.loads(res.body)['result']
+        assert_equal([user['name'] for user in followers], ['tester'])
+
+
 class TestActionTermTranslation(WsgiAppCase):
 
     @classmethod
@@ -1289,6 +1562,22 @@ class MockPackageSearchPlugin(SingletonPlugin):
 
 MockPackageSearchPlugin().disable()
 
+class MockPackageViewManyPlugin(SingletonPlugin):
+    implements(IPackageController, inherit=True)
+
+    calls = []
+
+    def before_view(self, data_dict):
+        raise AssertionError('before_view called instead of before_view_many')
+
+    def before_view_many(self, data_dicts):
+        self.calls.append([data_dict['name'] for data_dict in data_dicts])
+        for data_dict in data_dicts:
+            data_dict['viewed_many'] = True
+        return data_dicts
+
+MockPackageViewManyPlugin().disable()
+
 class TestSearchPluginInterface(WsgiAppCase):
 
     @classmethod
@@ -1369,4 +1658,40 @@ class TestSearchPluginInterface(WsgiAppCase):
         res = self.app.get('/dataset?q=')
         assert res.body.count('string_not_found_in_rest_of_template') == 2
 
+    def test_before_view_many(self):
+        plugin = MockPackageViewManyPlugin()
+        plugin.calls = []
+        plugin.activate()
+        plugin.enable()
+        try:
+            context = {'model': model, 'session': model.Session,
+                       'for_view': True}
+            result = get_action('package_search')(context, {'q': '*:*'})
+        finally:
+            plugin.disable()
+
+        # the whole page is passed to before_view_many once
+        assert_equal(len(plugin.calls), 1)
+        assert_equal(sorted(plugin.calls[0]), ['annakarenina', 'warandpeace'])
+        for package_dict in result['results']:
+            assert package_dict['viewed_many'] is True
+            # plugins that only have before_view are called per package
+            assert_equal(package_dict['title'],
+                         'string_not_found_in_rest_of_template')
+
+    def test_before_view_many_not_for_view(self):
+        plugin = MockPackageViewManyPlugin()
+        plugin.calls = []
+        plugin.activate()
+        plugin.enable()
+        try:
+            context = {'model': model, 'session': model.Session}
+            result = get_action('package_search')(context, {'q': '*:*'})
+        finally:
+            plugin.disable()
+
+        assert_equal(plugin.calls, [])
+        for package_dict in result['results']:
+            assert 'viewed_many' not in package_dict
+
 
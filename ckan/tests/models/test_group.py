@@ -53,6 +53,16 @@ class TestGroup(object):
         assert set(grp.packages()) == set((anna, war)), grp.packages()
         assert grp in anna.get_groups()
 
+    def test_2_package_counts(self):
+        groups = [model.Group.by_name(name)
+                  for name in (u'russian', u'david', u'roger', u'group1')]
+        counts = model.Group.package_counts([group.id for group in groups])
+        for group in groups:
+            assert_equal(counts.get(group.id, 0), len(group.packages()))
+        assert_equal(counts[groups[0].id], 2)
+        assert groups[3].id not in counts
+        assert_equal(model.Group.package_counts([]), {})
+
     def test_3_search(self):
         def search_results(query):
             results = model.Group.search_by_name_or_title(query)
@@ -1,7 +1,9 @@
 import json
 import datetime
+import time
 import shlex
 import os
+import sys
 import urllib
 import urllib2
 import urlparse
@@ -28,6 +30,13 @@ _pg_types = {}
 _type_names = set()
 _engines = {}
 
+## fields and unique keys of datastore tables, by resource id. Entries are
+## dropped when this process changes a table and expire after
+## table_metadata_timeout seconds so changes made by other processes are
+## picked up.
+_table_metadata = {}
+table_metadata_timeout = 60
+
 _date_formats = ['%Y-%m-%d',
                 '%Y-%m-%d %H:%M:%S',
                 '%Y-%m-%dT%H:%M:%S',
@@ -211,18 +220,42 @@ def _guess_type(field):
     return 'text'
 
 
+def _cached_table_metadata(resource_id):
+    entry = _table_metadata.get(resource_id)
+    if entry is None or time.time() - entry['cached'] > table_metadata_timeout:
+        entry = _table_metadata[resource_id] = {'cached': time.time()}
+    return entry
+
+
+def _is_table_metadata_cached(resource_id):
+    entry = _table_metadata.get(resource_id)
+    return (entry is not None and 'fields' in entry
+            and time.time() - entry['cached'] <= table_metadata_timeout)
+
+
+def clear_table_metadata(resource_id=None):
+    '''Forget the cached fields and unique key of a table (or all tables)'''
+    if resource_id is None:
+        _table_metadata.clear()
+    else:
+        _table_metadata.pop(resource_id, None)
+
+
 def _get_fields(context, data_dict):
-    fields = []
-    all_fields = context['connection'].execute(
-        u'SELECT * FROM "{0}" LIMIT 1'.format(data_dict['resource_id'])
-    )
-    for field in all_fields.cursor.description:
-        if not field[0].startswith('_'):
-            fields.append({
-                'id': field[0].decode('utf-8'),
-                'type': _get_type(context, field[1])
-            })
-    return fields
+    entry = _cached_table_metadata(data_dict['resource_id'])
+    if 'fields' not in entry:
+        fields = []
+        all_fields = context['connection'].execute(
+            u'SELECT * FROM "{0}" LIMIT 1'.format(data_dict['resource_id'])
+        )
+        for field in all_fields.cursor.description:
+            if not field[0].startswith('_'):
+                fields.append({
+                    'id': field[0].decode('utf-8'),
+                    'type': _get_type(context, field[1])
+                })
+        entry['fields'] = fields
+    return [dict(field) for field in entry['fields']]
 
 
 def json_get_values(obj, current_list=None):
@@ -516,6 +549,10 @@ def upsert_data(context, data_dict):
     fields = _get_fields(context, data_dict)
     field_names = _pluck('id', fields)
     records = data_dict['records']
+
+    if _get_bool(data_dict.get('bulk')):
+        return _bulk_upsert_data(context, data_dict, fields, method)
+
     sql_columns = ", ".join(['"%s"' % name.replace('%', '%%') for name in field_names]
                             + ['"_full_text"'])
 
@@ -625,6 +662,219 @@ def upsert_data(context, data_dict):
                         sql_string, (used_values + [full_text] + unique_values) * 2)
 
 
+class _CopyStream(object):
+    '''File-like object feeding records to COPY FROM STDIN.
+
+    Rows are only serialized as psycopg2 reads them, so a large upload is
+    never held in memory a second time as one COPY payload.
+    '''
+    def __init__(self, fields, records, full_text=False):
+        self._lines = (_copy_line(fields, record, full_text)
+                       for record in records)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        if not self._buffer:
+            self._buffer = next(self._lines, '')
+        line, sep, rest = self._buffer.partition('\n')
+        self._buffer = rest
+        return line + sep
+
+
+def _copy_escape(value):
+    '''Escape a value for the text format of COPY'''
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+                 .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _quote_literal(value):
+    '''Quote an element of an array or composite literal'''
+    return u'"{0}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def _copy_text(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return u'true' if value else u'false'
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, list):
+        return u'{{{0}}}'.format(u','.join(
+            u'NULL' if item is None else
+            _copy_text(item) if isinstance(item, list) else
+            _quote_literal(_copy_text(item)) for item in value))
+    if isinstance(value, dict):
+        return json.dumps(value).decode('utf-8')
+    return unicode(value)
+
+
+def _copy_line(fields, record, full_text=False):
+    values = []
+    for field in fields:
+        value = record.get(field['id'])
+        if value is not None and field['type'].lower() == 'nested':
+            ## a composite with an empty second value
+            value = u'({0},"")'.format(
+                _quote_literal(json.dumps(value).decode('utf-8')))
+        else:
+            value = _copy_text(value)
+        values.append(u'\\N' if value is None else _copy_escape(value))
+    if full_text:
+        values.append(_copy_escape(_copy_text(_to_full_text(fields, record))))
+    return (u'\t'.join(values) + u'\n').encode('utf-8')
+
+
+def _copy_records(context, table, fields, records, full_text=False):
+    '''Stream records into table using COPY FROM STDIN
+
+    If full_text is True the text to index for each record is copied into
+    an extra "_full_text" column.
+    '''
+    columns = [u'"{0}"'.format(field['id']) for field in fields]
+    if full_text:
+        columns.append(u'"_full_text"')
+    sql_string = u'COPY "{table}" ({columns}) FROM STDIN'.format(
+        table=table,
+        columns=u', '.join(columns)
+    )
+    cursor = context['connection'].connection.cursor()
+    try:
+        cursor.copy_expert(sql_string.encode('utf-8'),
+                           _CopyStream(fields, records, full_text))
+    finally:
+        cursor.close()
+
+
+def _bulk_upsert_data(context, data_dict, fields, method):
+    '''Bulk version of upsert_data.
+
+    Records are loaded with COPY instead of one statement per record. They
+    are copied into a temporary staging table, together with the text to
+    index for each of them, and written to the resource table with one
+    UPDATE ... FROM and/or one INSERT ... SELECT, which compute _full_text
+    for just the staged rows.
+    '''
+    res_id = data_dict['resource_id']
+    field_names = _pluck('id', fields)
+    records = data_dict['records']
+
+    if method == INSERT:
+        for num, record in enumerate(records):
+            _validate_record(record, num, field_names)
+        used_fields = fields
+        unique_keys = []
+    else:
+        unique_keys = _get_unique_key(context, data_dict)
+        if len(unique_keys) < 1:
+            raise ValidationError({
+                'table': [u'table does not have a unique key defined']
+            })
+
+        used_field_names = set(records[0].keys()) if isinstance(
+            records[0], dict) else set()
+        by_key = {}
+        for num, record in enumerate(records):
+            _validate_record(record, num, field_names)
+            missing_fields = [field for field in unique_keys
+                    if field not in record]
+            if missing_fields:
+                raise ValidationError({
+                    'key': [u'fields "{0}" are missing but needed as key'.format(
+                        ', '.join(missing_fields))]
+                })
+            if set(record.keys()) != used_field_names:
+                raise ValidationError({
+                    'records': [u'row "{0}" does not have the same fields '
+                                u'as the first row, which is required for '
+                                u'bulk updates'.format(num + 1)]
+                })
+            ## later records win, as they would one statement at a time
+            by_key[json.dumps([record[key] for key in unique_keys])] = record
+        records = by_key.values()
+
+        used_fields = [field for field in fields
+                       if field['id'] in used_field_names]
+
+    staging = u'_staging_{0}'.format(res_id)
+    field_columns = [u'"{0}"'.format(field['id']) for field in used_fields]
+    columns = u', '.join(field_columns + [u'"_full_text"'])
+    key_match = u'({0}) = ({1})'.format(
+        u', '.join(u't."{0}"'.format(key) for key in unique_keys),
+        u', '.join(u's."{0}"'.format(key) for key in unique_keys))
+    format_args = dict(
+        res_id=res_id,
+        staging=staging,
+        columns=columns,
+        key_match=key_match,
+        ## the staging table has the text to index, not the tsvector
+        staging_columns=u', '.join(field_columns +
+                                   [u"''::text AS \"_full_text\""]),
+        staged_columns=u', '.join([u's."{0}"'.format(field['id'])
+                                   for field in used_fields] +
+                                  [u'to_tsvector(s."_full_text")']),
+    )
+
+    context['connection'].execute(u'''
+        CREATE TEMPORARY TABLE "{staging}" ON COMMIT DROP AS
+        SELECT {staging_columns} FROM "{res_id}" WITH NO DATA
+    '''.format(**format_args).replace('%', '%%'))
+    _copy_records(context, staging, used_fields, records, full_text=True)
+
+    if method == UPDATE:
+        missing = context['connection'].execute(u'''
+            SELECT {keys} FROM "{staging}" s
+            WHERE NOT EXISTS (SELECT 1 FROM "{res_id}" t
+                              WHERE {key_match})
+            LIMIT 1
+        '''.format(keys=u', '.join(u's."{0}"'.format(key)
+                                     for key in unique_keys),
+                     **format_args).replace('%', '%%')).fetchone()
+        if missing:
+            raise ValidationError({
+                'key': [u'key "{0}" not found'.format(list(missing))]
+            })
+
+    if method in [UPDATE, UPSERT]:
+        context['connection'].execute(u'''
+            UPDATE "{res_id}" t
+            SET ({columns}) = ({staged_columns})
+            FROM "{staging}" s
+            WHERE {key_match}
+        '''.format(**format_args).replace('%', '%%'))
+
+    if method in [INSERT, UPSERT]:
+        if method == UPSERT:
+            new_rows = u'''WHERE NOT EXISTS (SELECT 1 FROM "{res_id}" t
+                                            WHERE {key_match})'''.format(
+                **format_args)
+        else:
+            new_rows = u''
+        context['connection'].execute(u'''
+            INSERT INTO "{res_id}" ({columns})
+            SELECT {staged_columns} FROM "{staging}" s
+            {new_rows}
+        '''.format(new_rows=new_rows, **format_args).replace('%', '%%'))
+
+    ## don't wait for the commit, so more records can be loaded in the
+    ## same transaction
+    context['connection'].execute(u'DROP TABLE "{staging}"'.format(
+        **format_args).replace('%', '%%'))
+
+
 def _get_unique_key(context, data_dict):
     sql_get_unique_key = '''
     SELECT
@@ -642,8 +892,11 @@ def _get_unique_key(context, data_dict):
         AND idx.indisprimary = false
         AND t.relname = %s
     '''
-    key_parts = context['connection'].execute(sql_get_unique_key, data_dict['resource_id'])
-    return [x[0] for x in key_parts]
+    entry = _cached_table_metadata(data_dict['resource_id'])
+    if 'unique_keys' not in entry:
+        key_parts = context['connection'].execute(sql_get_unique_key, data_dict['resource_id'])
+        entry['unique_keys'] = [x[0] for x in key_parts]
+    return list(entry['unique_keys'])
 
 
 def _validate_record(record, num, field_names):
@@ -933,6 +1186,7 @@ def create(context, data_dict):
             create_table(context, data_dict)
         else:
             alter_table(context, data_dict)
+        clear_table_metadata(data_dict['resource_id'])
         insert_data(context, data_dict)
         create_indexes(context, data_dict)
         create_alias(context, data_dict)
@@ -957,6 +1211,8 @@ def create(context, data_dict):
             })
         raise
     finally:
+        ## indexes may have changed, or the transaction was rolled back
+        clear_table_metadata(data_dict['resource_id'])
         context['connection'].close()
 
 
@@ -1022,6 +1278,7 @@ def delete(context, data_dict):
             context['connection'].execute(
                 u'DROP TABLE "{0}" CASCADE'.format(data_dict['resource_id'])
             )
+            clear_table_metadata(data_dict['resource_id'])
         else:
             delete_data(context, data_dict)
 
@@ -1034,6 +1291,14 @@ def delete(context, data_dict):
         context['connection'].close()
 
 
+def _table_exists(connection, resource_id):
+    return connection.execute(
+        u'(SELECT 1 FROM pg_tables WHERE tablename = %s) UNION '
+        u'(SELECT 1 FROM pg_views WHERE viewname = %s)',
+        resource_id, resource_id
+    ).fetchone() is not None
+
+
 def search(context, data_dict):
     engine = _get_engine(context, data_dict)
     context['connection'] = engine.connect()
@@ -1041,15 +1306,29 @@ def search(context, data_dict):
     _cache_types(context)
 
     try:
-        # check if table exists
+        trans = context['connection'].begin()
         context['connection'].execute(
             u'SET LOCAL statement_timeout TO {0}'.format(timeout))
         id = data_dict['resource_id']
-        result = context['connection'].execute(
-            u"(SELECT 1 FROM pg_tables where tablename = '{0}') union"
-             u"(SELECT 1 FROM pg_views where viewname = '{0}')".format(id)
-        ).fetchone()
-        if not result:
+        if _is_table_metadata_cached(id):
+            ## skip the existence check for tables we know about
+            try:
+                return search_data(context, data_dict)
+            except ProgrammingError:
+                exc_info = sys.exc_info()
+                ## the error aborted the transaction, so start a new one
+                ## (with the timeout) to check if the table is still there
+                trans.rollback()
+                trans = context['connection'].begin()
+                context['connection'].execute(
+                    u'SET LOCAL statement_timeout TO {0}'.format(timeout))
+                if _table_exists(context['connection'], id):
+                    ## an error in the query itself
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                ## the table was dropped by another process
+                clear_table_metadata(id)
+        # check if table exists
+        if not _table_exists(context['connection'], id):
             raise ValidationError({
                 'resource_id': [u'table for resource "{0}" does not exist'.format(
                     data_dict['resource_id'])]
@@ -30,6 +30,10 @@ def datastore_create(context, data_dict):
     :type primary_key: list or comma separated string
     :param indexes: indexes on table
     :type indexes: list or comma separated string
+    :param bulk: load the records with PostgreSQL's COPY instead of
+                 one INSERT per record, which is much faster for large
+                 uploads (default: false)
+    :type bulk: bool
 
     :returns: the newly created data object.
     :rtype: dictionary
@@ -88,6 +92,11 @@ def datastore_upsert(context, data_dict):
     :param method: the method to use to put the data into the datastore.
                    Possible options are: upsert (default), insert, update
     :type method: string
+    :param bulk: load the records with PostgreSQL's COPY into a staging
+                 table and merge them into the table with a few set based
+                 statements. All records have to contain the same fields
+                 when updating (default: false)
+    :type bulk: bool
 
     :returns: the newly created data object.
     :rtype: dictionary
@@ -37,6 +37,9 @@ class DatastorePlugin(p.SingletonPlugin):
         # datastore runs on PG prior to 9.0 (for example 8.4).
         self.legacy_mode = 'ckan.datastore.read_url' not in self.config
 
+        db.table_metadata_timeout = int(config.get(
+            'ckan.datastore.metadata_cache_timeout', 60))
+
         # Check whether we are running one of the paster commands which means
         # that we should ignore the following tests.
         import sys
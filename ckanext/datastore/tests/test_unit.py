@@ -29,3 +29,49 @@ class TestTypeGetters(unittest.TestCase):
         assert db._get_bool('0') == False
         assert db._get_bool('on') == True
         assert db._get_bool('off') == False
+
+
+class FakeConnection(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def execute(self, sql, *args):
+        self.queries += 1
+        return list(self.rows)
+
+
+class TestTableMetadataCache(unittest.TestCase):
+    def setUp(self):
+        db.clear_table_metadata()
+        self.timeout = db.table_metadata_timeout
+
+    def tearDown(self):
+        db.clear_table_metadata()
+        db.table_metadata_timeout = self.timeout
+
+    def test_unique_key_is_cached(self):
+        context = {'connection': FakeConnection([('name',), ('year',)])}
+        data_dict = {'resource_id': 'res'}
+        assert db._get_unique_key(context, data_dict) == ['name', 'year']
+        assert db._get_unique_key(context, data_dict) == ['name', 'year']
+        assert context['connection'].queries == 1
+
+    def test_clear(self):
+        context = {'connection': FakeConnection([('name',)])}
+        data_dict = {'resource_id': 'res'}
+        db._get_unique_key(context, data_dict)
+        db.clear_table_metadata('other')
+        db._get_unique_key(context, data_dict)
+        assert context['connection'].queries == 1
+        db.clear_table_metadata('res')
+        db._get_unique_key(context, data_dict)
+        assert context['connection'].queries == 2
+
+    def test_timeout(self):
+        db.table_metadata_timeout = -1
+        context = {'connection': FakeConnection([('name',)])}
+        data_dict = {'resource_id': 'res'}
+        db._get_unique_key(context, data_dict)
+        db._get_unique_key(context, data_dict)
+        assert context['connection'].queries == 2
@@ -519,3 +519,154 @@ class TestDatastoreUpdate(tests.WsgiAppCase):
         res_dict = json.loads(res.body)
 
         assert res_dict['success'] is False
+
+
+class TestDatastoreBulkUpsert(tests.WsgiAppCase):
+    sysadmin_user = None
+    normal_user = None
+    p.load('datastore')
+
+    @classmethod
+    def setup_class(cls):
+        p.load('datastore')
+        ctd.CreateTestData.create()
+        cls.sysadmin_user = model.User.get('testsysadmin')
+        cls.normal_user = model.User.get('annafan')
+        resource = model.Package.get('annakarenina').resources[0]
+        cls.data = {
+            'resource_id': resource.id,
+            'fields': [{'id': u'b\xfck', 'type': 'text'},
+                       {'id': 'author', 'type': 'text'},
+                       {'id': 'nested', 'type': 'json'},
+                       {'id': 'characters', 'type': 'text[]'},
+                       {'id': 'published'}],
+            'primary_key': u'b\xfck',
+            'bulk': True,
+            'records': [{u'b\xfck': 'annakarenina', 'author': 'tolstoy',
+                        'published': '2005-03-01', 'nested': ['b', {'moo': 'moo'}]},
+                        {u'b\xfck': 'warandpeace', 'author': 'tolstoy',
+                        'nested': {'a': 'b'}}
+                       ]
+            }
+        postparams = '%s=1' % json.dumps(cls.data)
+        auth = {'Authorization': str(cls.sysadmin_user.apikey)}
+        res = cls.app.post('/api/action/datastore_create', params=postparams,
+                           extra_environ=auth)
+        res_dict = json.loads(res.body)
+        assert res_dict['success'] is True
+
+        import pylons
+        engine = db._get_engine(
+                None,
+                {'connection_url': pylons.config['ckan.datastore.write_url']}
+            )
+        cls.Session = orm.scoped_session(orm.sessionmaker(bind=engine))
+
+    @classmethod
+    def teardown_class(cls):
+        rebuild_all_dbs(cls.Session)
+
+    def _upsert(self, data, status=200):
+        postparams = '%s=1' % json.dumps(data)
+        auth = {'Authorization': str(self.sysadmin_user.apikey)}
+        res = self.app.post('/api/action/datastore_upsert', params=postparams,
+                            extra_environ=auth, status=status)
+        return json.loads(res.body)
+
+    def _get(self, book):
+        c = self.Session.connection()
+        results = c.execute(u'select * from "{0}" where "b\xfck" = %s'.format(
+            self.data['resource_id']), book)
+        records = results.fetchall()
+        self.Session.remove()
+        return records
+
+    def test_bulk_create_fills_full_text(self):
+        c = self.Session.connection()
+        results = c.execute(u'''select 1 from "{0}"
+            where _full_text @@ to_tsquery('tolstoy')'''.format(
+                self.data['resource_id']))
+        assert results.rowcount >= 2, results.rowcount
+        self.Session.remove()
+
+    def test_bulk_insert(self):
+        res_dict = self._upsert({
+            'resource_id': self.data['resource_id'],
+            'method': 'insert',
+            'bulk': True,
+            'records': [{u'b\xfck': u'the \\ trial\tof\nk', 'author': 'kafka',
+                         'characters': ['Josef K.', 'quote " me', None],
+                         'nested': {'foo': ['bar', u'b\xe4z']}}]
+        })
+        assert res_dict['success'] is True
+
+        records = self._get(u'the \\ trial\tof\nk')
+        assert len(records) == 1
+        assert records[0].author == 'kafka'
+        assert records[0].characters == ['Josef K.', 'quote " me', None]
+        assert json.loads(records[0].nested.json) == {'foo': ['bar', u'b\xe4z']}
+        assert records[0]._full_text is not None
+
+    def test_bulk_insert_non_existing_field(self):
+        res_dict = self._upsert({
+            'resource_id': self.data['resource_id'],
+            'method': 'insert',
+            'bulk': True,
+            'records': [{u'b\xfck': 'the castle', 'dummy': 'kafka'}]
+        }, status=409)
+        assert res_dict['success'] is False
+
+    def test_bulk_update_missing_key(self):
+        res_dict = self._upsert({
+            'resource_id': self.data['resource_id'],
+            'method': 'update',
+            'bulk': True,
+            'records': [{u'b\xfck': 'annakarenina', 'author': 'tolstoy'},
+                        {u'b\xfck': 'no such book', 'author': 'nobody'}]
+        }, status=409)
+        assert res_dict['success'] is False
+
+        assert self._get('no such book') == []
+
+    def test_bulk_upsert(self):
+        hhguide = u"hitchhiker's guide to the galaxy"
+        res_dict = self._upsert({
+            'resource_id': self.data['resource_id'],
+            'method': 'upsert',
+            'bulk': True,
+            'records': [{u'b\xfck': 'warandpeace', 'author': 'leo',
+                         'published': '1869-01-01'},
+                        {u'b\xfck': hhguide, 'author': 'adams',
+                         'published': '1979-01-01'},
+                        {u'b\xfck': 'warandpeace', 'author': 'leo tolstoy',
+                         'published': '1869-01-01'}]
+        })
+        assert res_dict['success'] is True
+
+        records = self._get('warandpeace')
+        assert len(records) == 1
+        assert records[0].author == 'leo tolstoy'
+        assert records[0].published == datetime.datetime(1869, 1, 1)
+        # fields not part of the upsert are left alone
+        assert json.loads(records[0].nested.json) == {'a': 'b'}
+
+        records = self._get(hhguide)
+        assert len(records) == 1
+        assert records[0].author == 'adams'
+
+        c = self.Session.connection()
+        results = c.execute(u'''select 1 from "{0}"
+            where _full_text @@ to_tsquery('adams')'''.format(
+                self.data['resource_id']))
+        assert results.rowcount == 1
+        self.Session.remove()
+
+    def test_bulk_upsert_different_fields(self):
+        res_dict = self._upsert({
+            'resource_id': self.data['resource_id'],
+            'method': 'upsert',
+            'bulk': True,
+            'records': [{u'b\xfck': 'annakarenina', 'author': 'tolstoy'},
+                        {u'b\xfck': 'warandpeace'}]
+        }, status=409)
+        assert res_dict['success'] is False
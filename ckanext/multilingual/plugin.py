@@ -3,25 +3,16 @@ import ckan
 from ckan.plugins import SingletonPlugin, implements, IPackageController
 from ckan.plugins import IGroupController, ITagController
 import pylons
-import ckan.logic.action.get as action_get
+import ckan.lib.term_translation_cache as term_translation_cache
 from pylons import config
 
 LANGS = ['en', 'fr', 'de', 'es', 'it', 'nl', 'ro', 'pt', 'pl']
 
-def translate_data_dict(data_dict):
-    '''Return the given dict (e.g. a dataset dict) with as many of its fields
-    as possible translated into the desired or the fallback language.
+def _flattened_terms(flattened):
+    '''Return a set of all the terms to be translated in the given flattened
+    dict.
 
     '''
-    desired_lang_code = pylons.request.environ['CKAN_LANG']
-    fallback_lang_code = pylons.config.get('ckan.locale_default', 'en')
-
-    # Get a flattened copy of data_dict to do the translation on.
-    flattened = ckan.lib.navl.dictization_functions.flatten_dict(
-            data_dict)
-
-    # Get a simple flat list of all the terms to be translated, from the
-    # flattened data dict.
     terms = sets.Set()
     for (key, value) in flattened.items():
         if value in (None, True, False):
@@ -33,27 +24,36 @@ def translate_data_dict(data_dict):
         else:
             for item in value:
                 terms.add(item)
+    return terms
+
+def _lookup_translations(terms):
+    '''Return two dicts mapping the given terms to their translations into
+    the desired and the fallback language.
 
-    # Get the translations of all the terms (as a list of dictionaries).
-    translations = ckan.logic.action.get.term_translation_show(
-            {'model': ckan.model},
-            {'terms': terms,
-                'lang_codes': (desired_lang_code, fallback_lang_code)})
+    '''
+    desired_lang_code = pylons.request.environ['CKAN_LANG']
+    fallback_lang_code = pylons.config.get('ckan.locale_default', 'en')
+
+    # Get the translations of all the terms.
+    translations = term_translation_cache.get_translations(terms)
 
     # Transform the translations into a more convenient structure.
     desired_translations = {}
     fallback_translations = {}
-    for translation in translations:
-        if translation['lang_code'] == desired_lang_code:
-            desired_translations[translation['term']] = (
-                    translation['term_translation'])
-        else:
-            assert translation['lang_code'] == fallback_lang_code
-            fallback_translations[translation['term']] = (
-                    translation['term_translation'])
+    for term, term_translations in translations.iteritems():
+        if desired_lang_code in term_translations:
+            desired_translations[term] = term_translations[desired_lang_code]
+        if fallback_lang_code in term_translations:
+            fallback_translations[term] = (
+                    term_translations[fallback_lang_code])
+    return desired_translations, fallback_translations
+
+def _translate_flattened(flattened, desired_translations,
+        fallback_translations):
+    '''Return the unflattened copy of the given flattened dict with all the
+    terms replaced by their translations, where available.
 
-    # Make a copy of the flattened data dict with all the terms replaced by
-    # their translations, where available.
+    '''
     translated_flattened = {}
     for (key, value) in flattened.items():
 
@@ -89,10 +89,36 @@ def translate_data_dict(data_dict):
                     )
             translated_flattened[key] = translated_value
 
-    # Finally unflatten and return the translated data dict.
-    translated_data_dict = (ckan.lib.navl.dictization_functions
+    return (ckan.lib.navl.dictization_functions
             .unflatten(translated_flattened))
-    return translated_data_dict
+
+def translate_data_dicts(data_dicts):
+    '''Return a list of the given dicts (e.g. a page of dataset search
+    results) with as many of their fields as possible translated into the
+    desired or the fallback language.
+
+    The translations of the terms of all the dicts are looked up in one go.
+
+    '''
+    # Get flattened copies of the data dicts to do the translation on.
+    flattened_dicts = [ckan.lib.navl.dictization_functions.flatten_dict(
+        data_dict) for data_dict in data_dicts]
+
+    terms = sets.Set()
+    for flattened in flattened_dicts:
+        terms.update(_flattened_terms(flattened))
+    desired_translations, fallback_translations = _lookup_translations(terms)
+
+    return [_translate_flattened(flattened, desired_translations,
+                                 fallback_translations)
+            for flattened in flattened_dicts]
+
+def translate_data_dict(data_dict):
+    '''Return the given dict (e.g. a dataset dict) with as many of its fields
+    as possible translated into the desired or the fallback language.
+
+    '''
+    return translate_data_dicts([data_dict])[0]
 
 KEYS_TO_IGNORE = ['state', 'revision_id', 'id', #title done seperately
                   'metadata_created', 'metadata_modified', 'site_id']
@@ -110,14 +136,12 @@ class MultilingualDataset(SingletonPlugin):
         ## translate title
         title = search_data.get('title')
         search_data['title_' + default_lang] = title 
-        title_translations = action_get.term_translation_show(
-                          {'model': ckan.model},
-                          {'terms': [title],
-                              'lang_codes': LANGS})
+        title_translations = term_translation_cache.get_translations(
+                [title]).get(title, {})
 
-        for translation in title_translations:
-            title_field = 'title_' + translation['lang_code']
-            search_data[title_field] = translation['term_translation']
+        for lang_code, translation in title_translations.iteritems():
+            if lang_code in LANGS:
+                search_data['title_' + lang_code] = translation
 
         ## translate rest
         all_terms = []
@@ -131,18 +155,18 @@ class MultilingualDataset(SingletonPlugin):
             else:
                 all_terms.append(value)
 
-        field_translations = action_get.term_translation_show(
-                          {'model': ckan.model},
-                          {'terms': all_terms,
-                              'lang_codes': LANGS})
+        field_translations = term_translation_cache.get_translations(
+                all_terms)
 
         text_field_items = dict(('text_' + lang, []) for lang in LANGS)
         
         text_field_items['text_' + default_lang].extend(all_terms)
 
-        for translation in sorted(field_translations):
-            lang_field = 'text_' + translation['lang_code']
-            text_field_items[lang_field].append(translation['term_translation'])
+        for term in sorted(field_translations):
+            for lang_code, translation in sorted(
+                    field_translations[term].iteritems()):
+                if lang_code in LANGS:
+                    text_field_items['text_' + lang_code].append(translation)
 
         for key, value in text_field_items.iteritems():
             search_data[key] = ' '.join(value)
@@ -181,36 +205,25 @@ class MultilingualDataset(SingletonPlugin):
         desired_lang_code = pylons.request.environ['CKAN_LANG']
         fallback_lang_code = pylons.config.get('ckan.locale_default', 'en')
 
-        # Look up translations for all of the facets in one db query.
+        # Look up translations for all of the facets in one go.
         terms = sets.Set()
         for facet in facets.values():
             for item in facet['items']:
                 terms.add(item['display_name'])
-        translations = ckan.logic.action.get.term_translation_show(
-                {'model': ckan.model},
-                {'terms': terms,
-                    'lang_codes': (desired_lang_code, fallback_lang_code)})
+        translations = term_translation_cache.get_translations(terms)
 
         # Replace facet display names with translated ones.
         for facet in facets.values():
             for item in facet['items']:
-                matching_translations = [translation for
-                        translation in translations
-                        if translation['term'] == item['display_name']
-                        and translation['lang_code'] == desired_lang_code]
-                if not matching_translations:
-                    matching_translations = [translation for
-                            translation in translations
-                            if translation['term'] == item['display_name']
-                            and translation['lang_code'] == fallback_lang_code]
-                if matching_translations:
-                    assert len(matching_translations) == 1
-                    item['display_name'] = (
-                        matching_translations[0]['term_translation'])
+                term_translations = translations.get(item['display_name'], {})
+                translation = term_translations.get(desired_lang_code,
+                        term_translations.get(fallback_lang_code))
+                if translation is not None:
+                    item['display_name'] = translation
 
         return search_results
 
-    def before_view(self, dataset_dict):
+    def _translate_selected_facets(self):
 
         # Translate any selected search facets (e.g. if we are rendering a
         # group read page or the dataset index page): lookup translations of
@@ -221,27 +234,27 @@ class MultilingualDataset(SingletonPlugin):
         desired_lang_code = pylons.request.environ['CKAN_LANG']
         fallback_lang_code = pylons.config.get('ckan.locale_default', 'en')
         terms = [value for param, value in c.fields]
-        translations = ckan.logic.action.get.term_translation_show(
-                {'model': ckan.model},
-                {'terms': terms,
-                 'lang_codes': (desired_lang_code, fallback_lang_code)})
+        translations = term_translation_cache.get_translations(terms)
         c.translated_fields = {}
         for param, value in c.fields:
-            matching_translations = [translation for translation in
-                    translations if translation['term'] == value and
-                    translation['lang_code'] == desired_lang_code]
-            if not matching_translations:
-                matching_translations = [translation for translation in
-                        translations if translation['term'] == value and
-                        translation['lang_code'] == fallback_lang_code]
-            if matching_translations:
-                assert len(matching_translations) == 1
-                translation = matching_translations[0]['term_translation']
+            term_translations = translations.get(value, {})
+            translation = term_translations.get(desired_lang_code,
+                    term_translations.get(fallback_lang_code))
+            if translation is not None:
                 c.translated_fields[(param, value)] = translation
 
+    def before_view(self, dataset_dict):
+        self._translate_selected_facets()
+
         # Now translate the fields of the dataset itself.
         return translate_data_dict(dataset_dict)
 
+    def before_view_many(self, dataset_dicts):
+        self._translate_selected_facets()
+
+        # Translate all the datasets on the page with a single lookup.
+        return translate_data_dicts(dataset_dicts)
+
 class MultilingualGroup(SingletonPlugin):
     '''The MultilingualGroup plugin translates group names and other group
     fields on group read pages and on the group index page.
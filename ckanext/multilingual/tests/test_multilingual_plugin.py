@@ -197,6 +197,28 @@ class TestDatasetTermTranslation(ckan.tests.html_check.HtmlCheckMethods):
                 assert '/%s/dataset?groups=%s' % (lang_code, group_name) in response
             assert 'this should not be rendered' not in response
 
+    def test_dataset_index_single_lookup(self):
+        '''The datasets on a page of search results should be translated
+        with a single lookup of their terms.
+
+        '''
+        lookups = []
+        lookup_translations = mulilingual_plugin._lookup_translations
+        def counting_lookup(terms):
+            lookups.append(terms)
+            return lookup_translations(terms)
+        mulilingual_plugin._lookup_translations = counting_lookup
+        try:
+            response = self.app.get('/de/dataset', status=200)
+        finally:
+            mulilingual_plugin._lookup_translations = lookup_translations
+        assert len(lookups) == 1, lookups
+        # the terms of both datasets are in the one lookup
+        assert 'Index of the novel' in lookups[0], lookups[0]
+        assert "Dave's books" in lookups[0], lookups[0]
+        german = ckan.lib.create_test_data.german_translations
+        assert german['Index of the novel'] in response
+
     def test_group_index_translation(self):
         for (lang_code, translations) in (
                 ('de', ckan.lib.create_test_data.german_translations),
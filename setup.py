@@ -83,12 +83,14 @@ setup(
     celeryd = ckan.lib.cli:Celery
     rdf-export = ckan.lib.cli:RDFExport
     tracking = ckan.lib.cli:Tracking
+    activity-inbox = ckan.lib.cli:ActivityInbox
     plugin-info = ckan.lib.cli:PluginInfo
     profile = ckan.lib.cli:Profile
     color = ckan.lib.cli:CreateColorSchemeCommand
     check-po-files = ckan.i18n.check_po_files:CheckPoFiles
     trans = ckan.lib.cli:TranslationsCommand
     minify = ckan.lib.cli:MinifyCommand
+    templates = ckan.lib.cli:TemplatesCommand
     datastore = ckanext.datastore.commands:SetupDatastoreCommand
 
     [console_scripts]
@@ -109,6 +111,7 @@ setup(
 
     [ckan.plugins]
     synchronous_search = ckan.lib.search:SynchronousSearchPlugin
+    asynchronous_search = ckan.lib.search:AsynchronousSearchPlugin
     stats=ckanext.stats.plugin:StatsPlugin
     publisher_form=ckanext.publisher_form.forms:PublisherForm
     publisher_dataset_form=ckanext.publisher_form.forms:PublisherDatasetForm
@@ -122,6 +125,7 @@ setup(
 
     [ckan.system_plugins]
     domain_object_mods = ckan.model.modification:DomainObjectModificationExtension
+    group_cache = ckan.lib.group_cache:GroupCachePlugin
 
     [babel.extractors]
 	    ckan = ckan.lib.extract:extract_ckan